@@ -1,6 +1,7 @@
 from nose.tools import assert_true, assert_equal, assert_almost_equal
 import numpy as np
 import thunderfish.bestwindow as bw
+import thunderfish.peakdetection as pd
 
 
 def test_best_window():
@@ -30,6 +31,23 @@ def test_best_window():
     assert_equal(idx1, 7 * len(time), 'bestwindow() did not correctly detect end of best window')
     assert_almost_equal(clipped, 0.0, 'bestwindow() did not correctly detect clipped fraction')
 
+    # best window block by block:
+    detector = bw.BestWindowDetector(rate, single=False, win_size=1.0, win_shift=0.1,
+                                     min_clip=-clip, max_clip=clip, w_cv_ampl=10.0, tolerance=0.5)
+    for k in range(0, len(data), 123457):
+        detector.process(data[k:k + 123457])
+    assert_equal(detector.best_window(), (idx0, idx1, clipped),
+                 'BestWindowDetector differs from best_window_indices()')
+
+    # coarse-to-fine search:
+    cidx0, cidx1, cclipped = bw.best_window_indices(data, rate, single=False,
+                                                    win_size=1.0, win_shift=0.1,
+                                                    min_clip=-clip, max_clip=clip,
+                                                    w_cv_ampl=10.0, tolerance=0.5,
+                                                    coarse_shift=0.5, candidates=2)
+    assert_equal((cidx0, cidx1), (idx0, idx1),
+                 'coarse-to-fine best_window_indices() differs from exhaustive search')
+
     # clipping:
     clip_win_size = 0.5
     min_clip, max_clip = bw.clip_amplitudes(data, int(clip_win_size * rate),
@@ -40,3 +58,107 @@ def test_best_window():
                 'clip_amplitudes() failed to detect minimum clip amplitude')
     assert_true(max_clip >= 0.8 * clip and max_clip <= clip,
                 'clip_amplitudes() failed to detect maximum clip amplitude')
+
+    # histograms of all windows:
+    hists = []
+    bw.clip_amplitudes(data, int(clip_win_size * rate), min_ampl=-1.3, max_ampl=1.3,
+                       min_fac=2.0, nbins=40,
+                       plot_hist_func=lambda data, winx0, winx1, bins, h, *args: hists.append(
+                           np.array_equal(h, np.histogram(data[winx0:winx1], bins)[0])))
+    assert_true(len(hists) > 0 and np.all(hists), 'clip_amplitudes() computed wrong histograms')
+
+    # block-wise clipping:
+    detector = bw.ClipDetector(int(clip_win_size * rate), min_ampl=-1.3, max_ampl=1.3,
+                               min_fac=2.0, nbins=40)
+    for block_clips in detector.blocks(data, 12345):
+        pass
+    assert_equal(block_clips, (min_clip, max_clip),
+                 'ClipDetector differs from clip_amplitudes()')
+
+
+def test_coarse_best_window():
+    rate = 20000.0
+    time = np.arange(0.0, 80.0, 1.0 / rate)
+    tolerance = 0.5
+    for seed in range(3):
+        # amplitude modulated fish with a weaker second fish and noise bursts:
+        np.random.seed(seed)
+        f1, f2 = np.random.uniform(300.0, 900.0, 2)
+        data = np.sin(2.0 * np.pi * f1 * time) + 0.3 * np.sin(4.0 * np.pi * f1 * time + 1.0)
+        data *= 1.0 + 0.4 * np.sin(2.0 * np.pi * np.random.uniform(0.01, 0.1) * time + np.random.uniform(0.0, 6.0))
+        data += 0.3 * np.sin(2.0 * np.pi * f2 * time)
+        data += np.random.uniform(0.01, 0.2) * np.random.randn(len(data))
+        for k in range(4):
+            i = np.random.randint(0, len(data) - int(2.0 * rate))
+            n = int(np.random.uniform(0.2, 2.0) * rate)
+            data[i:i + n] += 0.5 * np.random.randn(n)
+        data = np.clip(data, -1.2, 1.2)
+        costs = []
+        def store(data, rate, peak_idx, trough_idx, idx0, idx1, win_start_times,
+                  cv_interv, mean_ampl, cv_ampl, clipped_frac, cost, thresh, win_idx0, win_idx1):
+            costs.append((cost, win_idx0))
+        for coarse_shift in [0.0, 1.0]:
+            bw.best_window_indices(data, rate, win_size=8.0, win_shift=0.1, min_clip=-1.2, max_clip=1.2,
+                                   tolerance=tolerance, coarse_shift=coarse_shift, plot_data_func=store)
+        cost, win_idx = costs[0]
+        coarse_cost, coarse_win_idx = costs[1]
+        # windows evaluated in the second stage of the coarse-to-fine search:
+        evaluated = coarse_cost < 1000.0
+        assert_true(np.min(cost[evaluated]) - np.min(cost) < 0.05,
+                    'coarse-to-fine best_window_indices() missed the minimum cost')
+        assert_true(cost[coarse_win_idx] - np.min(cost) < tolerance + 0.05,
+                    'coarse-to-fine best_window_indices() selected a window with too large cost')
+
+
+def test_best_window_statistics():
+    np.random.seed(7)
+    rate = 20000.0
+    time = np.arange(0.0, 8.0, 1.0 / rate)
+    data = np.sin(2.0 * np.pi * 500.0 * time) * (1.0 + 0.5 * np.sin(2.0 * np.pi * 0.3 * time))
+    data += 0.05 * np.random.randn(len(data))
+    data[len(data)//4:len(data)//3] *= 0.01
+    # equal amplitudes of clipped peaks and troughs:
+    data[len(data)//2:3*len(data)//4] *= 4.0
+    data = np.clip(data, -1.2, 1.2)
+    stats = {}
+    def store(data, rate, peak_idx, trough_idx, idx0, idx1, win_start_times,
+              cv_interv, mean_ampl, cv_ampl, clipped_frac, cost, thresh, win_idx0, win_idx1):
+        stats.update(peak_idx=peak_idx, trough_idx=trough_idx, win_start_times=win_start_times,
+                     cv_interv=cv_interv, mean_ampl=mean_ampl, cv_ampl=cv_ampl,
+                     clipped_frac=clipped_frac)
+    bw.best_window_indices(data, rate, min_clip=-1.2, max_clip=1.2, plot_data_func=store)
+    # statistics of each window computed directly:
+    n = int(1.0 * rate)
+    for i, wtinx in enumerate(np.round(stats['win_start_times'] * rate).astype(int)):
+        peak_idx = stats['peak_idx']
+        trough_idx = stats['trough_idx']
+        p_idx, t_idx = pd.trim_to_peak(peak_idx[(peak_idx >= wtinx) & (peak_idx <= wtinx + n)],
+                                       trough_idx[(trough_idx >= wtinx) & (trough_idx <= wtinx + n)])
+        ipis = np.diff(p_idx)
+        itis = np.diff(t_idx)
+        if len(ipis) > 2:
+            cv_interv = 0.5 * (np.std(ipis) / np.mean(ipis) + np.std(itis) / np.mean(itis))
+            mean_interv = np.mean(ipis)
+            cv_interv *= max(1.0, (p_idx[0] - wtinx) / mean_interv)
+            cv_interv *= max(1.0, (wtinx + n - p_idx[-1]) / mean_interv)
+            if cv_interv == 0.0:
+                assert_equal(stats['cv_interv'][i], cv_interv,
+                             'best_window_indices() wrong interval cv in window %d' % i)
+            assert_almost_equal(stats['cv_interv'][i], cv_interv, 10,
+                                'best_window_indices() wrong interval cv in window %d' % i)
+        p2t_ampl = data[p_idx] - data[t_idx]
+        if len(p2t_ampl) > 2:
+            clipped = (np.sum(data[p_idx] > 1.2) + np.sum(data[t_idx] < -1.2)) / 2.0 / len(p2t_ampl)
+            assert_equal(stats['clipped_frac'][i], clipped,
+                         'best_window_indices() wrong clipped fraction in window %d' % i)
+            assert_almost_equal(stats['mean_ampl'][i], np.mean(p2t_ampl) * (1.0 - clipped) ** 2, 8,
+                                'best_window_indices() wrong mean amplitude in window %d' % i)
+            cv_ampl = np.std(p2t_ampl) / np.mean(p2t_ampl)
+            if np.all(p2t_ampl == p2t_ampl[0]):
+                assert_almost_equal(stats['cv_ampl'][i], cv_ampl, 15,
+                                    'best_window_indices() wrong amplitude cv in window %d' % i)
+            if cv_ampl == 0.0:
+                assert_equal(stats['cv_ampl'][i], cv_ampl,
+                             'best_window_indices() wrong amplitude cv in window %d' % i)
+            assert_almost_equal(stats['cv_ampl'][i], cv_ampl, 8,
+                                'best_window_indices() wrong amplitude cv in window %d' % i)
@@ -120,6 +120,13 @@ def check_reading(filename, data):
     assert_true(success < 0, 'frame slice access backward failed at index %d' % (success))
 
     data.close()
+
+
+def check_dtype(filename):
+    data = dl.open_data(filename, 0, 1.0, 0.0, 0, np.float32)
+    assert_true(data[0:10].dtype == np.float32, 'first read with dtype float32 failed')
+    assert_true(data[len(data)-10:].dtype == np.float32, 'reallocated buffer with dtype float32 failed')
+    data.close()
     
 
 @with_setup(None, remove_relacs_files)
@@ -127,6 +134,7 @@ def test_dataloader_relacs():
     data, samplerate = generate_data()
     write_relacs(relacs_path, data, samplerate)
     check_reading(relacs_path, data)
+    check_dtype(relacs_path)
 
 
 @with_setup(None, remove_fishgrid_files)
@@ -134,3 +142,4 @@ def test_dataloader_fishgrid():
     data, samplerate = generate_data()
     write_fishgrid(fishgrid_path, data, samplerate)
     check_reading(fishgrid_path, data)
+    check_dtype(fishgrid_path)
@@ -0,0 +1,30 @@
+from nose.tools import assert_equal, assert_true
+import numpy as np
+import thunderfish.decimation as dc
+
+
+def test_decimate():
+    # generate data:
+    samplerate = 44100.0
+    time = np.arange(0.0, 2.0, 1.0/samplerate)
+    signal = np.sin(2.0*np.pi*500.0*time)
+    data = signal + 0.5*np.sin(2.0*np.pi*9000.0*time)
+
+    assert_equal(dc.decimation_factor(samplerate, 0.0), 1, 'decimation_factor() decimates without analysis rate')
+    assert_equal(dc.decimation_factor(samplerate, 8000.0), 5, 'decimation_factor() failed')
+
+    # in memory:
+    ddata, rate = dc.decimate(data, samplerate, 8000.0)
+    assert_equal(rate, samplerate/5, 'decimate() returns wrong sampling rate')
+    assert_equal(len(ddata), len(data[::5]), 'decimate() returns wrong number of samples')
+    assert_true(np.max(np.abs(ddata - signal[::5])[100:-100]) < 1e-3,
+                'decimate() does not remove aliased frequencies or shifts the signal')
+
+    # blockwise:
+    decimator = dc.Decimator(samplerate, 5)
+    bdata = np.concatenate(list(decimator.blocks(data, 7777)))
+    assert_true(np.allclose(bdata, ddata), 'blockwise decimation differs from decimate()')
+
+    # multiple channels:
+    mdata, rate = dc.decimate(np.column_stack((data, 2.0*data)), samplerate, 8000.0)
+    assert_true(np.allclose(mdata[:, 1], 2.0*ddata), 'decimate() fails on multiple channels')
@@ -3,6 +3,7 @@ import numpy as np
 import thunderfish.fakefish as ff
 import thunderfish.powerspectrum as ps
 import thunderfish.harmonicgroups as hg
+import thunderfish.peakdetection as pd
 
 
 def test_harmonic_groups():
@@ -33,3 +34,149 @@ def test_harmonic_groups():
     # check:
     assert_true(np.all(np.abs(eodfs-fundamentals) < df),
                 'harmonic_groups() did not correctly detect all fundamental frequencies')
+
+
+def test_harmonic_groups_float32():
+    # single precision (np.float32) analysis has to detect the same fish as double precision:
+    np.random.seed(1)
+    samplerate = 44100.0
+    df = 0.5
+    eodfs = np.array([123.0, 321.0, 666.0])
+    data = np.zeros(int(8.0*samplerate))
+    for eodf, ampl in zip(eodfs, [1.0, 1.0, 10.0]):
+        data += ff.generate_wavefish(eodf, samplerate, duration=8.0, noise_std=0.01,
+                                     amplitudes=[ampl, 0.5*ampl, 0.2*ampl, 0.1*ampl],
+                                     phases=[0.0, 0.0, 0.0, 0.0])
+
+    # analyse:
+    fundamentals = []
+    for dtype in [np.float64, np.float32]:
+        psd_data = ps.psd(data.astype(dtype), samplerate, fresolution=df, dtype=dtype)
+        assert_equal(psd_data.power.dtype, dtype, 'psd() does not return power of requested dtype')
+        groups = hg.harmonic_groups(psd_data.freqs, psd_data.power)[0]
+        fundamentals.append(hg.fundamental_freqs(groups))
+
+    # check:
+    assert_equal(len(fundamentals[1]), len(fundamentals[0]),
+                 'harmonic_groups() detects different number of fish in single precision')
+    assert_true(np.all(np.abs(fundamentals[1] - fundamentals[0]) < 1e-3),
+                'harmonic_groups() detects different fundamental frequencies in single precision')
+
+
+def test_harmonic_candidates():
+    # vectorized preselection has to agree with checking each frequency:
+    np.random.seed(1)
+    freqs = np.sort(np.random.rand(200)*2000.0)
+    freqs[0] = 0.0
+    for fzero in [55.3, 123.0, 400.7]:
+        freqtol = 0.7*0.5
+        expected = []
+        for j, f in enumerate(freqs):
+            n = np.round(f / fzero)
+            if n == 0 or np.abs(f / n - fzero) > freqtol:
+                continue
+            expected.append(j)
+        candidates = hg.harmonic_candidates(freqs, fzero, freqtol)
+        assert_equal(list(candidates), expected,
+                     'harmonic_candidates() failed for fzero=%g' % fzero)
+    assert_equal(len(hg.harmonic_candidates(freqs, 100.0, 0.1, True)), len(freqs),
+                 'harmonic_candidates() does not return all frequencies')
+
+
+def test_harmonic_groups_batch():
+    # generate data with slowly changing frequencies:
+    np.random.seed(2)
+    samplerate = 20000.0
+    duration = 4.0
+    data = np.zeros(int(duration*samplerate))
+    for eodf, ampl in zip([234.0, 550.0, 813.0], [1.0, 0.5, 0.2]):
+        data += ff.generate_wavefish(eodf, samplerate, duration=duration, noise_std=0.01,
+                                     amplitudes=[ampl, 0.5*ampl, 0.2*ampl, 0.1*ampl],
+                                     phases=[0.0, 0.0, 0.0, 0.0])
+    spec, freqs, times = ps.spectrogram(data, samplerate, fresolution=1.0, overlap_frac=0.5)
+    psds = spec.T
+
+    # batch processing has to give the same groups as single power spectra:
+    groups = hg.harmonic_groups_batch(freqs, psds, batch_size=3)
+    assert_equal(len(groups.group_offsets), len(psds) + 1,
+                 'harmonic_groups_batch() returns wrong number of group offsets')
+    for p in range(len(psds)):
+        group_list, fzero_harmonics = hg.harmonic_groups(freqs, psds[p])[:2]
+        batch_list = hg.batch_groups(groups, p)
+        assert_equal(len(batch_list), len(group_list),
+                     'harmonic_groups_batch() detects different number of groups')
+        for g0, g1 in zip(group_list, batch_list):
+            assert_true(np.array_equal(g0, g1),
+                        'harmonic_groups_batch() returns different harmonic groups')
+        g0, g1 = groups.group_offsets[p], groups.group_offsets[p + 1]
+        assert_equal(list(groups.fzero_harmonics[g0:g1]), list(fzero_harmonics),
+                     'harmonic_groups_batch() returns different fzero_harmonics')
+        assert_true(np.array_equal(groups.fundamentals[g0:g1], hg.fundamental_freqs(group_list)),
+                    'harmonic_groups_batch() returns different fundamentals')
+
+
+def test_harmonic_groups_warm_start():
+    np.random.seed(3)
+    samplerate = 20000.0
+    df = 0.5
+    eodfs = np.array([234.0, 550.0, 813.0])
+    data = np.zeros(int(8.0*samplerate))
+    for eodf, ampl in zip(eodfs, [1.0, 0.5, 0.2]):
+        data += ff.generate_wavefish(eodf, samplerate, duration=8.0, noise_std=0.01,
+                                     amplitudes=[ampl, 0.5*ampl, 0.2*ampl, 0.1*ampl],
+                                     phases=[0.0, 0.0, 0.0, 0.0])
+    psd_data = ps.psd(data, samplerate, fresolution=df)
+    fundamentals = hg.fundamental_freqs(hg.harmonic_groups(psd_data[1], psd_data[0])[0])
+    assert_equal(len(fundamentals), len(eodfs), 'harmonic_groups() did not detect all fish')
+
+    # confirmed, partial, and wrong priors have to result in the same fundamentals:
+    for prior_freqs in [eodfs + 0.1, eodfs[1:], np.array([100.0, 412.0])]:
+        groups = hg.harmonic_groups(psd_data[1], psd_data[0], prior_freqs=prior_freqs)[0]
+        assert_true(np.array_equal(hg.fundamental_freqs(groups), fundamentals),
+                    'harmonic_groups() with prior %s detects different fundamentals' % str(prior_freqs))
+
+
+def test_threshold_estimator():
+    # decibel power spectra of white noise:
+    np.random.seed(4)
+    samplerate = 20000.0
+    estimator = hg.ThresholdEstimator(6.0, 100, peak_factor=0.5, decay=0.8)
+    # a flat power spectrum does not spoil the histogram:
+    estimator.update(np.zeros(1000) - 100.0)
+    pooled_psds = []
+    for k in range(10):
+        psd_data = ps.psd(np.random.randn(int(samplerate)), samplerate, fresolution=1.0)
+        log_psd = ps.decibel(psd_data[0])
+        n = len(log_psd)
+        pooled_psds.append(log_psd[2 * n // 3:n * 9 // 10])
+        running_thresholds = estimator.update(log_psd[2 * n // 3:n * 9 // 10])
+    assert_true(len(estimator.hist) <= 200,
+                'ThresholdEstimator has too many bins')
+    # similar thresholds as for the pooled power spectra:
+    thresholds = hg.threshold_estimate(np.concatenate(pooled_psds), 6.0, 100, peak_factor=0.5)
+    assert_true(np.abs(running_thresholds[0] - thresholds[0]) < 0.2*thresholds[0],
+                'ThresholdEstimator low threshold differs from threshold_estimate()')
+    assert_true(np.abs(running_thresholds[2] - thresholds[2]) < 1.0,
+                'ThresholdEstimator center differs from threshold_estimate()')
+    # changed noise floor results in new thresholds:
+    for k in range(4):
+        new_thresholds = estimator.update(log_psd[2 * n // 3:n * 9 // 10] + 20.0)
+    assert_true(new_thresholds[2] > running_thresholds[2] + 5.0,
+                'ThresholdEstimator did not follow changed noise floor')
+
+
+def test_threshold_estimate_sketch():
+    # decibel power spectrum of white noise:
+    np.random.seed(5)
+    samplerate = 20000.0
+    psd_data = ps.psd(np.random.randn(int(samplerate)), samplerate, fresolution=1.0)
+    log_psd = ps.decibel(psd_data[0])[1:-1]
+    thresholds = hg.threshold_estimate(log_psd, 6.0, 100, peak_factor=0.5)
+    sketch = pd.QuantileSketch()
+    for k in range(0, len(log_psd), 1000):
+        sketch.merge(pd.QuantileSketch().add(log_psd[k:k + 1000]))
+    sketch_thresholds = hg.threshold_estimate(sketch, 6.0, 100, peak_factor=0.5)
+    assert_true(np.abs(sketch_thresholds[0] - thresholds[0]) < 0.1*thresholds[0],
+                'threshold_estimate() of QuantileSketch differs in low threshold')
+    assert_true(np.abs(sketch_thresholds[2] - thresholds[2]) < 0.5,
+                'threshold_estimate() of QuantileSketch differs in center')
@@ -150,6 +150,171 @@ def test_detect_dynamic_peaks():
                 "detect_dynamic_peaks(data, threshold, time, accept_peak_size_threshold) did not correctly detect troughs")
 
 
+def test_detect_dynamic_peaks_quantized():
+    def accept_event(time, data, event_inx, index, min_inx, threshold, **kwargs):
+        return event_inx, None
+
+    np.random.seed(5)
+    time = np.arange(0.0, 20.0, 0.01)
+    # quantized data hit the threshold exactly, once it settled at its fixpoint:
+    for data in [0.1*np.cumsum(np.random.randint(-3, 4, len(time))),
+                 np.cumsum(np.random.randint(-3, 4, len(time))).astype(np.int16),
+                 (0.1*np.round(10.0*np.cumsum(np.random.randn(len(time))))).astype(np.float32)]:
+        for threshold, min_thresh, tau in [(1.0, 0.3, 50.0), (2.0, 0.5, 5.0), (1.0, 0.7, 0.5)]:
+            # check functions force the loop through the data:
+            slow_peaks, slow_troughs = pd.detect_dynamic_peaks(data, threshold, min_thresh, tau, None,
+                                                               accept_event, accept_event)
+            peaks, troughs = pd.detect_dynamic_peaks(data, threshold, min_thresh, tau)
+            assert_true(np.array_equal(peaks, slow_peaks),
+                        "detect_dynamic_peaks(data) differs from loop for peaks")
+            assert_true(np.array_equal(troughs, slow_troughs),
+                        "detect_dynamic_peaks(data) differs from loop for troughs")
+            detector = pd.PeakDetector(threshold, min_thresh, tau)
+            detector_peaks, detector_troughs = detector.process(data)
+            assert_true(np.array_equal(peaks, detector_peaks),
+                        "detect_dynamic_peaks(data) differs from PeakDetector for peaks")
+            assert_true(np.array_equal(troughs, detector_troughs),
+                        "detect_dynamic_peaks(data) differs from PeakDetector for troughs")
+            slow_peaks, slow_troughs = pd.detect_dynamic_peaks(data, threshold, min_thresh, tau/100.0, time,
+                                                               accept_event, accept_event)
+            peaks, troughs = pd.detect_dynamic_peaks(data, threshold, min_thresh, tau/100.0, time)
+            assert_true(np.array_equal(peaks, time[np.asarray(slow_peaks, dtype=int)]),
+                        "detect_dynamic_peaks(data, time) differs from loop for peaks")
+            assert_true(np.array_equal(troughs, time[np.asarray(slow_troughs, dtype=int)]),
+                        "detect_dynamic_peaks(data, time) differs from loop for troughs")
+
+
+def test_detect_peaks_fast():
+    np.random.seed(3)
+    time = np.arange(0.0, 20.0, 0.01)
+    for data in [np.random.randn(len(time)),
+                 np.cumsum(np.random.randn(len(time))),
+                 np.sin(2.0*np.pi*0.2*time).astype(np.float32)]:
+        for threshold in [0.1, 1.0, 3.0, np.random.rand(len(time)) + 0.2]:
+            # check functions force the loop through the data:
+            slow_peaks, slow_troughs = pd.detect_peaks(data, threshold, None,
+                                                       pd.accept_peak, pd.accept_peak)
+            peaks, troughs = pd.detect_peaks(data, threshold)
+            assert_true(np.all(peaks == np.reshape(slow_peaks, (-1, 2))[:, 0]),
+                        "detect_peaks(data, threshold) differs from loop for peaks")
+            assert_true(np.all(troughs == np.reshape(slow_troughs, (-1, 2))[:, 0]),
+                        "detect_peaks(data, threshold) differs from loop for troughs")
+            peaks, troughs = pd.detect_peaks(data, threshold, time)
+            assert_true(np.all(peaks == time[np.reshape(slow_peaks, (-1, 2))[:, 0].astype(int)]),
+                        "detect_peaks(data, threshold, time) differs from loop for peaks")
+
+
+def test_peak_detector():
+    np.random.seed(4)
+    for data in [np.random.randn(5000),
+                 np.cumsum(np.random.randn(5000)),
+                 np.sin(0.02*np.arange(5000)) + 0.05*np.random.randn(5000)]:
+        for block_size in [1, 37, 1000, 10000]:
+            peaks, troughs = pd.detect_peaks(data, 1.0)
+            detector = pd.PeakDetector(1.0)
+            blocks = list(detector.blocks(data, block_size))
+            assert_true(np.all(np.concatenate([b[0] for b in blocks]) == peaks),
+                        "PeakDetector did not detect the same peaks as detect_peaks()")
+            assert_true(np.all(np.concatenate([b[1] for b in blocks]) == troughs),
+                        "PeakDetector did not detect the same troughs as detect_peaks()")
+
+            peaks, troughs = pd.detect_dynamic_peaks(data, 1.0, 0.3, 50.0, None,
+                                                     pd.accept_peak_size_threshold,
+                                                     pd.accept_peak_size_threshold)
+            detector = pd.PeakDetector(1.0, 0.3, 50.0, thresh_ampl_fac=0.75)
+            blocks = list(detector.blocks(data, block_size))
+            assert_true(np.all(np.concatenate([b[0] for b in blocks]) == peaks),
+                        "PeakDetector did not detect the same peaks as detect_dynamic_peaks()")
+            assert_true(np.all(np.concatenate([b[1] for b in blocks]) == troughs),
+                        "PeakDetector did not detect the same troughs as detect_dynamic_peaks()")
+
+    assert_raises(ValueError, pd.PeakDetector, 0.0)
+    assert_raises(ValueError, pd.PeakDetector, 1.0, -1.0, 10.0)
+    assert_raises(ValueError, pd.PeakDetector, 1.0, 0.5, 0.0)
+
+
+def test_detect_peaks_size_width():
+    np.random.seed(2)
+    time = np.arange(0.0, 20.0, 0.01)
+    # noisy and smooth data with and without peaks far apart:
+    for data in [np.random.randn(len(time)),
+                 np.cumsum(np.random.randn(len(time))),
+                 np.sin(2.0*np.pi*0.2*time) + 0.05*np.random.randn(len(time))]:
+        for threshold in [0.1, 1.0, 3.0]:
+            peaks, _ = pd.detect_peaks(data, threshold, time, pd.accept_peaks_size_width)
+            fast_peaks = pd.detect_peaks_size_width(data, threshold, time)
+            assert_equal(fast_peaks.shape, (len(peaks), 5),
+                         "detect_peaks_size_width() did not detect the same number of peaks")
+            assert_true(np.all(fast_peaks == np.reshape(peaks, (-1, 5))),
+                        "detect_peaks_size_width() differs from detect_peaks(..., accept_peaks_size_width)")
+
+    # stack of spectra:
+    data = np.cumsum(np.random.randn(5, len(time)), axis=1)
+    thresholds = np.arange(1.0, 6.0)
+    peaks, offsets = pd.detect_peaks_size_width(data, thresholds, time, pfac=0.5)
+    assert_equal(len(offsets), len(data) + 1, "detect_peaks_size_width() wrong number of offsets")
+    for k in range(len(data)):
+        row_peaks, _ = pd.detect_peaks(data[k], thresholds[k], time,
+                                       pd.accept_peaks_size_width, pfac=0.5)
+        assert_true(np.all(peaks[offsets[k]:offsets[k+1]] == np.reshape(row_peaks, (-1, 5))),
+                    "detect_peaks_size_width() differs for row %d" % k)
+
+    assert_raises(ValueError, pd.detect_peaks_size_width, data, -thresholds, time)
+    assert_raises(IndexError, pd.detect_peaks_size_width, data, thresholds[:2], time)
+    assert_raises(IndexError, pd.detect_peaks_size_width, data, thresholds, time[:10])
+
+
+def test_detect_channel_peaks():
+    np.random.seed(3)
+    samplerate = 1000.0
+    data = np.random.randn(3000, 4) * np.arange(1.0, 5.0)
+    time = np.arange(len(data)) / samplerate
+    thresholds = np.arange(1.0, 5.0)
+    for threshold in [1.5, thresholds, np.abs(np.random.randn(*data.shape)) + 0.5]:
+        peaks, troughs, peak_offsets, trough_offsets = pd.detect_peaks(data, threshold, time)
+        assert_equal(len(peak_offsets), data.shape[1] + 1, "detect_peaks() wrong number of offsets")
+        for c in range(data.shape[1]):
+            th = threshold if np.ndim(threshold) == 0 else \
+                threshold[c] if np.ndim(threshold) == 1 else threshold[:, c]
+            cpeaks, ctroughs = pd.detect_peaks(data[:, c], th, time)
+            assert_true(np.all(peaks[peak_offsets[c]:peak_offsets[c+1]] == cpeaks) and
+                        np.all(troughs[trough_offsets[c]:trough_offsets[c+1]] == ctroughs),
+                        "detect_peaks() differs for channel %d" % c)
+    # channels along the second axis with check function:
+    peaks, _, offsets, _ = pd.detect_peaks(data.T, thresholds, time,
+                                           pd.accept_peaks_size_width, axis=1)
+    for c in range(data.shape[1]):
+        cpeaks, _ = pd.detect_peaks(data[:, c], thresholds[c], time, pd.accept_peaks_size_width)
+        assert_true(np.all(peaks[offsets[c]:offsets[c+1]] == cpeaks),
+                    "detect_peaks() with check function differs for channel %d" % c)
+    assert_raises(ValueError, pd.detect_peaks, data, -thresholds)
+    assert_raises(IndexError, pd.detect_peaks, data, thresholds[:2])
+    assert_raises(IndexError, pd.detect_peaks, data, 1.0, time[:10])
+
+    # thresholds for each channel:
+    for func in [pd.std_threshold, pd.minmax_threshold, pd.percentile_threshold]:
+        threshold = func(data)
+        assert_equal(threshold.shape, (data.shape[1],), "%s() wrong shape" % func.__name__)
+        for c in range(data.shape[1]):
+            assert_almost_equal(threshold[c], func(data[:, c]), 10,
+                                "%s() differs for channel %d" % (func.__name__, c))
+        threshold = func(data.T, samplerate, 0.7, axis=1)
+        assert_equal(threshold.shape, data.T.shape, "%s() wrong shape" % func.__name__)
+        for c in range(data.shape[1]):
+            assert_true(np.allclose(threshold[c], func(data[:, c], samplerate, 0.7)),
+                        "%s() differs for channel %d" % (func.__name__, c))
+        assert_raises(ValueError, func, data, samplerate, 0.7, compact=True)
+    threshold, center = pd.hist_threshold(data, samplerate, 0.7)
+    assert_equal(threshold.shape, data.shape, "hist_threshold() wrong shape")
+    for c in range(data.shape[1]):
+        th, cc = pd.hist_threshold(data[:, c])
+        assert_true(np.allclose(pd.hist_threshold(data)[0][c], th),
+                    "hist_threshold() differs for channel %d" % c)
+        th, cc = pd.hist_threshold(data[:, c], samplerate, 0.7)
+        assert_true(np.allclose(threshold[:, c], th) and np.allclose(center[:, c], cc),
+                    "hist_threshold() differs for channel %d" % c)
+
+
 def test_thresholds():
     # generate data:
     data = np.random.randn(10000)
@@ -165,6 +330,110 @@ def test_thresholds():
     assert_true(np.abs(prc_th-2.0) < 0.1, 'percentile_threshold %g esimate failed' % prc_th)
 
 
+def test_windowed_thresholds():
+    np.random.seed(5)
+    samplerate = 1000.0
+    data = np.random.randn(25300) * np.repeat(np.arange(1.0, 12.0), 2300)
+    win_size = 0.5
+    n = int(win_size * samplerate)
+    for func in [pd.std_threshold, pd.minmax_threshold, pd.percentile_threshold]:
+        threshold = func(data, samplerate, win_size)
+        compact = func(data, samplerate, win_size, compact=True)
+        assert_equal(len(threshold), len(data), "%s() returned wrong number of thresholds" % func.__name__)
+        assert_equal(len(compact.values), (len(data) + n - 1) // n,
+                     "%s() returned wrong number of windows" % func.__name__)
+        assert_true(np.all(np.asarray(compact) == threshold),
+                    "%s() compact threshold differs" % func.__name__)
+        assert_true(np.all(compact[1234:5678] == threshold[1234:5678]) and
+                    compact[-1] == threshold[-1],
+                    "%s() compact threshold indexing failed" % func.__name__)
+        for k in range(0, len(data), n):
+            window = data[k:k + n]
+            assert_almost_equal(threshold[k], func(window), 10,
+                                "%s() differs in window at %d" % (func.__name__, k))
+        peaks, troughs = pd.detect_peaks(data, threshold)
+        cpeaks, ctroughs = pd.detect_peaks(data, compact)
+        assert_true(np.all(peaks == cpeaks) and np.all(troughs == ctroughs),
+                    "detect_peaks() with compact %s() threshold failed" % func.__name__)
+    threshold, center = pd.hist_threshold(data, samplerate, win_size)
+    cthreshold, ccenter = pd.hist_threshold(data, samplerate, win_size, compact=True)
+    assert_true(np.all(np.asarray(cthreshold) == threshold) and np.all(np.asarray(ccenter) == center),
+                "hist_threshold() compact threshold differs")
+    for k in range(0, len(data), n):
+        th, c = pd.hist_threshold(data[k:k + n])
+        assert_almost_equal(threshold[k], th, 10, "hist_threshold() differs in window at %d" % k)
+        assert_almost_equal(center[k], c, 10, "hist_threshold() differs in window at %d" % k)
+
+
+def test_quantile_sketch():
+    np.random.seed(6)
+    data = np.random.randn(100000) * 3.0 + 10.0
+    percentiles = np.array([0.0, 0.1, 1.0, 16.0, 50.0, 84.0, 99.0, 99.9, 100.0])
+    sorted_data = np.sort(data)
+    lower = sorted_data[np.floor(percentiles / 100.0 * (len(data) - 1)).astype(int)]
+    upper = sorted_data[np.ceil(percentiles / 100.0 * (len(data) - 1)).astype(int)]
+    sketch = pd.QuantileSketch(256).add(data)
+    assert_true(len(sketch.counts) <= 256, 'QuantileSketch uses too many bins')
+    values = sketch.percentile(percentiles)
+    assert_true(np.all((values >= lower - sketch.bin_width) & (values <= upper + sketch.bin_width)),
+                'QuantileSketch percentiles exceed error bound')
+    # chunked and merged sketches:
+    chunked = pd.QuantileSketch(256)
+    merged = pd.QuantileSketch(256)
+    for k in range(0, len(data), 7000):
+        chunked.add(data[k:k + 7000])
+        merged.merge(pd.QuantileSketch(64).add(data[k:k + 7000]))
+    assert_equal(chunked.count, len(data), 'QuantileSketch.add() lost data')
+    assert_equal(merged.count, len(data), 'QuantileSketch.merge() lost data')
+    assert_true(np.all(chunked.percentile(percentiles) == values),
+                'QuantileSketch of chunks differs')
+    values = merged.percentile(percentiles)
+    assert_true(np.all((values >= lower - merged.bin_width) & (values <= upper + merged.bin_width)),
+                'merged QuantileSketch percentiles exceed error bound')
+    # thresholds:
+    th = pd.percentile_threshold(data, th_factor=1.0, percentile=16.0)
+    sketch_th = pd.percentile_threshold(data, th_factor=1.0, percentile=16.0, sketch_bins=1024)
+    assert_true(np.abs(sketch_th - th) < 0.05, 'percentile_threshold() with sketch failed')
+    sketch_th = pd.percentile_threshold(merged, th_factor=1.0, percentile=16.0)
+    assert_true(np.abs(sketch_th - th) < 0.05, 'percentile_threshold() of QuantileSketch failed')
+    th = pd.percentile_threshold(data, 1000.0, 2.0, th_factor=1.0, percentile=16.0)
+    sketch_th = pd.percentile_threshold(data, 1000.0, 2.0, th_factor=1.0, percentile=16.0,
+                                        sketch_bins=1024)
+    assert_true(np.all(np.abs(sketch_th - th) < 0.1), 'windowed percentile_threshold() with sketch failed')
+    # windows with less and more data than bins are the same as a QuantileSketch of each window:
+    for win_size, sketch_bins in [(0.05, 1024), (2.0, 64)]:
+        n = int(win_size * 1000.0)
+        sketch_th = pd.percentile_threshold(data, 1000.0, win_size, th_factor=1.0, percentile=16.0,
+                                            compact=True, sketch_bins=sketch_bins)
+        th = [np.abs(np.diff(pd.QuantileSketch(sketch_bins).add(data[k:k + n]).percentile([84.0, 16.0])))[0]
+              for k in range(0, len(data), n)]
+        assert_true(np.array_equal(sketch_th.values, th),
+                    'windowed percentile_threshold() differs from QuantileSketch of the windows')
+    th, center = pd.hist_threshold(data, th_factor=1.0)
+    sketch_th, sketch_center = pd.hist_threshold(chunked, th_factor=1.0)
+    assert_true(np.abs(sketch_th - th) < 0.2 and np.abs(sketch_center - center) < 0.2,
+                'hist_threshold() of QuantileSketch failed')
+
+
+def test_snippets():
+    np.random.seed(7)
+    data = np.random.randn(10000)
+    indices = np.sort(np.random.randint(-50, len(data) + 50, 500))
+    snips = pd.snippets(data, indices, -20, 30)
+    valid = indices[(indices >= 20) & (indices < len(data) - 30)]
+    assert_equal(snips.shape, (len(valid), 50), 'snippets() returned wrong shape')
+    for k, idx in enumerate(valid):
+        assert_true(np.all(snips[k] == data[idx - 20:idx + 30]), 'snippets() returned wrong data')
+    assert_equal(pd.snippets(data, indices, -20, 30, np.float32).dtype, np.float32,
+                 'snippets() did not return float32 snippets')
+    windows, rows = pd.snippet_windows(data, indices, -20, 30)
+    assert_true(np.all(windows[rows] == snips), 'snippet_windows() returned wrong snippets')
+    assert_true(np.shares_memory(windows, data), 'snippet_windows() copied the data')
+    mean, std = pd.snippets_mean_std(data, indices, -20, 30, chunk_size=77)
+    assert_true(np.allclose(mean, np.mean(snips, axis=0)), 'snippets_mean_std() returned wrong mean')
+    assert_true(np.allclose(std, np.std(snips, axis=0, ddof=1)), 'snippets_mean_std() returned wrong std')
+
+
 def test_trim():
     # generate peak and trough indices (same length, peaks first):
     pt_indices = np.unique(np.random.randint(5, 1000, size=40))
@@ -1,6 +1,8 @@
-from nose.tools import assert_equal
+from nose.tools import assert_equal, assert_true
 import numpy as np
+import matplotlib.mlab as mlab
 import thunderfish.powerspectrum as ps
+import thunderfish.fakefish as ff
 
 # run this with "nosetests tests/test_powerspectrum.py" in the first thunderfish folder.
 def test_powerspectrum():
@@ -24,3 +26,157 @@ def test_powerspectrum():
     # test the result
     assert_equal(round(psd_data[1][np.argmax(psd_data[0])]), fundamental, 'peak in PSD is not the fundamental '
                                                                              'frequency given.')
+
+
+def test_spectrogram_engine():
+    # generate data:
+    samplerate = 20000.0
+    data = np.random.randn(30000)
+
+    # compare with matplotlib.mlab:
+    for nfft, noverlap in [(1024, 512), (256, 230), (65536, 0)]:
+        for detrend in [mlab.detrend_none, mlab.detrend_mean]:
+            engine = ps.spectrogram_engine(samplerate, nfft, noverlap, detrend=detrend)
+            spectrum, freqs, time = engine.spectrogram(data)
+            mspectrum, mfreqs, mtime = mlab.specgram(data, NFFT=nfft, Fs=samplerate,
+                                                     noverlap=noverlap, detrend=detrend)
+            assert_equal(spectrum.shape, mspectrum.shape, 'spectrogram has wrong shape')
+            assert_true(np.allclose(spectrum, mspectrum), 'spectrogram differs from mlab.specgram()')
+            assert_true(np.allclose(freqs, mfreqs), 'frequencies differ from mlab.specgram()')
+            assert_true(np.allclose(time, mtime), 'times differ from mlab.specgram()')
+            power, freqs = engine.psd(data)
+            mpower, mfreqs = mlab.psd(data, NFFT=nfft, Fs=samplerate,
+                                      noverlap=noverlap, detrend=detrend)
+            assert_true(np.allclose(power, mpower), 'psd differs from mlab.psd()')
+
+    # engines are cached:
+    assert_true(ps.spectrogram_engine(samplerate, 1024, 512) is ps.spectrogram_engine(samplerate, 1024, 512),
+                'spectrogram_engine() does not return cached engine')
+
+
+def test_running_psds():
+    # generate data:
+    samplerate = 20000.0
+    data = np.random.randn(40000)
+    spectrum, freqs, time = ps.spectrogram(data, samplerate, fresolution=10.0, overlap_frac=0.5)
+
+    # running averages:
+    nffts = 4
+    power = ps.running_psds(spectrum, nffts)
+    assert_equal(power.shape, (len(time) - nffts + 1, len(freqs)), 'running_psds() returned wrong shape')
+    for t in range(len(power)):
+        assert_true(np.all(power[t] == np.mean(spectrum[:, t:t+nffts], axis=1)),
+                    'running_psds() differs from mean of spectrogram')
+
+    # accumulation:
+    power2 = ps.running_psds(spectrum, nffts, out=power.copy())
+    assert_true(np.allclose(power2, 2.0*power), 'running_psds() does not accumulate into out')
+
+
+def test_streaming_spectrogram():
+    # generate data:
+    samplerate = 20000.0
+    data = np.random.randn(100000)
+    spectrum, freqs, time = ps.spectrogram(data, samplerate, fresolution=2.0, overlap_frac=0.9)
+
+    # blockwise spectrogram:
+    stream = ps.StreamingSpectrogram(samplerate, fresolution=2.0, overlap_frac=0.9)
+    blocks = list(stream.blocks(data, 7777))
+    bspectrum = np.hstack([b[0] for b in blocks])
+    btime = np.concatenate([b[1] for b in blocks])
+    assert_equal(bspectrum.shape, spectrum.shape, 'StreamingSpectrogram has wrong shape')
+    assert_true(np.allclose(bspectrum, spectrum), 'StreamingSpectrogram differs from spectrogram()')
+    assert_true(np.allclose(btime, time), 'StreamingSpectrogram times differ from spectrogram()')
+    assert_true(np.all(stream.freqs == freqs), 'StreamingSpectrogram frequencies differ from spectrogram()')
+
+    # start offset:
+    blocks = list(stream.blocks(data, 5000, start=1000))
+    btime = np.concatenate([b[1] for b in blocks])
+    spectrum, freqs, time = ps.spectrogram(data[1000:], samplerate, fresolution=2.0, overlap_frac=0.9)
+    assert_true(np.allclose(btime, time + 1000/samplerate), 'StreamingSpectrogram times are not absolute')
+
+
+def test_max_freq():
+    # generate data:
+    samplerate = 20000.0
+    data = np.random.randn(50000)
+    max_freq = 3000.0
+    spectrum, freqs, time = ps.spectrogram(data, samplerate, fresolution=2.0)
+    bspectrum, bfreqs, btime = ps.spectrogram(data, samplerate, fresolution=2.0, max_freq=max_freq)
+    assert_true(bfreqs[-1] <= max_freq, 'spectrogram() returns frequencies above max_freq')
+    assert_equal(len(bfreqs), np.sum(freqs <= max_freq), 'spectrogram() drops frequencies below max_freq')
+    assert_true(np.allclose(bspectrum, spectrum[:len(bfreqs)]), 'band-limited spectrogram() differs')
+    assert_true(np.all(btime == time), 'band-limited spectrogram() has different times')
+
+    power, freqs = ps.psd(data, samplerate, fresolution=2.0)
+    bpower, bfreqs = ps.psd(data, samplerate, fresolution=2.0, max_freq=max_freq)
+    assert_true(np.allclose(bpower, power[:len(bfreqs)]), 'band-limited psd() differs')
+
+    # mlab path:
+    bpower, bfreqs = ps.psd(data, samplerate, fresolution=2.0, sides='twosided', max_freq=max_freq)
+    assert_true(np.all(bfreqs <= max_freq), 'psd() returns frequencies above max_freq')
+
+    stream = ps.StreamingSpectrogram(samplerate, fresolution=2.0, max_freq=max_freq)
+    sspectrum = np.hstack([b[0] for b in stream.blocks(data, 7777)])
+    assert_true(np.allclose(sspectrum, spectrum[:len(stream.freqs)]), 'band-limited StreamingSpectrogram differs')
+
+
+def test_multi_resolution_psd():
+    # generate data:
+    samplerate = 20000.0
+    data = np.random.randn(100000)
+    fresolution = [0.5, 1.0, 2.0]
+    psd_data = ps.multi_resolution_psd(data, samplerate, fresolution)
+    seq_data = ps.multi_resolution_psd(data, samplerate, fresolution, threads=1)
+    assert_equal(len(psd_data), len(fresolution), 'multi_resolution_psd() returns wrong number of psds')
+    for fres, psd, seq in zip(fresolution, psd_data, seq_data):
+        power, freqs = ps.psd(data, samplerate, fres)
+        assert_true(np.all(psd.power == power), 'multi_resolution_psd() power differs from psd()')
+        assert_true(np.all(psd.freqs == freqs), 'multi_resolution_psd() frequencies differ from psd()')
+        assert_true(np.all(psd[0] == seq[0]), 'threaded multi_resolution_psd() differs from sequential one')
+
+
+def test_multichannel_spectrogram():
+    # generate data:
+    samplerate = 20000.0
+    data = np.random.randn(60000, 5)
+    spectrum, freqs, time, channel_spectrum = \
+        ps.multichannel_spectrogram(data, samplerate, fresolution=2.0, threads=2, channel_power=True)
+    for c in range(data.shape[1]):
+        cspectrum, cfreqs, ctime = ps.spectrogram(data[:, c], samplerate, fresolution=2.0)
+        assert_true(np.allclose(channel_spectrum[c], cspectrum),
+                    'multichannel_spectrogram() channel spectrum differs from spectrogram()')
+    assert_true(np.allclose(spectrum, np.sum(channel_spectrum, axis=0)),
+                'multichannel_spectrogram() does not sum up channel spectra')
+    assert_true(np.all(time == ctime), 'multichannel_spectrogram() times differ from spectrogram()')
+
+    # blockwise:
+    stream = ps.StreamingSpectrogram(samplerate, fresolution=2.0, threads=3)
+    bspectrum = np.hstack([b[0] for b in stream.blocks(data, 7777)])
+    assert_true(np.allclose(bspectrum, spectrum), 'multichannel StreamingSpectrogram differs')
+
+
+def test_float32():
+    # precision of single precision spectra of fakefish signals relative to double precision:
+    samplerate = 20000.0
+    data = ff.generate_wavefish(420.0, samplerate, duration=5.0, noise_std=0.01,
+                                amplitudes=[1.0, 0.5, 0.2, 0.1], phases=[0.0]*4)
+    spectrum, freqs, time = ps.spectrogram(data, samplerate, fresolution=1.0)
+    spectrum32, freqs32, time32 = ps.spectrogram(data.astype(np.float32), samplerate,
+                                                 fresolution=1.0, dtype=np.float32)
+    assert_equal(spectrum32.dtype, np.float32, 'spectrogram() does not return single precision spectrum')
+    assert_true(np.all(freqs32 == freqs), 'single precision spectrogram() has different frequencies')
+    # relative errors of powers within 60dB of the maximum power are below 1e-3:
+    sel = spectrum > 1e-6*np.max(spectrum)
+    assert_true(np.max(np.abs(spectrum32[sel]/spectrum[sel] - 1.0)) < 1e-3,
+                'single precision spectrogram() deviates too much from double precision')
+
+    # decibel keeps precision and equals the direct computation:
+    db = ps.decibel(spectrum)
+    assert_true(np.all(db[sel] == 10.0*np.log10(spectrum[sel])), 'decibel() failed')
+    db32 = ps.decibel(spectrum32)
+    assert_equal(db32.dtype, np.float32, 'decibel() does not keep single precision')
+    assert_true(np.max(np.abs(db32[sel] - db[sel])) < 0.01,
+                'single precision decibel() deviates too much from double precision')
+    assert_true(np.all(np.isnan(ps.decibel(np.array([0.0, 1e-30, 1.0]))[:2])),
+                'decibel() does not set small powers to NaN')
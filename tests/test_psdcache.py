@@ -0,0 +1,54 @@
+from nose.tools import assert_equal, assert_true
+import os
+import shutil
+import tempfile
+import numpy as np
+import thunderfish.psdcache as pc
+
+
+def test_psdcache():
+    cache_dir = tempfile.mkdtemp()
+    try:
+        # data file identity:
+        data_file = os.path.join(cache_dir, 'data.raw')
+        np.zeros(100).tofile(data_file)
+        data_id = pc.data_file_id(data_file)
+        assert_equal(data_id, pc.data_file_id(data_file), 'data_file_id() is not reproducible')
+
+        cache = pc.PSDCache(os.path.join(cache_dir, 'psdcache'), max_size=100000)
+        key = cache.key(data_id, 1024, 512, 4)
+        assert_true(key != cache.key(data_id, 1024, 512, 3), 'cache keys do not depend on parameter')
+        assert_true(cache.load(key) is None, 'PSDCache returns missing entry')
+
+        # write entry in blocks:
+        freqs = np.arange(0.0, 100.0)
+        power = np.random.rand(30, len(freqs))
+        times = np.arange(len(power))*0.1
+        for k in range(0, len(power), 7):
+            cache.append(key, power[k:k+7], times[k:k+7])
+        assert_true(cache.load(key) is None, 'PSDCache returns incomplete entry')
+        cache.finish(key, freqs)
+
+        # read entry:
+        cpower, cfreqs, ctimes = cache.load(key)
+        assert_true(np.all(cpower == power), 'PSDCache power spectra differ')
+        assert_true(np.all(cfreqs == freqs), 'PSDCache frequencies differ')
+        assert_true(np.all(ctimes == times), 'PSDCache times differ')
+
+        # incomplete entry of an interrupted run:
+        key3 = cache.key(data_id, 512, 256, 4)
+        cache.append(key3, power, times)
+        cache = pc.PSDCache(cache.cache_dir, max_size=cache.max_size)
+        stale_file = os.path.join(cache.cache_dir, key3 + '.psds.tmp')
+        os.utime(stale_file, (0, 0))
+
+        # eviction:
+        key2 = cache.key(data_id, 2048, 1024, 4)
+        power2 = np.random.rand(100, len(freqs))
+        cache.append(key2, power2, np.arange(len(power2)))
+        cache.finish(key2, freqs)
+        assert_true(cache.load(key) is None, 'PSDCache does not evict old entries')
+        assert_true(cache.load(key2) is not None, 'PSDCache evicts new entry')
+        assert_true(not os.path.exists(stale_file), 'PSDCache keeps incomplete entry')
+    finally:
+        shutil.rmtree(cache_dir)
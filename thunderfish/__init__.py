@@ -2,9 +2,11 @@ from .version import __version__
 
 __all__ = ['dataloader',
            'configfile',
+           'decimation',
            'peakdetection',
            'bestwindow',
            'powerspectrum',
+           'psdcache',
            'harmonicgroups',
            'checkpulse',
            'consistentfishes',
@@ -3,7 +3,9 @@ most stable signal of largest amplitude that is not clipped.
 
 Main functions:
 clip_amplitudes(): estimated clipping amplitudes from the data.
+ClipDetector: estimate clipping amplitudes block by block.
 best_window_indices(): select start- and end-indices of the best window
+BestWindowDetector: select the best window of a recording processed block by block.
 best_window_times(): select start end end-time of the best window
 best_window(): return data of the best window
 
@@ -17,7 +19,7 @@ plot_best_window(): visualization of the algorithm used in best_window_indices()
 """
 
 import numpy as np
-from .peakdetection import percentile_threshold, detect_peaks, trim_to_peak
+from .peakdetection import percentile_threshold, detect_peaks, PeakDetector
 
 
 def clip_amplitudes(data, win_indices, min_fac=2.0, nbins=20,
@@ -28,6 +30,10 @@ def clip_amplitudes(data, win_indices, min_fac=2.0, nbins=20,
     If the bins at the edges are more than min_fac times as large as
     the neighboring bins, clipping at the bin's amplitude is assumed.
 
+    The histograms of many windows are computed at once by binning the data
+    of the windows and counting the bin ids offset by the window index.
+    Use ClipDetector for processing a recording block by block.
+
     Args:
       data (array): 1-D array with the data.
       win_indices (int): size of the analysis window in indices.
@@ -57,29 +63,161 @@ def clip_amplitudes(data, win_indices, min_fac=2.0, nbins=20,
       max_clip : maximum amplitude that is not clipped.
     """
 
+    bins = np.linspace(min_ampl, max_ampl, nbins, endpoint=True)
+    nwins = len(np.arange(0, len(data) - win_indices, win_indices))
     min_clipa = min_ampl
     max_clipa = max_ampl
-    bins = np.linspace(min_ampl, max_ampl, nbins, endpoint=True)
-    win_tinxs = np.arange(0, len(data) - win_indices, win_indices)
-    for wtinx in win_tinxs:
-        h, b = np.histogram(data[wtinx:wtinx + win_indices], bins)
-        if h[0] > min_fac * h[2] and b[0] < -0.4:
-            if h[1] > min_fac * h[2] and b[2] > min_clipa:
-                min_clipa = b[2]
-            elif b[1] > min_clipa:
-                min_clipa = b[1]
-        if h[-1] > min_fac * h[-3] and b[-1] > 0.4:
-            if h[-2] > min_fac * h[-3] and b[-3] < max_clipa:
-                max_clipa = b[-3]
-            elif b[-2] < max_clipa:
-                max_clipa = b[-2]
+    # process chunks of windows at once:
+    chunk_wins = max(1, (1 << 20) // win_indices)
+    for k in range(0, nwins, chunk_wins):
+        n = min(chunk_wins, nwins - k)
+        wtinx = k * win_indices
+        h, min_clips, max_clips = _clip_windows(data[wtinx:wtinx + n * win_indices],
+                                                win_indices, bins, min_fac,
+                                                min_clipa, max_clipa)
+        min_clipa = min_clips[-1]
+        max_clipa = max_clips[-1]
         if plot_hist_func:
-            plot_hist_func(data, wtinx, wtinx + win_indices,
-                           b, h, min_clipa, max_clipa,
-                           min_ampl, max_ampl, **kwargs)
+            for j in range(n):
+                winx = wtinx + j * win_indices
+                plot_hist_func(data, winx, winx + win_indices,
+                               bins, h[j], min_clips[j], max_clips[j],
+                               min_ampl, max_ampl, **kwargs)
     return min_clipa, max_clipa
 
 
+def _clip_windows(data, win_indices, bins, min_fac, min_clip, max_clip):
+    """Histograms and clip amplitudes of consecutive windows as in clip_amplitudes().
+
+    Args:
+      data (array): 1-D array with the data of whole windows.
+      win_indices (int): size of the windows in indices.
+      bins (array): the bin edges of the histograms.
+      min_fac (float): see clip_amplitudes().
+      min_clip (float): minimum clip amplitude before the first window.
+      max_clip (float): maximum clip amplitude before the first window.
+
+    Returns:
+      h (2-D array of ints): histogram of each window, the same as np.histogram(window, bins).
+      min_clips (1-D array): minimum clip amplitude after each window.
+      max_clips (1-D array): maximum clip amplitude after each window.
+    """
+    nbins = len(bins) - 1
+    data = np.asarray(data)
+    nwins = len(data) // win_indices
+    # bin ids offset by the window, bins[i] <= x < bins[i+1], last bin including its right edge:
+    # data outside the bins are counted in an extra bin on each side:
+    ids = np.searchsorted(bins, data, 'right')
+    ids[data == bins[-1:]] = nbins
+    ids.reshape(nwins, win_indices)[:] += np.arange(nwins)[:, np.newaxis] * (nbins + 2)
+    h = np.bincount(ids, minlength=nwins * (nbins + 2)).reshape(nwins, nbins + 2)[:, 1:-1]
+    # clip amplitudes of each window:
+    min_clips = np.where(h[:, 1] > min_fac * h[:, 2], bins[2], bins[1])
+    min_clips[~((h[:, 0] > min_fac * h[:, 2]) & (bins[0] < -0.4))] = -np.inf
+    max_clips = np.where(h[:, -2] > min_fac * h[:, -3], bins[-3], bins[-2])
+    max_clips[~((h[:, -1] > min_fac * h[:, -3]) & (bins[-1] > 0.4))] = np.inf
+    min_clips = np.maximum.accumulate(np.concatenate(([min_clip], min_clips)))[1:]
+    max_clips = np.minimum.accumulate(np.concatenate(([max_clip], max_clips)))[1:]
+    return h, min_clips, max_clips
+
+
+class ClipDetector(object):
+    """
+    Clip amplitudes of consecutive blocks of a long recording.
+
+    The data following the last analysed window of a block are kept and
+    prepended to the next block. Processing a recording block by block
+    therefore results in the same clip amplitudes as clip_amplitudes()
+    applied to the whole recording.
+
+    Usage:
+    ```
+    detector = ClipDetector(int(1.0*samplerate))
+    for min_clip, max_clip in detector.blocks(data, 100000, channel=0):
+        ...
+    ```
+
+    Member variables:
+      min_clip (float): the current minimum amplitude that is not clipped.
+      max_clip (float): the current maximum amplitude that is not clipped.
+      offset (int): the index of the start of the next window.
+    """
+
+    def __init__(self, win_indices, min_fac=2.0, nbins=20, min_ampl=-1.0, max_ampl=1.0):
+        """
+        Args:
+          win_indices (int): size of the analysis window in indices.
+          See clip_amplitudes() for the remaining arguments.
+        """
+        self.win_indices = win_indices
+        self.min_fac = min_fac
+        self.min_ampl = min_ampl
+        self.max_ampl = max_ampl
+        self.bins = np.linspace(min_ampl, max_ampl, nbins, endpoint=True)
+        self.reset()
+
+    def reset(self, offset=0):
+        """Discard the state and start a new stream.
+
+        Args:
+          offset (int): index of the first data element of the next block.
+        """
+        self.min_clip = self.min_ampl
+        self.max_clip = self.max_ampl
+        self.offset = offset
+        self.buffer = np.zeros(0)
+
+    def process(self, block):
+        """Update the clip amplitudes with the next block of data.
+
+        As in clip_amplitudes() a window is only analysed once
+        the data element following it has been processed.
+
+        Args:
+          block (1-D array): the next block of data.
+
+        Returns:
+          min_clip (float): minimum amplitude that is not clipped.
+          max_clip (float): maximum amplitude that is not clipped.
+        """
+        data = np.concatenate((self.buffer, block)) if len(self.buffer) > 0 else np.asarray(block)
+        n = ((len(data) - 1) // self.win_indices) * self.win_indices if len(data) > 0 else 0
+        if n > 0:
+            _, min_clips, max_clips = _clip_windows(data[:n], self.win_indices, self.bins,
+                                                    self.min_fac, self.min_clip, self.max_clip)
+            self.min_clip = min_clips[-1]
+            self.max_clip = max_clips[-1]
+        self.buffer = data[n:]
+        self.offset += n
+        return self.min_clip, self.max_clip
+
+    def blocks(self, data, block_size, start=0, stop=-1, channel=None):
+        """Generator for the clip amplitudes after consecutive data blocks.
+
+        Args:
+          data (array or DataLoader): the data.
+          block_size (int): number of data points read at once.
+          start (int): index of the first data point to be analysed.
+          stop (int): index after the last data point to be analysed.
+                      If negative analyse up to the end of the data.
+          channel (int or None): if not None the channel (second index) of the data to be analysed.
+
+        Yields:
+          min_clip (float): minimum amplitude that is not clipped.
+          max_clip (float): maximum amplitude that is not clipped.
+        """
+        if stop < 0 or stop > len(data):
+            stop = len(data)
+        self.reset(start)
+        for inx0 in range(start, stop, block_size):
+            inx1 = min(inx0 + block_size, stop)
+            if channel is None:
+                block = data[inx0:inx1]
+            else:
+                block = data[inx0:inx1, channel]
+            yield self.process(block)
+
+
 def plot_clipping(data, winx0, winx1, bins,
                   h, min_clip, max_clip, min_ampl, max_ampl):
     """Visualize the data histograms and the detected clipping amplitudes in clip_amplitudes().
@@ -142,7 +280,7 @@ def clip_args(cfg, rate):
 def best_window_indices(data, samplerate, single=True, win_size=1., win_shift=0.1,
                         th_factor=0.8, percentile=0.1, min_clip=-np.inf, max_clip=np.inf,
                         w_cv_interv=1.0, w_ampl=1.0, w_cv_ampl=1.0, tolerance=0.5,
-                        plot_data_func=None, **kwargs):
+                        plot_data_func=None, coarse_shift=0.0, candidates=3, **kwargs):
     """ Detect the best window of the data to be analyzed. The data have
     been sampled with rate Hz.
     
@@ -173,6 +311,24 @@ def best_window_indices(data, samplerate, single=True, win_size=1., win_shift=0.
     single is True, then only the single window with smallest cost
     within the selected largest region is returned.
 
+    If coarse_shift is larger than zero, the search proceeds from coarse to fine.
+    In the first stage, peaks and troughs are detected only in segments of width
+    win_shift taken every coarse_shift, and the criteria and the cost function
+    are computed from these for windows shifted by coarse_shift.
+    Peaks and troughs are then detected and the criteria computed
+    as described above only in the regions around the candidates best windows
+    of the first stage (extended by two coarse_shift to each side).
+    All other windows are considered invalid. Only the criteria of windows
+    starting before the first peak and trough of a region might differ slightly
+    from the ones of the exhaustive search. For amplitude modulated
+    recordings (win_shift=0.1, coarse_shift=1.0, candidates=3) the minimum
+    of the cost function found this way exceeds the one of the exhaustive search
+    by less than 0.05. The best window is then selected from the evaluated windows
+    as described above. It might differ from the one of the exhaustive search,
+    but its cost exceeds the minimum cost of the exhaustive search by less than
+    tolerance plus 0.05. If the first stage does not find any valid window,
+    for example for pulse fish with less than one pulse per win_shift, all windows are searched.
+
     Data of the best window algorithm can be visualized by supplying the
     function plot_data_func.  Additional arguments for this function can
     be supplied via key-word arguments kwargs.
@@ -211,6 +367,10 @@ def best_window_indices(data, samplerate, single=True, win_size=1., win_shift=0.
         :param thresh (float): the threshold for the cost function.
         :param valid_wins (array): boolean array indicating the windows which fulfill all three criteria.
         :param **kwargs: further user supplied key-word arguments.
+    :param coarse_shift: (float). If larger than zero, time shift in seconds between the windows
+    of the first stage of a coarse-to-fine search.
+    :param candidates: (int). Number of best non-overlapping windows of the first stage
+    that are refined in the second stage.
     :param kwargs: Keyword arguments passed to plot_data_func and plot_window_func. 
     
     :return start_index: int. Index of the start of the best window.
@@ -222,54 +382,279 @@ def best_window_indices(data, samplerate, single=True, win_size=1., win_shift=0.
     if len(data) / samplerate <= win_size:
         raise UserWarning('no best window found: not enough data')
 
+    win_size_indices = int(win_size * samplerate)
+    win_shift_indices = int(win_shift * samplerate)
+    win_start_inxs = np.arange(0, len(data) - win_size_indices, win_shift_indices)
+    if coarse_shift > 0.0:
+        regions = _coarse_regions(data, win_size_indices, win_shift_indices,
+                                  int(coarse_shift * samplerate), candidates,
+                                  th_factor, percentile, min_clip, max_clip,
+                                  w_cv_interv, w_ampl, w_cv_ampl)
+    else:
+        regions = [(0, len(data))]
+
+    invalid_cv = 1000.0
+    cv_interv = np.full(len(win_start_inxs), invalid_cv)
+    mean_ampl = np.zeros(len(win_start_inxs))
+    cv_ampl = np.full(len(win_start_inxs), invalid_cv)
+    clipped_frac = np.zeros(len(win_start_inxs))
+    # the regions are multiples of win_shift_indices long, except for the last one,
+    # such that the thresholds of the concatenated regions are the same as of each region:
+    if len(regions) == 1:
+        region_data = data[regions[0][0]:regions[0][1]]
+    else:
+        region_data = np.concatenate([data[r0:r1] for r0, r1 in regions])
+
     # threshold for peak detection:
-    threshold = percentile_threshold(data, samplerate, win_shift,
-                                     th_factor=th_factor, percentile=percentile)
+    threshold = percentile_threshold(region_data, samplerate, win_shift,
+                                     th_factor=th_factor, percentile=percentile, compact=True)
 
     # detect large peaks and troughs:
-    peak_idx, trough_idx = detect_peaks(data, threshold)
+    peak_idx, trough_idx = detect_peaks(region_data, threshold)
+    region_starts = np.array([r0 for r0, r1 in regions])
+    region_offsets = np.cumsum([0] + [r1 - r0 for r0, r1 in regions])[:-1]
+    peak_idx = np.asarray(peak_idx, dtype=int)
+    peak_idx += (region_starts - region_offsets)[np.searchsorted(region_offsets, peak_idx, 'right') - 1]
+    trough_idx = np.asarray(trough_idx, dtype=int)
+    trough_idx += (region_starts - region_offsets)[np.searchsorted(region_offsets, trough_idx, 'right') - 1]
+
+    # compute cv of intervals, mean peak amplitude and its cv:
+    wins = np.zeros(len(win_start_inxs), dtype=bool)
+    for r0, r1 in regions:
+        wins |= (win_start_inxs >= r0) & (win_start_inxs + win_size_indices < r1)
+    cv_interv[wins], mean_ampl[wins], cv_ampl[wins], clipped_frac[wins] = \
+        _window_statistics(peak_idx, data[peak_idx], trough_idx, data[trough_idx],
+                           win_start_inxs[wins], win_size_indices, min_clip, max_clip)
     if len(peak_idx) == 0 or len(trough_idx) == 0:
         raise UserWarning('best_window(): no peaks or troughs detected')
 
-    # compute cv of intervals, mean peak amplitude and its cv:
+    # cost function and best window:
+    cost, thresh, win_idx0, win_idx1 = _best_window_region(cv_interv, mean_ampl, cv_ampl,
+                                                           w_cv_interv, w_ampl, w_cv_ampl,
+                                                           tolerance, single)
+
+    # retrive indices of best window for data:
+    idx0 = win_start_inxs[win_idx0]
+    idx1 = win_start_inxs[win_idx1 - 1] + win_size_indices
+
+    # clipped data?
+    clipped = np.mean(clipped_frac[win_idx0:win_idx1])
+
+    if plot_data_func:
+        plot_data_func(data, samplerate, peak_idx, trough_idx, idx0, idx1,
+                       win_start_inxs / samplerate, cv_interv, mean_ampl, cv_ampl, clipped_frac,
+                       cost, thresh, win_idx0, win_idx1, **kwargs)
+
+    return idx0, idx1, clipped
+
+
+def _window_statistics(peak_idx, peak_values, trough_idx, trough_values,
+                       win_start_inxs, win_size_indices, min_clip, max_clip):
+    """Criteria for the best window in each analysis window as in best_window_indices().
+
+    Args:
+      peak_idx (array of ints): indices of the peaks.
+      peak_values (array): data values at the peaks.
+      trough_idx (array of ints): indices of the troughs.
+      trough_values (array): data values at the troughs.
+      win_start_inxs (array of ints): indices of the start of the analysis windows.
+      win_size_indices (int): size of the analysis windows in indices.
+      min_clip (float): minimum amplitude below which data are clipped.
+      max_clip (float): maximum amplitude above which data are clipped.
+
+    Returns:
+      cv_interv (array): the coefficient of variation of the inter-peak and -trough intervals.
+      mean_ampl (array): the mean peak-to-trough amplitude.
+      cv_ampl (array): the coefficient of variation of the peak-to-trough amplitudes.
+      clipped_frac (array): the fraction of clipped peaks or troughs.
+    """
     invalid_cv = 1000.0
-    win_size_indices = int(win_size * samplerate)
-    win_start_inxs = np.arange(0, len(data) - win_size_indices, int(win_shift * samplerate))
-    cv_interv = np.zeros(len(win_start_inxs))
+    if len(peak_idx) == 0 or len(trough_idx) == 0:
+        return (np.full(len(win_start_inxs), invalid_cv), np.zeros(len(win_start_inxs)),
+                np.full(len(win_start_inxs), invalid_cv), np.zeros(len(win_start_inxs)))
+    # peaks and troughs inside analysis windows:
+    p0 = np.searchsorted(peak_idx, win_start_inxs, 'left')
+    p1 = np.searchsorted(peak_idx, win_start_inxs + win_size_indices, 'right')
+    t0 = np.searchsorted(trough_idx, win_start_inxs, 'left')
+    t1 = np.searchsorted(trough_idx, win_start_inxs + win_size_indices, 'right')
+    # as trim_to_peak():
+    first_trough = (p1 > p0) & (t1 > t0)
+    first_trough[first_trough] = trough_idx[t0[first_trough]] < peak_idx[p0[first_trough]]
+    t0 += first_trough
+    n = np.maximum(np.minimum(p1 - p0, t1 - t0), 0)
+    # interval statistics from prefix sums of intervals and squared intervals:
+    def interval_stats(idx, i0, m):
+        ivs = np.diff(idx.astype(np.int64))
+        csum = np.concatenate(([0], np.cumsum(ivs)))
+        csum2 = np.concatenate(([0], np.cumsum(ivs*ivs)))
+        i1 = i0 + np.maximum(m, 0)
+        s = csum[i1] - csum[i0]
+        s2 = csum2[i1] - csum2[i0]
+        m = np.maximum(m, 1)
+        mean = s / m.astype(float)
+        std = np.sqrt((m*s2 - s*s) / m.astype(float)**2)
+        return mean, std
+    nivs = n - 1
+    valid = nivs > 2
+    mean_ipis, std_ipis = interval_stats(peak_idx, np.minimum(p0, len(peak_idx) - 1), nivs)
+    mean_itis, std_itis = interval_stats(trough_idx, np.minimum(t0, len(trough_idx) - 1), nivs)
+    cv_interv = np.full(len(win_start_inxs), invalid_cv)
+    cv_interv[valid] = 0.5 * (std_ipis[valid] / mean_ipis[valid] + std_itis[valid] / mean_itis[valid])
+    # penalize regions without detected peaks:
+    first_peak = peak_idx[np.minimum(p0, len(peak_idx) - 1)]
+    last_peak = peak_idx[np.clip(p0 + n - 1, 0, len(peak_idx) - 1)]
+    gap = (first_peak - win_start_inxs).astype(float)
+    pen = valid & (gap > mean_ipis)
+    cv_interv[pen] *= gap[pen] / mean_ipis[pen]
+    gap = (win_start_inxs + win_size_indices - last_peak).astype(float)
+    pen = valid & (gap > mean_ipis)
+    cv_interv[pen] *= gap[pen] / mean_ipis[pen]
+    # statistics of peak-to-trough amplitudes, each peak with its following trough:
+    next_trough = np.searchsorted(trough_idx, peak_idx, 'right')
+    paired = next_trough < len(trough_idx)
+    next_trough[~paired] = len(trough_idx) - 1
+    p2t_ampl = np.where(paired, peak_values - trough_values[next_trough], 0.0)
+    ampl_ref = np.mean(p2t_ampl[paired]) if np.any(paired) else 0.0
+    dev = np.where(paired, p2t_ampl - ampl_ref, 0.0)
+    csum = np.concatenate(([0.0], np.cumsum(dev)))
+    csum2 = np.concatenate(([0.0], np.cumsum(dev*dev)))
+    cclip = np.concatenate(([0], np.cumsum(peak_values > max_clip) +
+                            np.cumsum(paired & (trough_values[next_trough] < min_clip))))
+    i0 = np.minimum(p0, len(peak_idx))
+    i1 = i0 + n
+    m = np.maximum(n, 1)
+    mean_dev = (csum[i1] - csum[i0]) / m
+    var = (csum2[i1] - csum2[i0]) / m - mean_dev**2
+    valid = n > 2
+    # variances within the rounding errors of the prefix sums,
+    # e.g. of equal amplitudes, are recomputed from the centered amplitudes:
+    inexact = valid & (var <= len(dev) * np.finfo(float).eps * (csum2[i1] + csum2[i0]) / m)
+    for k in np.nonzero(inexact)[0]:
+        var[k] = np.var(p2t_ampl[i0[k]:i1[k]])
+    var = np.maximum(var, 0.0)
     mean_ampl = np.zeros(len(win_start_inxs))
-    cv_ampl = np.zeros(len(win_start_inxs))
+    cv_ampl = np.full(len(win_start_inxs), invalid_cv)
     clipped_frac = np.zeros(len(win_start_inxs))
-    for i, wtinx in enumerate(win_start_inxs):
-        # indices of peaks and troughs inside analysis window:
-        pinx = (peak_idx >= wtinx) & (peak_idx <= wtinx + win_size_indices)
-        tinx = (trough_idx >= wtinx) & (trough_idx <= wtinx + win_size_indices)
-        p_idx, t_idx = trim_to_peak(peak_idx[pinx], trough_idx[tinx])
-        # interval statistics:
-        ipis = np.diff(p_idx)
-        itis = np.diff(t_idx)
-        if len(ipis) > 2:
-            cv_interv[i] = 0.5 * (np.std(ipis) / np.mean(ipis) + np.std(itis) / np.mean(itis))
-            # penalize regions without detected peaks:
-            mean_interv = np.mean(ipis)
-            if p_idx[0] - wtinx > mean_interv:
-                cv_interv[i] *= (p_idx[0] - wtinx) / mean_interv
-            if wtinx + win_size_indices - p_idx[-1] > mean_interv:
-                cv_interv[i] *= (wtinx + win_size_indices - p_idx[-1]) / mean_interv
-        else:
-            cv_interv[i] = invalid_cv
-        # statistics of peak-to-trough amplitude:
-        p2t_ampl = data[p_idx] - data[t_idx]
-        if len(p2t_ampl) > 2:
-            mean_ampl[i] = np.mean(p2t_ampl)
-            cv_ampl[i] = np.std(p2t_ampl) / mean_ampl[i]
-            # penalize for clipped peaks:
-            clipped_frac[i] = float(np.sum(data[p_idx] > max_clip) +
-                                    np.sum(data[t_idx] < min_clip)) / 2.0 / len(p2t_ampl)
-            mean_ampl[i] *= (1.0 - clipped_frac[i]) ** 2.0
+    mean_ampl[valid] = ampl_ref + mean_dev[valid]
+    cv_ampl[valid] = np.sqrt(var[valid]) / mean_ampl[valid]
+    # penalize for clipped peaks:
+    clipped_frac[valid] = (cclip[i1] - cclip[i0])[valid] / 2.0 / n[valid]
+    mean_ampl[valid] *= (1.0 - clipped_frac[valid]) ** 2.0
+    return cv_interv, mean_ampl, cv_ampl, clipped_frac
+
+
+def _coarse_regions(data, win_size_indices, win_shift_indices, coarse_shift_indices,
+                    candidates, th_factor, percentile, min_clip, max_clip,
+                    w_cv_interv, w_ampl, w_cv_ampl):
+    """Regions of the candidates for the best window of the first stage of best_window_indices().
+
+    Args:
+      data (array): the data.
+      win_size_indices (int): size of the analysis windows in indices.
+      win_shift_indices (int): size of the sampled segments of the data in indices.
+      coarse_shift_indices (int): distance of the sampled segments and shift of the windows
+        in indices, rounded to multiples of win_shift_indices.
+      candidates (int): maximum number of non-overlapping candidate windows.
+      th_factor (float): th_factor parameter for percentile_threshold().
+      percentile (float): percentile parameter for percentile_threshold().
+      min_clip (float): minimum amplitude below which data are clipped.
+      max_clip (float): maximum amplitude above which data are clipped.
+      w_cv_interv (float): weight for the coefficient of variation of the intervals.
+      w_ampl (float): weight for the mean peak-to-trough amplitude.
+      w_cv_ampl (float): weight for the coefficient of variation of the amplitudes.
+
+    Returns:
+      regions (list of tuples of ints): start and end indices of non-overlapping regions
+        around the candidate windows, sorted by their start.
+    """
+    invalid_cv = 1000.0
+    # segments of win_shift at the start of each coarse shift:
+    step = max(1, int(round(coarse_shift_indices / win_shift_indices))) * win_shift_indices
+    nsegs = max(0, (len(data) - win_shift_indices) // step + 1)
+    nwin = max(1, win_size_indices // step)
+    if nsegs < nwin:
+        return [(0, len(data))]
+    segs = np.asarray(data)[(np.arange(nsegs) * step)[:, np.newaxis] + np.arange(win_shift_indices)]
+    # peaks and troughs in each segment:
+    threshold = percentile_threshold(segs, th_factor=th_factor, percentile=percentile, axis=1)
+    threshold[threshold <= 0.0] = np.inf
+    peaks, troughs, peak_offsets, trough_offsets = detect_peaks(segs, threshold, axis=1)
+    peak_rows = np.repeat(np.arange(nsegs), np.diff(peak_offsets))
+    trough_rows = np.repeat(np.arange(nsegs), np.diff(trough_offsets))
+    # each peak with the following trough of its segment:
+    next_trough = np.searchsorted(trough_rows * win_shift_indices + troughs,
+                                  peak_rows * win_shift_indices + peaks, 'right')
+    paired = next_trough < len(troughs)
+    paired[paired] = trough_rows[next_trough[paired]] == peak_rows[paired]
+    peak_values = segs[peak_rows[paired], peaks[paired]]
+    trough_values = segs[peak_rows[paired], troughs[next_trough[paired]]]
+    ampl_rows = peak_rows[paired]
+    ampls = (peak_values - trough_values).astype(np.float64)
+    clipped = (peak_values > max_clip).astype(float) + (trough_values < min_clip)
+    # statistics of windows of nwin segments from prefix sums over the segments:
+    starts = np.arange(nsegs - nwin + 1)
+
+    def window_sums(values, rows):
+        csum = np.concatenate(([0.0], np.cumsum(np.bincount(rows, weights=values, minlength=nsegs))))
+        return csum[starts + nwin] - csum[starts]
+
+    def window_cv(values, rows):
+        n = window_sums(np.ones(len(values)), rows)
+        m = np.maximum(n, 1.0)
+        mean = window_sums(values, rows) / m
+        std = np.sqrt(np.maximum(window_sums(values**2, rows) / m - mean**2, 0.0))
+        valid = (n > 2) & (mean > 0.0)
+        return np.where(valid, std / np.where(valid, mean, 1.0), invalid_cv), mean, m
+
+    def interval_cv(idx, rows):
+        same = rows[1:] == rows[:-1]
+        return window_cv(np.diff(idx)[same].astype(np.float64), rows[1:][same])[0]
+
+    cv_ipis = interval_cv(peaks, peak_rows)
+    cv_itis = interval_cv(troughs, trough_rows)
+    cv_interv = np.where((cv_ipis < invalid_cv) & (cv_itis < invalid_cv),
+                         0.5 * (cv_ipis + cv_itis), invalid_cv)
+    cv_ampl, mean_ampl, n = window_cv(ampls, ampl_rows)
+    clipped_frac = window_sums(clipped, ampl_rows) / 2.0 / n
+    mean_ampl *= (1.0 - clipped_frac) ** 2.0
+    valid = (cv_interv < invalid_cv) & (cv_ampl < invalid_cv)
+    if not np.any(valid):
+        return [(0, len(data))]
+    cost = w_cv_interv * cv_interv + w_cv_ampl * cv_ampl - w_ampl * mean_ampl
+    # best non-overlapping windows:
+    best = []
+    for k in np.argsort(cost, kind='stable'):
+        if len(best) >= candidates or not valid[k]:
+            break
+        if all(abs(starts[k] - b) >= nwin for b in best):
+            best.append(starts[k])
+    # regions extended by two coarse shifts on each side, multiples of win_shift_indices long:
+    regions = []
+    for b in sorted(best):
+        r0 = max(0, (b - 2) * step)
+        r1 = (b + 2) * step + win_size_indices + 1
+        r1 = min(len(data), r0 + -((r0 - r1) // win_shift_indices) * win_shift_indices)
+        if len(regions) > 0 and r0 <= regions[-1][1]:
+            regions[-1] = (regions[-1][0], r1)
         else:
-            mean_ampl[i] = 0.0
-            cv_ampl[i] = invalid_cv
+            regions.append((r0, r1))
+    return regions
 
+
+def _best_window_region(cv_interv, mean_ampl, cv_ampl, w_cv_interv, w_ampl, w_cv_ampl,
+                        tolerance, single):
+    """Cost function and the analysis windows of the best window as in best_window_indices().
+
+    Returns:
+      cost (array): the cost function.
+      thresh (float): the threshold for the cost function.
+      win_idx0 (int): index of the first analysis window of the best window.
+      win_idx1 (int): index after the last analysis window of the best window.
+
+    Raises:
+      UserWarning: no valid window found.
+    """
+    invalid_cv = 1000.0
     # check:
     if len(mean_ampl[mean_ampl > 0.0]) <= 0:
         raise UserWarning('no finite amplitudes detected')
@@ -304,19 +689,169 @@ def best_window_indices(data, samplerate, single=True, win_size=1., win_shift=0.
         win_idx0 += np.argmin(cost[win_idx0:win_idx1])
         win_idx1 = win_idx0 + 1
 
-    # retrive indices of best window for data:
-    idx0 = win_start_inxs[win_idx0]
-    idx1 = win_start_inxs[win_idx1 - 1] + win_size_indices
+    return cost, thresh, win_idx0, win_idx1
 
-    # clipped data?
-    clipped = np.mean(clipped_frac[win_idx0:win_idx1])
 
-    if plot_data_func:
-        plot_data_func(data, samplerate, peak_idx, trough_idx, idx0, idx1,
-                       win_start_inxs / samplerate, cv_interv, mean_ampl, cv_ampl, clipped_frac,
-                       cost, thresh, win_idx0, win_idx1, **kwargs)
+class BestWindowDetector(object):
+    """
+    Best window of a long recording processed block by block.
+
+    Peaks and troughs are detected with a PeakDetector and the criteria
+    of each analysis window are computed as soon as all its peaks and
+    troughs are known. Only the peaks and troughs of analysis windows
+    that are not yet completed and the criteria of all analysis windows
+    are kept, such that recordings much larger than the available memory
+    can be analysed. The resulting best window is the same as the one
+    of best_window_indices() applied to the whole recording.
+
+    Usage:
+    ```
+    detector = BestWindowDetector(samplerate, win_size=8.0)
+    for block in data_blocks:
+        detector.process(block)
+    idx0, idx1, clipped = detector.best_window()
+    ```
+
+    Member variables:
+      offset (int): the number of data elements analysed so far.
+      win_start_inxs (array of ints): indices of the start of the completed analysis windows.
+      cv_interv, mean_ampl, cv_ampl, clipped_frac (arrays):
+        the criteria of the completed analysis windows (see best_window_indices()).
+    """
 
-    return idx0, idx1, clipped
+    def __init__(self, samplerate, single=True, win_size=1., win_shift=0.1,
+                 th_factor=0.8, percentile=0.1, min_clip=-np.inf, max_clip=np.inf,
+                 w_cv_interv=1.0, w_ampl=1.0, w_cv_ampl=1.0, tolerance=0.5):
+        """
+        Args:
+          See best_window_indices() for details on the arguments.
+        """
+        self.samplerate = samplerate
+        self.single = single
+        self.win_size = win_size
+        self.win_size_indices = int(win_size * samplerate)
+        self.win_shift_indices = int(win_shift * samplerate)
+        self.th_factor = th_factor
+        self.percentile = percentile
+        self.min_clip = min_clip
+        self.max_clip = max_clip
+        self.w_cv_interv = w_cv_interv
+        self.w_ampl = w_ampl
+        self.w_cv_ampl = w_cv_ampl
+        self.tolerance = tolerance
+        self.reset()
+
+    def reset(self):
+        """Discard the state and start a new stream."""
+        self.offset = 0
+        self.buffer = np.zeros(0)
+        self.detector = PeakDetector(1.0)
+        self.npeaks = 0
+        self.ntroughs = 0
+        self.peak_idx = np.zeros(0, dtype=int)
+        self.peak_values = np.zeros(0)
+        self.trough_idx = np.zeros(0, dtype=int)
+        self.trough_values = np.zeros(0)
+        self.win_start_inxs = np.zeros(0, dtype=int)
+        self.cv_interv = np.zeros(0)
+        self.mean_ampl = np.zeros(0)
+        self.cv_ampl = np.zeros(0)
+        self.clipped_frac = np.zeros(0)
+
+    def process(self, block):
+        """Detect peaks and troughs in the next block of data and update the analysis windows.
+
+        Data following the last complete window of the threshold
+        (of win_shift size) are kept for the next block.
+
+        Args:
+          block (1-D array): the data following the previous block.
+        """
+        data = np.concatenate((self.buffer, block)) if len(self.buffer) > 0 else np.asarray(block)
+        n = (len(data) // self.win_shift_indices) * self.win_shift_indices
+        if n > 0:
+            self._detect(data[:n])
+        self.buffer = data[n:]
+
+    def _detect(self, data):
+        """Peaks, troughs and completed analysis windows of data following the previous ones."""
+        threshold = percentile_threshold(data, 1.0, self.win_shift_indices,
+                                         th_factor=self.th_factor, percentile=self.percentile)
+        # the only peaks and troughs preceding the data are the pending ones:
+        prev_max_value = self.detector.max_value
+        prev_min_value = self.detector.min_value
+        peaks, troughs = self.detector.process(data, threshold)
+        peak_values = data[np.maximum(peaks - self.offset, 0)]
+        peak_values[peaks < self.offset] = prev_max_value
+        trough_values = data[np.maximum(troughs - self.offset, 0)]
+        trough_values[troughs < self.offset] = prev_min_value
+        self.peak_idx = np.concatenate((self.peak_idx, peaks))
+        self.peak_values = np.concatenate((self.peak_values, peak_values))
+        self.trough_idx = np.concatenate((self.trough_idx, troughs))
+        self.trough_values = np.concatenate((self.trough_values, trough_values))
+        self.npeaks += len(peaks)
+        self.ntroughs += len(troughs)
+        self.offset += len(data)
+        # index of the next peak or trough that might still be reported:
+        if self.detector.direction > 0:
+            pending = self.detector.max_inx
+        elif self.detector.direction < 0:
+            pending = self.detector.min_inx
+        else:
+            pending = min(self.detector.max_inx, self.detector.min_inx)
+        self._update_windows(pending - self.win_size_indices)
+
+    def _update_windows(self, stop):
+        """Compute the criteria of all analysis windows starting before stop."""
+        start = len(self.win_start_inxs) * self.win_shift_indices
+        if stop <= start:
+            return
+        win_start_inxs = np.arange(start, stop, self.win_shift_indices)
+        stats = _window_statistics(self.peak_idx, self.peak_values,
+                                   self.trough_idx, self.trough_values,
+                                   win_start_inxs, self.win_size_indices,
+                                   self.min_clip, self.max_clip)
+        self.win_start_inxs = np.concatenate((self.win_start_inxs, win_start_inxs))
+        self.cv_interv = np.concatenate((self.cv_interv, stats[0]))
+        self.mean_ampl = np.concatenate((self.mean_ampl, stats[1]))
+        self.cv_ampl = np.concatenate((self.cv_ampl, stats[2]))
+        self.clipped_frac = np.concatenate((self.clipped_frac, stats[3]))
+        # discard peaks and troughs before the next analysis window:
+        start = len(self.win_start_inxs) * self.win_shift_indices
+        keep = self.peak_idx >= start
+        self.peak_idx = self.peak_idx[keep]
+        self.peak_values = self.peak_values[keep]
+        keep = self.trough_idx >= start
+        self.trough_idx = self.trough_idx[keep]
+        self.trough_values = self.trough_values[keep]
+
+    def best_window(self):
+        """The best window after the last block of data has been processed.
+
+        Returns:
+          start_index (int): index of the start of the best window.
+          end_index (int): index of the end of the best window.
+          clipped (float): the fraction of clipped peaks or troughs.
+
+        Raises:
+          UserWarning: not enough data, no peaks or troughs, or no valid window found.
+        """
+        if len(self.buffer) > 0:
+            self._detect(self.buffer)
+            self.buffer = np.zeros(0)
+        if self.offset / self.samplerate <= self.win_size:
+            raise UserWarning('no best window found: not enough data')
+        if self.npeaks == 0 or self.ntroughs == 0:
+            raise UserWarning('best_window(): no peaks or troughs detected')
+        self._update_windows(self.offset - self.win_size_indices)
+        cost, thresh, win_idx0, win_idx1 = _best_window_region(self.cv_interv, self.mean_ampl,
+                                                               self.cv_ampl, self.w_cv_interv,
+                                                               self.w_ampl, self.w_cv_ampl,
+                                                               self.tolerance, self.single)
+        idx0 = self.win_start_inxs[win_idx0]
+        idx1 = self.win_start_inxs[win_idx1 - 1] + self.win_size_indices
+        clipped = np.mean(self.clipped_frac[win_idx0:win_idx1])
+        return idx0, idx1, clipped
 
 
 def best_window_times(data, samplerate, single=True, win_size=1., win_shift=0.1,
@@ -415,12 +950,14 @@ def add_best_window_config(cfg, single=True, win_size=1., win_shift=0.1,
                            th_factor=0.8, percentile=0.1,
                            min_clip=-np.inf, max_clip=np.inf,
                            w_cv_interv=1.0, w_ampl=1.0, w_cv_ampl=1.0,
-                           tolerance=0.5):
+                           tolerance=0.5, buffer_size=0.0):
     """ Add parameter needed for the best_window() functions as
     a new section to a configuration dictionary.
 
     Args:
       cfg (ConfigFile): the configuration
+      buffer_size (float): size of data blocks in seconds for searching the best window
+        block by block with BestWindowDetector. If zero, the whole recording is loaded.
       See best_window_indices() for details on the remaining arguments.
     """
 
@@ -442,6 +979,8 @@ def add_best_window_config(cfg, single=True, win_size=1., win_shift=0.1,
             'Add this to the minimum value of the cost function to get a threshold for selecting the largest best window.')
     cfg.add('singleBestWindow', single, '',
             'Return only a single best window. If False return the largest valid best window.')
+    cfg.add('bestWindowBufferSize', buffer_size, 's',
+            'Read the data in blocks of this size for searching the best window. If zero, load the whole recording.')
 
 
 def best_window_args(cfg):
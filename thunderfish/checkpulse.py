@@ -74,7 +74,7 @@ def check_pulse_width(data, samplerate, win_size=0.5, th_factor=0.8, percentile=
 
     # threshold for peak detection:
     threshold = percentile_threshold(data, samplerate, win_size,
-                                     th_factor=th_factor, percentile=percentile)
+                                     th_factor=th_factor, percentile=percentile, compact=True)
 
     # detect large peaks and troughs:
     peak_idx, trough_idx = detect_peaks(data, threshold)
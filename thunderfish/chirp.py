@@ -162,7 +162,7 @@ def chirp_detection_plot(enu, chirp_time, time, power, power2, power_diff, funda
     plt.legend(loc='upper right', bbox_to_anchor=(1, 1), frameon=False)
 
 
-def chirp_analysis(data, samplerate):
+def chirp_analysis(data, samplerate, max_freq=None):
     """
     Performs all steps to detect chirps in a given dataset. This includes spectrogram calculation, fish detection and
     analysing of specific frequency bands.
@@ -171,9 +171,10 @@ def chirp_analysis(data, samplerate):
 
     :param data: (array) data.
     :param samplerate: (float) smaplerate of the data.
+    :param max_freq: (float or None) if not None only frequencies up to max_freq are kept in the spectrogram.
     :param min_power: (float) minimal power of the fish fundamental to include this fish in chirp detection.
     """
-    spectrum, freqs, time = spectrogram(data, samplerate, fresolution=2., overlap_frac=0.95)
+    spectrum, freqs, time = spectrogram(data, samplerate, fresolution=2., overlap_frac=0.95, max_freq=max_freq)
 
     power = np.mean(spectrum, axis=1) # spectrum[:, t0:t1] to only let spectrum of certain time....
 
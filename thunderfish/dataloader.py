@@ -206,7 +206,7 @@ def relacs_files(filepathes, channel):
     return filepathes
 
         
-def load_relacs(filepathes, channel=-1, verbose=0):
+def load_relacs(filepathes, channel=-1, verbose=0, dtype=np.float64):
     """
     Load traces (trace-*.raw files) that have been recorded with relacs (www.relacs.net).
 
@@ -219,6 +219,8 @@ def load_relacs(filepathes, channel=-1, verbose=0):
         The data channel. If negative all channels are selected.
     verbose: int
         if > 0 show detailed error/warning messages
+    dtype: numpy dtype
+        The data type of the returned data, e.g. np.float32 for halving the needed memory.
 
     Returns
     -------
@@ -256,7 +258,7 @@ def load_relacs(filepathes, channel=-1, verbose=0):
             print( 'loaded %s' % path)
         if data is None:
             nrows = len(x)-2
-            data = np.empty((nrows, nchannels))
+            data = np.empty((nrows, nchannels), dtype=dtype)
         data[:,n] = x[:nrows]
         # retrieve sampling rate and unit:
         rate, us = relacs_samplerate_unit(path)
@@ -477,7 +479,7 @@ def fishgrid_files(filepathes, channel, grid_sizes):
     return filepathes
 
         
-def load_fishgrid(filepathes, channel=-1, verbose=0):
+def load_fishgrid(filepathes, channel=-1, verbose=0, dtype=np.float64):
     """
     Load traces (traces-grid*.raw files) that have been recorded with fishgrid (https://github.com/bendalab/fishgrid).
 
@@ -490,6 +492,8 @@ def load_fishgrid(filepathes, channel=-1, verbose=0):
         The data channel. If negative all channels are selected.
     verbose: int
         if > 0 show detailed error/warning messages
+    dtype: numpy dtype
+        The data type of the returned data, e.g. np.float32 for halving the needed memory.
 
     Returns
     -------
@@ -532,7 +536,7 @@ def load_fishgrid(filepathes, channel=-1, verbose=0):
             print( 'loaded %s' % path)
         if data is None:
             nrows = len(x)-2
-            data = np.empty((nrows, nchannels))
+            data = np.empty((nrows, nchannels), dtype=dtype)
         data[:,n:n+channels] = x[:nrows,:]
     if channel < 0:
         return data, samplerate, unit
@@ -557,7 +561,7 @@ def check_pickle(filepath):
     return ext == 'pkl'
 
 
-def load_pickle(filename, channel=-1, verbose=0):
+def load_pickle(filename, channel=-1, verbose=0, dtype=np.float64):
     """
     Load Joerg's pickle files.
 
@@ -569,6 +573,8 @@ def load_pickle(filename, channel=-1, verbose=0):
         The data channel. If negative all channels are selected.
     verbose: int
         if > 0 show detailed error/warning messages
+    dtype: numpy dtype
+        The data type of the returned data, e.g. np.float32 for halving the needed memory.
 
     Returns
     -------
@@ -592,11 +598,11 @@ def load_pickle(filename, channel=-1, verbose=0):
         if channel >= data.shape[1]:
             raise IndexError('invalid channel number %d requested' % channel)
         data = data[:, channel]
-        return data['raw_data'][:, channel], samplerate, 'mV'
-    return data['raw_data'], samplerate, 'mV'
+        return np.asarray(data['raw_data'][:, channel], dtype=dtype), samplerate, 'mV'
+    return np.asarray(data['raw_data'], dtype=dtype), samplerate, 'mV'
 
 
-def load_data(filepath, channel=-1, verbose=0):
+def load_data(filepath, channel=-1, verbose=0, dtype=np.float64):
     """
     Call this function to load time-series data from a file of arbitrary format.
 
@@ -609,6 +615,8 @@ def load_data(filepath, channel=-1, verbose=0):
         The data channel. If negative all channels are selected.
     verbose: int
         if > 0 show detailed error/warning messages
+    dtype: numpy dtype
+        The data type of the returned data, e.g. np.float32 for halving the needed memory.
 
     Returns
     -------
@@ -638,20 +646,21 @@ def load_data(filepath, channel=-1, verbose=0):
 
     # load data:
     if check_relacs(filepath):
-        return load_relacs(filepath, channel, verbose)
+        return load_relacs(filepath, channel, verbose, dtype)
     elif check_fishgrid(filepath):
-        return load_fishgrid(filepath, channel, verbose)
+        return load_fishgrid(filepath, channel, verbose, dtype)
     else:
         if type(filepath) is list:
             filepath = filepath[0]
         if check_pickle(filepath):
-            return load_pickle(filepath, channel, verbose)
+            return load_pickle(filepath, channel, verbose, dtype)
         else:
             data, samplerate = aio.load_audio(filepath, verbose)
             if channel >= 0:
                 if channel >= data.shape[1]:
                     raise IndexError('invalid channel number %d requested' % channel)
                 data = data[:, channel]
+            data = np.asarray(data, dtype=dtype)
             unit = 'a.u.'
         return data, samplerate, unit
 
@@ -709,6 +718,7 @@ class DataLoader(aio.AudioLoader):
                      If negative, all channels are returned.
       frames (int): the number of frames in the file.
       shape (tuple): frames and channels of the data.
+      dtype (numpy dtype): the data type of the buffer of relacs and fishgrid files.
 
     Some member functions:
       len(): the number of frames
@@ -717,7 +727,8 @@ class DataLoader(aio.AudioLoader):
       close(): close the file.
     """
 
-    def __init__(self, filepath=None, channel=-1, buffersize=10.0, backsize=0.0, verbose=0):
+    def __init__(self, filepath=None, channel=-1, buffersize=10.0, backsize=0.0, verbose=0,
+                 dtype=np.float64):
         """
         Initialize the DataLoader instance. If filepath is not None open the file.
 
@@ -733,10 +744,14 @@ class DataLoader(aio.AudioLoader):
             Part of the buffer to be loaded before the requested start index in seconds.
         verbose: int
             If > 0 show detailed error/warning messages.
+        dtype: numpy dtype
+            The data type of the buffer for relacs and fishgrid files,
+            e.g. np.float32 for halving the needed memory.
         """
+        self.dtype = np.dtype(np.float64)
         super(DataLoader, self).__init__(None, buffersize, backsize, verbose)
         if filepath is not None:
-            self.open(filepath, channel, buffersize, backsize, verbose)
+            self.open(filepath, channel, buffersize, backsize, verbose, dtype)
 
     def __getitem__(self, key):
         if self.channel >= 0:
@@ -752,9 +767,19 @@ class DataLoader(aio.AudioLoader):
         else:
             return super(DataLoader, self).__next__()
 
+    def _init_buffer(self):
+        """Allocate a buffer of size zero with the requested dtype."""
+        self.buffer = np.empty((0, self.channels), dtype=self.dtype)
+
+    def _allocate_buffer(self, size):
+        """Make sure the buffer has the right size and the requested dtype."""
+        if size != self.buffer.shape[0] or self.buffer.dtype != self.dtype:
+            self.buffer = np.empty((size, self.channels), dtype=self.dtype)
+
     
     # relacs interface:        
-    def open_relacs(self, filepathes, channel=-1, buffersize=10.0, backsize=0.0, verbose=0):
+    def open_relacs(self, filepathes, channel=-1, buffersize=10.0, backsize=0.0, verbose=0,
+                    dtype=np.float64):
         """
         Open relacs data files (www.relacs.net) for reading.
 
@@ -771,6 +796,8 @@ class DataLoader(aio.AudioLoader):
             Part of the buffer to be loaded before the requested start index in seconds.
         verbose: int
             If > 0 show detailed error/warning messages.
+        dtype: numpy dtype
+            The data type of the buffer for relacs and fishgrid files.
         """
 
         self.verbose = verbose
@@ -824,6 +851,7 @@ class DataLoader(aio.AudioLoader):
             self.shape = (self.frames, self.channels)
         self.buffersize = int(buffersize*self.samplerate)
         self.backsize = int(backsize*self.samplerate)
+        self.dtype = np.dtype(dtype)
         self._init_buffer()
         self.offset = 0
         self.close = self._close_relacs
@@ -862,7 +890,8 @@ class DataLoader(aio.AudioLoader):
         
     
     # fishgrid interface:        
-    def open_fishgrid(self, filepathes, channel=-1, buffersize=10.0, backsize=0.0, verbose=0):
+    def open_fishgrid(self, filepathes, channel=-1, buffersize=10.0, backsize=0.0, verbose=0,
+                      dtype=np.float64):
         """
         Open fishgrid data files (https://github.com/bendalab/fishgrid) for reading.
 
@@ -879,6 +908,8 @@ class DataLoader(aio.AudioLoader):
             Part of the buffer to be loaded before the requested start index in seconds.
         verbose: int
             If > 0 show detailed error/warning messages.
+        dtype: numpy dtype
+            The data type of the buffer for relacs and fishgrid files.
         """
 
         self.verbose = verbose
@@ -942,6 +973,7 @@ class DataLoader(aio.AudioLoader):
             self.shape = (self.frames, self.channels)
         self.buffersize = int(buffersize*self.samplerate)
         self.backsize = int(backsize*self.samplerate)
+        self.dtype = np.dtype(dtype)
         self._init_buffer()
         self.offset = 0
         self.close = self._close_fishgrid
@@ -979,7 +1011,7 @@ class DataLoader(aio.AudioLoader):
                       % (self.buffer.shape[0], self.offset, self.offset+self.buffer.shape[0]))
         
 
-    def open(self, filepath, channel=0, buffersize=10.0, backsize=0.0, verbose=0):
+    def open(self, filepath, channel=0, buffersize=10.0, backsize=0.0, verbose=0, dtype=np.float64):
         """
         Open file with time-series data for reading.
 
@@ -995,14 +1027,17 @@ class DataLoader(aio.AudioLoader):
             Part of the buffer to be loaded before the requested start index in seconds.
         verbose: int
             If > 0 show detailed error/warning messages.
+        dtype: numpy dtype
+            The data type of the buffer for relacs and fishgrid files.
         """
         if check_relacs(filepath):
-            self.open_relacs(filepath, channel, buffersize, backsize, verbose)
+            self.open_relacs(filepath, channel, buffersize, backsize, verbose, dtype)
         elif check_fishgrid(filepath):
-            self.open_fishgrid(filepath, channel, buffersize, backsize, verbose)
+            self.open_fishgrid(filepath, channel, buffersize, backsize, verbose, dtype)
         else:
             if type(filepath) is list:
                 filepath = filepath[0]
+            self.dtype = np.dtype(np.float64)
             super(DataLoader, self).open(filepath, buffersize, backsize, verbose)
             if channel > self.channels:
                 raise IndexError('invalid channel number %d' % channel)
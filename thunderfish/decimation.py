@@ -0,0 +1,234 @@
+"""Anti-aliased decimation of the data before analysis.
+
+Wave-type EODs and their relevant harmonics are well below the Nyquist
+frequency of most recordings. Decimating the data to a lower analysis
+rate reduces the amount of data every further analysis step has to process.
+
+Main functions:
+decimation_factor(): integer decimation factor for a given analysis rate.
+decimation_filter(): FIR low-pass filter used for decimation.
+Decimator: stateful polyphase FIR decimation of consecutive data blocks.
+decimate(): decimate data in memory.
+
+add_decimation_config(): add parameters for decimate() to configuration.
+decimation_args(): retrieve parameters for decimate() from configuration.
+"""
+
+import numpy as np
+import scipy.signal as scps
+
+
+def decimation_factor(samplerate, analysis_rate):
+    """Integer decimation factor for reducing the sampling rate to analysis_rate.
+
+    The resulting sampling rate samplerate/factor is at least analysis_rate.
+
+    Args:
+      samplerate (float): sampling rate of the data in Hertz.
+      analysis_rate (float): minimum sampling rate in Hertz used for the analysis.
+                             If not larger than zero no decimation is performed.
+
+    Returns:
+      factor (int): the decimation factor, 1 for no decimation.
+    """
+    if analysis_rate <= 0.0 or analysis_rate >= samplerate:
+        return 1
+    return max(1, int(samplerate // analysis_rate))
+
+
+def decimation_filter(factor, taps_per_phase=32, beta=8.0):
+    """Low-pass FIR filter for decimation by factor.
+
+    The cutoff frequency is set to the Nyquist frequency of the decimated data.
+    The filter is linear-phase with taps_per_phase*factor + 1 coefficients,
+    i.e. its delay is taps_per_phase/2 samples of the decimated data.
+
+    Args:
+      factor (int): the decimation factor.
+      taps_per_phase (int): number of filter coefficients per polyphase component. Must be even.
+      beta (float): parameter of the Kaiser window used for designing the filter.
+
+    Returns:
+      h (1-D array): the filter coefficients.
+    """
+    if taps_per_phase % 2 != 0:
+        taps_per_phase += 1
+    return scps.firwin(taps_per_phase*factor + 1, 1.0/factor, window=('kaiser', beta))
+
+
+class Decimator(object):
+    """
+    Stateful polyphase FIR decimation of consecutive blocks of data.
+
+    The filter state is kept between calls of process(). Decimating
+    a recording block by block therefore results in exactly the same
+    data as decimating the whole recording at once.
+    The filter delay is compensated, i.e. the i-th decimated sample
+    corresponds to the data point i*factor of the original data.
+    Call flush() after the last block to obtain the remaining data.
+
+    Usage:
+    ```
+    decimator = Decimator(samplerate, 5)
+    for block in decimator.blocks(data, 100000):
+        # block is sampled with decimator.out_samplerate
+        ...
+    ```
+
+    Member variables:
+      samplerate (float): the sampling rate of the input data.
+      factor (int): the decimation factor.
+      out_samplerate (float): the sampling rate of the decimated data.
+      h (1-D array): the coefficients of the low-pass filter.
+      delay (int): the delay of the filter in decimated samples.
+      dtype (numpy dtype): the floating point type of the decimated data.
+    """
+
+    def __init__(self, samplerate, factor, taps_per_phase=32, dtype=np.float64):
+        """
+        Args:
+          samplerate (float): sampling rate of the data in Hertz.
+          factor (int): the decimation factor.
+          taps_per_phase (int): number of filter coefficients per polyphase component.
+          dtype (numpy dtype): the floating point type of the decimated data.
+        """
+        self.samplerate = samplerate
+        self.factor = int(factor)
+        self.out_samplerate = samplerate/float(self.factor)
+        self.dtype = np.dtype(dtype)
+        self.h = decimation_filter(self.factor, taps_per_phase).astype(self.dtype)
+        self.delay = (len(self.h) - 1)//(2*self.factor)
+        self.reset()
+
+    def reset(self):
+        """Discard the filter state and start a new stream."""
+        self.history = None
+        self.phase = 0
+        self.skip = self.delay
+
+    def process(self, block):
+        """Decimate the next block of data.
+
+        Args:
+          block (array): the data following the previous block. Time is the first dimension.
+
+        Returns:
+          data (array): the decimated data.
+        """
+        data = np.asarray(block, dtype=self.dtype)
+        ntaps = len(self.h)
+        if self.history is None:
+            self.history = np.zeros((ntaps - 1,) + data.shape[1:], dtype=self.dtype)
+        x = np.concatenate((self.history, data))
+        q0 = ntaps - 1 + self.phase
+        nout = 0
+        if q0 < len(x):
+            nout = (len(x) - 1 - q0)//self.factor + 1
+        y = np.zeros((nout,) + data.shape[1:], dtype=self.dtype)
+        if nout > 0:
+            # polyphase filtering: each coefficient only multiplies the data points needed for the output:
+            n = (nout - 1)*self.factor + 1
+            for k in range(ntaps):
+                y += self.h[k]*x[q0-k:q0-k+n:self.factor]
+        self.phase = q0 + nout*self.factor - len(x)
+        self.history = x[len(x)-ntaps+1:]
+        # compensate filter delay:
+        if self.skip > 0:
+            skip = min(self.skip, nout)
+            y = y[skip:]
+            self.skip -= skip
+        return y
+
+    def flush(self):
+        """Decimated data still held back by the filter delay.
+
+        Call this after the last block and reset() before starting a new stream.
+
+        Returns:
+          data (array): the remaining decimated data.
+        """
+        if self.history is None:
+            return np.zeros(0, dtype=self.dtype)
+        return self.process(np.zeros((self.delay*self.factor,) + self.history.shape[1:], dtype=self.dtype))
+
+    def blocks(self, data, block_size, start=0, stop=-1, channel=None):
+        """Generator for decimating consecutive data blocks.
+
+        Args:
+          data (array or DataLoader): the data.
+          block_size (int): number of data points read at once.
+          start (int): index of the first data point to be decimated.
+          stop (int): index after the last data point to be decimated.
+                      If negative decimate up to the end of the data.
+          channel (int or None): if not None the channel (second index) of the data to be decimated.
+
+        Yields:
+          data (array): the decimated data of each block. The decimated data
+                        held back by the filter are appended to the last block.
+        """
+        if stop < 0 or stop > len(data):
+            stop = len(data)
+        self.reset()
+        for inx0 in range(start, stop, block_size):
+            inx1 = min(inx0 + block_size, stop)
+            if channel is None:
+                block = data[inx0:inx1]
+            else:
+                block = data[inx0:inx1, channel]
+            y = self.process(block)
+            if inx1 >= stop:
+                y = np.concatenate((y, self.flush()))
+            yield y
+
+
+def decimate(data, samplerate, analysis_rate=0.0, taps_per_phase=32, dtype=np.float64):
+    """Anti-aliased decimation of data to a sampling rate of at least analysis_rate.
+
+    Args:
+      data (array): the data. Time is the first dimension.
+      samplerate (float): sampling rate of the data in Hertz.
+      analysis_rate (float): minimum sampling rate in Hertz used for the analysis.
+                             If not larger than zero the data are returned unchanged.
+      taps_per_phase (int): number of filter coefficients per polyphase component.
+      dtype (numpy dtype): the floating point type of the decimated data.
+
+    Returns:
+      data (array): the decimated data.
+      samplerate (float): the sampling rate of the decimated data.
+    """
+    factor = decimation_factor(samplerate, analysis_rate)
+    if factor <= 1:
+        return data, samplerate
+    decimator = Decimator(samplerate, factor, taps_per_phase, dtype)
+    y = decimator.process(data)
+    return np.concatenate((y, decimator.flush())), decimator.out_samplerate
+
+
+def add_decimation_config(cfg, analysis_rate=0.0, taps_per_phase=32):
+    """ Add parameter needed for decimate() as
+    a new section to a configuration.
+
+    Args:
+      cfg (ConfigFile): the configuration
+      See decimate() for details on the remaining arguments.
+    """
+    cfg.add_section('Decimation:')
+    cfg.add('analysisRate', analysis_rate, 'Hz',
+            'Decimate the data to at least this sampling rate before the analysis. If zero do not decimate.')
+    cfg.add('decimationTaps', taps_per_phase, '',
+            'Number of filter coefficients per polyphase component of the anti-aliasing filter.')
+
+
+def decimation_args(cfg):
+    """ Translates a configuration to the
+    respective parameter names of the function decimate().
+    The return value can then be passed as key-word arguments to this function.
+
+    Args:
+      cfg (ConfigFile): the configuration
+
+    Returns:
+      a (dict): dictionary with names of arguments of the decimate() function and their values as supplied by cfg.
+    """
+    return cfg.map({'analysis_rate': 'analysisRate',
+                    'taps_per_phase': 'decimationTaps'})
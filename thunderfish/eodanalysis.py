@@ -5,7 +5,7 @@ eod_waveform(): calculates a mean EOD of a given dataset.
 """
 
 import numpy as np
-from .peakdetection import percentile_threshold, detect_peaks, snippets
+from .peakdetection import percentile_threshold, detect_peaks, snippets_mean_std
 
 
 def eod_waveform(data, samplerate, th_factor=0.8, percentile=0.1, start=None, stop=None):
@@ -45,12 +45,8 @@ def eod_waveform(data, samplerate, th_factor=0.8, percentile=0.1, start=None, st
     start_inx = int(start * samplerate)
     stop_inx = int(stop * samplerate)
 
-    # extract snippets:
-    eod_snippets = snippets(data, eod_idx, start_inx, stop_inx)
-
-    # mean and std of snippets:    
-    mean_eod = np.mean(eod_snippets, axis=0)
-    std_eod = np.std(eod_snippets, axis=0, ddof=1)
+    # mean and std of snippets:
+    mean_eod, std_eod = snippets_mean_std(data, eod_idx, start_inx, stop_inx, ddof=1)
 
     # time axis:
     time = (np.arange(len(mean_eod)) + start_inx) / samplerate
@@ -9,7 +9,7 @@ from .configfile import ConfigFile
 from .harmonicgroups import add_psd_peak_detection_config, add_harmonic_groups_config, colors_markers
 from .bestwindow import add_clip_config, add_best_window_config, best_window_args
 from .dataloader import open_data
-from .powerspectrum import nfft_noverlap, decibel
+from .powerspectrum import nfft_noverlap, decibel, spectrogram_engine
 from .harmonicgroups import harmonic_groups, harmonic_groups_args, psd_peak_detection_args
 from .bestwindow import clip_amplitudes, clip_args, best_window_indices
 try:
@@ -215,7 +215,8 @@ class SignalPlot:
         if t00 < 0:
             t00 = 0
             t11 = w
-        power, freqs = ml.psd(self.data[t00:t11], NFFT=nfft, noverlap=noverlap, Fs=self.samplerate, detrend=ml.detrend_mean)
+        engine = spectrogram_engine(self.samplerate, nfft, noverlap, detrend=ml.detrend_mean)
+        power, freqs = engine.psd(self.data[t00:t11])
         self.deltaf = freqs[1] - freqs[0]
         # detect fish:
         h_kwargs = psd_peak_detection_args(self.cfg)
@@ -226,8 +227,8 @@ class SignalPlot:
 
         # spectrogram:
         t2 = t1 + nfft
-        specpower, freqs, bins = ml.specgram(self.data[t0:t2], NFFT=nfft, Fs=self.samplerate, noverlap=nfft // 2,
-                                             detrend=ml.detrend_mean)
+        engine = spectrogram_engine(self.samplerate, nfft, nfft // 2, detrend=ml.detrend_mean)
+        specpower, freqs, bins = engine.spectrogram(self.data[t0:t2])
         z = decibel(specpower)
         z = np.flipud(z)
         extent = self.toffset, self.toffset + np.amax(bins), freqs[0], freqs[-1]
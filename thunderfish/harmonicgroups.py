@@ -2,9 +2,15 @@
 
 harmonic_groups(): detect peaks in a power spectrum and groups them
                    according to their harmonic structure.
+harmonic_groups_batch(): harmonic groups of a stack of power spectra.
+batch_groups(): list of harmonic groups of a single power spectrum
+                from the result of harmonic_groups_batch().
 
 extract_fundamentals(): collect harmonic groups from lists of power spectrum peaks.
+mains_harmonics(): find frequencies that are harmonics of the mains frequency.
+harmonic_candidates(): indices of frequencies that are harmonics of a fundamental frequency.
 threshold_estimate(): estimates thresholds for peak detection in a power spectrum.
+ThresholdEstimator: running estimate of thresholds for consecutive power spectra.
 
 fundamental_freqs(): extract the fundamental frequencies from lists of harmonic groups
                      as returned by harmonic_groups().
@@ -14,8 +20,9 @@ plot_psd_harmonic_groups(): Plot decibel power-spectrum with detected peaks, har
 """
 
 from __future__ import print_function
+from collections import namedtuple
 import numpy as np
-from .peakdetection import detect_peaks, accept_peaks_size_width, hist_threshold
+from .peakdetection import detect_peaks_size_width, hist_threshold, QuantileSketch
 from .powerspectrum import decibel, plot_decibel_psd
 try:
     import matplotlib.pyplot as plt
@@ -24,10 +31,32 @@ except ImportError:
     pass
 
 
+def harmonic_candidates(freqs, fzero, freqtol, all_freqs=False):
+    """Indices of frequencies that are within a tolerance of harmonics of a fundamental frequency.
+
+    Args:
+        freqs (1-D numpy array): frequencies.
+        fzero (float): the fundamental frequency.
+        freqtol (float): each frequency divided by its harmonic number has to deviate
+                         by less than freqtol from fzero.
+        all_freqs (boolean): if True return the indices of all frequencies.
+
+    Returns:
+        indices (1-D numpy array): indices of the frequencies that are harmonics of fzero.
+    """
+    if all_freqs:
+        return np.arange(len(freqs))
+    n = np.rint(freqs / fzero)
+    inx = np.nonzero(n)[0]
+    nd = np.abs((freqs[inx] / n[inx]) - fzero)
+    return inx[~(nd > freqtol)]
+
+
 def build_harmonic_group(freqs, more_freqs, deltaf, verbose=0, min_freq=20.0, max_freq=2000.0,
                          freq_tol_fac=0.7, max_divisor=4, max_upper_fill=1,
                          max_double_use_harmonics=8, max_double_use_count=1,
-                         max_fill_ratio=0.25, power_n_harmonics=10, **kwargs):
+                         max_fill_ratio=0.25, power_n_harmonics=10,
+                         start_inx=-1, divisors=None, **kwargs):
     """Find all the harmonics belonging to the largest peak in a list of frequency peaks.
 
     Args:
@@ -50,6 +79,11 @@ def build_harmonic_group(freqs, more_freqs, deltaf, verbose=0, min_freq=20.0, ma
         max_fill_ratio (float): maximum allowed fraction of filled in frequencies.
         power_n_harmonics (int): maximum number of harmonics over which the total power
                                  of the signal is computed.
+        start_inx (int): index of the peak in freqs the harmonic group is built for.
+                         If negative, the largest peak is used.
+        divisors (list of int or None): divisors of the frequency of the start peak
+                                        that are tried as fundamental frequency.
+                                        If None, all divisors up to max_divisor are tried.
     
     Returns:
         freqs (2-D numpy array): list of strong frequencies with the frequencies of group removed
@@ -61,7 +95,7 @@ def build_harmonic_group(freqs, more_freqs, deltaf, verbose=0, min_freq=20.0, ma
     """
     
     # start at the strongest frequency:
-    fmaxinx = np.argmax(freqs[:, 1])
+    fmaxinx = start_inx if start_inx >= 0 else np.argmax(freqs[:, 1])
     fmax = freqs[fmaxinx, 0]
     if verbose > 1:
         print('')
@@ -69,7 +103,7 @@ def build_harmonic_group(freqs, more_freqs, deltaf, verbose=0, min_freq=20.0, ma
         print('freqs:     ', '[', ', '.join(['{:.2f}'.format(f) for f in freqs[:, 0]]), ']')
         print('more_freqs:', '[', ', '.join(
             ['{:.2f}'.format(f) for f in more_freqs[:, 0] if f < max_freq]), ']')
-        print('## fmax is: {0: .2f}Hz: {1:.5g} ##\n'.format(fmax, np.max(freqs[:, 1])))
+        print('## fmax is: {0: .2f}Hz: {1:.5g} ##\n'.format(fmax, freqs[fmaxinx, 1]))
 
     # container for harmonic groups
     best_group = list()
@@ -81,6 +115,8 @@ def build_harmonic_group(freqs, more_freqs, deltaf, verbose=0, min_freq=20.0, ma
     best_fzero_harmonics = 0
 
     freqtol = freq_tol_fac * deltaf
+    # freqs sorted by frequency allow for a fast search of the frequencies of a group:
+    sorted_freqs = np.all(np.diff(freqs[:, 0]) >= 0.0)
 
     # ###########################################
     # SEARCH FOR THE REST OF THE FREQUENCY GROUP
@@ -90,7 +126,9 @@ def build_harmonic_group(freqs, more_freqs, deltaf, verbose=0, min_freq=20.0, ma
     # by a range of integer divisors.
     # We do this, because fmax could just be a strong harmonic of the harmonic group
 
-    for divisor in range(1, max_divisor + 1):
+    if divisors is None:
+        divisors = range(1, max_divisor + 1)
+    for divisor in divisors:
 
         # define the hypothesized fundamental, which is compared to all higher frequencies:
         fzero = fmax / divisor
@@ -109,7 +147,12 @@ def build_harmonic_group(freqs, more_freqs, deltaf, verbose=0, min_freq=20.0, ma
         npre = -1  # previous harmonics
         ndpre = 0.0  # difference of previous frequency
         connected = True
-        for j in range(freqs.shape[0]):
+        # only harmonics of fzero can be taken (check all frequencies for verbose output):
+        candidates = harmonic_candidates(freqs[:, 0], fzero, freqtol, verbose > 2)
+        c = 0
+        while c < len(candidates):
+            j = candidates[c]
+            c += 1
 
             if verbose > 2:
                 print('check freq {:3d} {:8.2f} '.format(j, freqs[j, 0]), end='')
@@ -184,6 +227,9 @@ def build_harmonic_group(freqs, more_freqs, deltaf, verbose=0, min_freq=20.0, ma
                 fzero_harmonics = int(n)
                 if verbose > 2:
                     print('adjusted fzero to', fzero)
+                # remaining harmonics of the adjusted fzero:
+                candidates = j + 1 + harmonic_candidates(freqs[j + 1:, 0], fzero, freqtol, verbose > 2)
+                c = 0
 
         if verbose > 3:
             print('newgroup:', divisor, fzero, newgroup)
@@ -195,7 +241,8 @@ def build_harmonic_group(freqs, more_freqs, deltaf, verbose=0, min_freq=20.0, ma
 
         # ###########################################
         # SEARCH ALL DETECTED FREQUENCIES in morefreqs
-        for j in range(more_freqs.shape[0]):
+        # (only harmonics of fzero can be taken, check all frequencies for verbose output):
+        for j in harmonic_candidates(more_freqs[:, 0], fzero, freqtol, verbose > 3):
 
             if verbose > 3:
                 print('check more_freq %3d %8.2f ' % (j, more_freqs[j, 0]), end='')
@@ -304,11 +351,16 @@ def build_harmonic_group(freqs, more_freqs, deltaf, verbose=0, min_freq=20.0, ma
                 # existing frequency peak:
                 f = more_freqs[newmoregroup[j], 0]
                 # find this frequency in freqs:
-                for k in range(fk, freqs.shape[0]):
+                k0 = fk
+                if sorted_freqs:
+                    k0 = max(fk, np.searchsorted(freqs[:, 0], f - 2.0e-8))
+                for k in range(k0, freqs.shape[0]):
                     if np.abs(freqs[k, 0] - f) < 1.0e-8:
                         newgroup.append(k)
                         fk = k + 1
                         break
+                    if sorted_freqs and freqs[k, 0] > f + 2.0e-8:
+                        break
                 if fk >= freqs.shape[0]:
                     break
 
@@ -405,8 +457,7 @@ def build_harmonic_group(freqs, more_freqs, deltaf, verbose=0, min_freq=20.0, ma
                                                                              group[i, 1], group[i, 1] / group[refi, 1]))
 
     # erase from freqs:
-    for inx in reversed(best_group):
-        freqs = np.delete(freqs, inx, axis=0)
+    freqs = np.delete(freqs, best_group, axis=0)
 
     # freqs: removed all frequencies of bestgroup
     # more_freqs: updated double use count
@@ -420,7 +471,7 @@ def extract_fundamentals(good_freqs, all_freqs, deltaf, verbose=0, freq_tol_fac=
                          max_divisor=4, max_upper_fill=1,
                          max_double_use_harmonics=8, max_double_use_count=1,
                          max_fill_ratio=0.25, power_n_harmonics=10,
-                         min_group_size=3, max_harmonics=0, **kwargs):
+                         min_group_size=3, max_harmonics=0, prior_freqs=None, **kwargs):
     """Extract fundamental frequencies from power-spectrum peaks.
                          
     Args:
@@ -447,6 +498,11 @@ def extract_fundamentals(good_freqs, all_freqs, deltaf, verbose=0, freq_tol_fac=
         min_group_size (int): minimum required number of harmonics that are not filled in and
                               are not part of other, so far detected,  harmonics groups.
         max_harmonics (int): maximum number of harmonics to be returned for each group.
+        prior_freqs (1-D array or None): warm start with fundamental frequencies expected
+            in the power spectrum, e.g. the ones of the previous power spectrum of a spectrogram.
+            Harmonic groups are first built for these fundamentals and their harmonics,
+            only the remaining peaks are searched for further harmonic groups.
+            If a prior harmonic group is not confirmed, its peaks are left to the full search.
 
     Returns:
         group_list (list of 2-D numpy arrays): list of all harmonic groups found sorted
@@ -463,23 +519,137 @@ def extract_fundamentals(good_freqs, all_freqs, deltaf, verbose=0, freq_tol_fac=
     # set double use count to zero:
     all_freqs[:, 4] = 0.0
 
-    freqtol = freq_tol_fac * deltaf
-
     # remove power line harmonics from good_freqs:
     # XXX might be improved!!!
     if mains_freq > 0.0:
-        pfreqtol = 1.0  # 1 Hz tolerance
-        for inx in reversed(range(len(good_freqs))):
-            n = np.round(good_freqs[inx, 0] / mains_freq)
-            nd = np.abs(good_freqs[inx, 0] - n * mains_freq)
-            if nd <= pfreqtol:
-                if verbose > 1:
-                    print('remove power line frequency', inx, good_freqs[inx, 0], np.abs(
-                        good_freqs[inx, 0] - n * mains_freq))
-                good_freqs = np.delete(good_freqs, inx, axis=0)
+        mains_inx = mains_harmonics(good_freqs[:, 0], mains_freq)
+        if verbose > 1:
+            for inx in reversed(np.nonzero(mains_inx)[0]):
+                print('remove power line frequency', inx, good_freqs[inx, 0], np.abs(
+                    good_freqs[inx, 0] - np.round(good_freqs[inx, 0] / mains_freq) * mains_freq))
+        good_freqs = good_freqs[~mains_inx]
+
+    group_list, fzero_harmonics_list = \
+        _extract_groups(good_freqs, all_freqs, deltaf, verbose, freq_tol_fac,
+                        mains_freq, min_freq, max_freq, max_divisor, max_upper_fill,
+                        max_double_use_harmonics, max_double_use_count,
+                        max_fill_ratio, power_n_harmonics, min_group_size,
+                        max_harmonics, prior_freqs)
+
+    # assemble mains frequencies from all_freqs:
+    mains_list = []
+    if mains_freq > 0.0:
+        mains_list = all_freqs[mains_harmonics(all_freqs[:, 0], mains_freq), 0:2]
+        if len(mains_list) == 0:
+            mains_list = []
+                
+    return group_list, fzero_harmonics_list, np.array(mains_list)
+
+
+def mains_harmonics(freqs, mains_freq, pfreqtol=1.0):
+    """Find frequencies that are close to harmonics of the mains frequency.
+
+    Args:
+        freqs (array): frequencies.
+        mains_freq (float): frequency of the mains power supply.
+        pfreqtol (float): tolerance in Hertz.
+
+    Returns:
+        mains_inx (boolean array): True for frequencies that are harmonics of the mains frequency.
+    """
+    n = np.round(freqs / mains_freq)
+    nd = np.abs(freqs - n * mains_freq)
+    return nd <= pfreqtol
+
+
+def _check_group(harm_group, freqtol, mains_freq, min_freq, max_freq, min_group_size):
+    """Check whether a harmonic group is accepted.
+
+    See extract_fundamentals() for a description of the arguments.
+
+    Returns:
+        group_size (int): number of harmonics which have been detected,
+                          are not fill-ins, and are not doubly used.
+        group_size_ok (bool): group_size is at least min_group_size.
+        fundamental_ok (bool): the fundamental frequency is within min_freq and max_freq.
+        mains_ok (bool): the fundamental frequency is not the mains frequency.
+    """
+    # count number of harmonics which have been detected, are not fill-ins,
+    # and are not doubly used:
+    group_size = np.sum((harm_group[:, 1] > 0.0) & (harm_group[:, 4] < 2.0))
+    group_size_ok = (group_size >= min_group_size)
+
+    # check frequency range of fundamental:
+    fundamental_ok = (harm_group[0, 0] >= min_freq and
+                      harm_group[0, 0] <= max_freq)
+
+    # check power hum (does this really ever happen???):
+    mains_ok = ((mains_freq == 0.0) |
+                (np.abs(harm_group[0, 0] - mains_freq) > freqtol))
+    return group_size, group_size_ok, fundamental_ok, mains_ok
+
+
+def _extract_groups(good_freqs, all_freqs, deltaf, verbose, freq_tol_fac,
+                    mains_freq, min_freq, max_freq, max_divisor, max_upper_fill,
+                    max_double_use_harmonics, max_double_use_count,
+                    max_fill_ratio, power_n_harmonics, min_group_size,
+                    max_harmonics, prior_freqs=None):
+    """Collect harmonic groups from power spectrum peaks with mains frequencies already removed.
+
+    See extract_fundamentals() for a description of the arguments.
+
+    Returns:
+        group_list (list of 2-D numpy arrays): list of all harmonic groups found sorted
+            by fundamental frequency.
+        fzero_harmonics_list (list of int): the harmonics from which the fundamental frequencies were computed.
+    """
+    freqtol = freq_tol_fac * deltaf
 
     group_list = list()
     fzero_harmonics_list = list()
+
+    # warm start: first build harmonic groups for the prior fundamental frequencies:
+    if prior_freqs is not None and len(prior_freqs) > 0 and len(good_freqs) > 0:
+        # for each prior fundamental the strongest of its harmonics:
+        starts = []
+        for f0 in prior_freqs:
+            inx = harmonic_candidates(good_freqs[:, 0], f0, freqtol)
+            inx = inx[np.rint(good_freqs[inx, 0] / f0) <= max_divisor]
+            if len(inx) == 0:
+                if verbose > 0:
+                    print('No peaks found for prior fundamental %.2fHz' % f0)
+                continue
+            k = inx[np.argmax(good_freqs[inx, 1])]
+            starts.append((good_freqs[k, 1], good_freqs[k, 0], int(np.rint(good_freqs[k, 0] / f0))))
+        # strongest first:
+        for _, fstart, divisor in sorted(starts, reverse=True):
+            inx = np.nonzero(good_freqs[:, 0] == fstart)[0]
+            if len(inx) == 0:
+                # already used by another harmonic group:
+                continue
+            double_use = all_freqs[:, 4].copy()
+            freqs, all_freqs, harm_group, fzero_harmonics, fmax = \
+                build_harmonic_group(good_freqs, all_freqs, deltaf,
+                                     verbose, min_freq, max_freq, freq_tol_fac,
+                                     max_divisor, max_upper_fill,
+                                     max_double_use_harmonics, max_double_use_count,
+                                     max_fill_ratio, power_n_harmonics,
+                                     start_inx=inx[0], divisors=[divisor])
+            if harm_group.shape[0] > 0 and \
+               all(_check_group(harm_group, freqtol, mains_freq, min_freq, max_freq,
+                                min_group_size)[1:]):
+                if verbose > 0:
+                    print('Confirmed prior harmonic group: {:.2f}Hz p={:10.8f}'.format(
+                        harm_group[0, 0], np.sum(harm_group[:, 1])))
+                good_freqs = freqs
+                group_list.append(harm_group[:, 0:2])
+                fzero_harmonics_list.append(fzero_harmonics)
+            else:
+                # leave the peaks to the full search:
+                if verbose > 0:
+                    print('Prior harmonic group for fmax=%.2fHz not confirmed' % fmax)
+                all_freqs[:, 4] = double_use
+        
     # as long as there are frequencies left in good_freqs:
     while good_freqs.shape[0] > 0:
         # we check for harmonic groups:
@@ -499,18 +669,8 @@ def extract_fundamentals(good_freqs, all_freqs, deltaf, verbose=0, freq_tol_fac=
                 print('Nothing found for fmax=%.2fHz' % fmax)
             continue
 
-        # count number of harmonics which have been detected, are not fill-ins,
-        # and are not doubly used:
-        group_size = np.sum((harm_group[:, 1] > 0.0) & (harm_group[:, 4] < 2.0))
-        group_size_ok = (group_size >= min_group_size)
-
-        # check frequency range of fundamental:
-        fundamental_ok = (harm_group[0, 0] >= min_freq and
-                          harm_group[0, 0] <= max_freq)
-
-        # check power hum (does this really ever happen???):
-        mains_ok = ((mains_freq == 0.0) |
-                    (np.abs(harm_group[0, 0] - mains_freq) > freqtol))
+        group_size, group_size_ok, fundamental_ok, mains_ok = \
+            _check_group(harm_group, freqtol, mains_freq, min_freq, max_freq, min_group_size)
 
         # check:
         if group_size_ok and fundamental_ok and mains_ok:
@@ -551,17 +711,7 @@ def extract_fundamentals(good_freqs, all_freqs, deltaf, verbose=0, freq_tol_fac=
         else:
             print('## NO FUNDAMENTALS FOUND ##')
 
-    # assemble mains frequencies from all_freqs:
-    mains_list = []
-    if mains_freq > 0.0:
-        pfreqtol = 1.0
-        for inx in range(len(all_freqs)):
-            n = np.round(all_freqs[inx, 0] / mains_freq)
-            nd = np.abs(all_freqs[inx, 0] - n * mains_freq)
-            if nd <= pfreqtol:
-                mains_list.append(all_freqs[inx, 0:2])
-                
-    return group_list, fzero_harmonics_list, np.array(mains_list)
+    return group_list, fzero_harmonics_list
 
 
 def threshold_estimate(data, noise_factor=6.0, nbins=100, hist_height=1.0/ np.sqrt(np.e),
@@ -573,7 +723,8 @@ def threshold_estimate(data, noise_factor=6.0, nbins=100, hist_height=1.0/ np.sq
     the width of the histogram of the data at hist_height relative height.
 
     Args:
-        data: the data from which to estimate the thresholds
+        data: the data from which to estimate the thresholds,
+              or a QuantileSketch filled with the data (e.g. of many power spectra).
         noise_factor (float): factor by which the width of the histogram is multiplied to set the low_threshold.
         nbins (int or list of floats): number of bins or the bins for computing the histogram.
         hist_height (float): height between 0 and 1 at which the width of the histogram is computed.
@@ -588,7 +739,18 @@ def threshold_estimate(data, noise_factor=6.0, nbins=100, hist_height=1.0/ np.sq
     """
 
     # estimate noise standard deviation:
-    hist, bins = np.histogram(data, nbins, density=True)
+    if isinstance(data, QuantileSketch):
+        hist, bins = data.histogram(nbins)
+    else:
+        hist, bins = np.histogram(data, nbins, density=True)
+    return _histogram_thresholds(hist, bins, noise_factor, hist_height, peak_factor)
+
+
+def _histogram_thresholds(hist, bins, noise_factor, hist_height, peak_factor):
+    """Thresholds for peak detection from a histogram of a decibel power spectrum.
+
+    See threshold_estimate() for details.
+    """
     inx = hist > np.max(hist) * hist_height
     lower = bins[0:-1][inx][0]
     upper = bins[1:][inx][-1]  # needs to return the next bin
@@ -615,6 +777,137 @@ def threshold_estimate(data, noise_factor=6.0, nbins=100, hist_height=1.0/ np.sq
     return lowthreshold, highthreshold, center
 
 
+class ThresholdEstimator(object):
+    """
+    Running estimate of thresholds for peak detection in consecutive decibel power spectra.
+
+    Instead of computing a new histogram for each power spectrum as threshold_estimate() does,
+    the counts of each power spectrum are added to a decaying histogram.
+    The bins are set by the first power spectrum and are extended to the range of the
+    following ones. Pairs of bins are merged whenever there are more than twice nbins bins.
+    Power spectra without any spread do not contribute to the histogram.
+    The thresholds are recomputed from the histogram for each of the first 1/(1-decay)
+    power spectra, then every 1/(1-decay) power spectra, or whenever
+    mean or standard deviation of the histogram changed by more than tolerance
+    since the last computation.
+
+    Usage:
+    ```
+    estimator = ThresholdEstimator(decay=0.9)
+    for psd in psds:
+        groups = harmonic_groups(freqs, psd, estimator=estimator)
+    ```
+
+    Member variables:
+      noise_factor (float): factor by which the width of the histogram is multiplied to set the low_threshold.
+      nbins (int or list of floats): number of bins spanning the range of the first power spectrum,
+                                     or the fixed bins of the histogram.
+      hist_height (float): height between 0 and 1 at which the width of the histogram is computed.
+      peak_factor (float): see threshold_estimate().
+      decay (float): factor by which the histogram is multiplied before adding the next power spectrum.
+                     Zero uses the histogram of the current power spectrum only.
+      tolerance (float): the thresholds are recomputed if mean or standard deviation of the
+                         histogram changed by more than this many decibel.
+      hist (1-D array): the decaying histogram.
+      bins (1-D array): the edges of the bins of the histogram.
+      thresholds (tuple or None): the current low threshold, high threshold, and center.
+    """
+
+    def __init__(self, noise_factor=6.0, nbins=100, hist_height=1.0/np.sqrt(np.e),
+                 peak_factor=5.0, decay=0.9, tolerance=0.5):
+        """
+        See the description of the member variables for the arguments.
+        """
+        self.noise_factor = noise_factor
+        self.nbins = nbins
+        self.hist_height = hist_height
+        self.peak_factor = peak_factor
+        self.decay = decay
+        self.tolerance = tolerance
+        self.reset()
+
+    def reset(self):
+        """Discard the histogram."""
+        self.hist = None
+        self.bins = None
+        self.thresholds = None
+        self.level = 0.0
+        self.spread = 0.0
+        self.count = 0
+        self.last_count = 0
+
+    def update(self, data):
+        """Add a decibel power spectrum to the histogram and return the thresholds.
+
+        Args:
+          data (array): the part of the decibel power spectrum from which to estimate the thresholds.
+
+        Returns:
+          low_threshold (float): the threshold just above the noise floor
+          high_threshold (float): the threshold for clear peaks
+          center: (float): estimate of the median of the data without peaks
+        """
+        data = np.asarray(data)
+        data = data[np.isfinite(data)]
+        if len(data) == 0 or np.max(data) <= np.min(data):
+            # no information about the noise floor, do not spoil the histogram:
+            if self.thresholds is None and len(data) > 0:
+                thresholds = threshold_estimate(data, self.noise_factor, self.nbins,
+                                                self.hist_height, self.peak_factor)
+                return tuple(data.dtype.type(t) for t in thresholds)
+            return self.thresholds
+        if self.bins is None:
+            if np.isscalar(self.nbins):
+                self.bins = np.linspace(np.min(data), np.max(data), self.nbins + 1)
+            else:
+                self.bins = np.asarray(self.nbins, dtype=float)
+            self.hist = np.zeros(len(self.bins) - 1)
+        if np.isscalar(self.nbins):
+            width = self.bins[1] - self.bins[0]
+            inx = np.floor((data - self.bins[0])/width).astype(int)
+            if len(inx) > 0:
+                # extend the bins to the range of the data:
+                nleft = max(0, -np.min(inx))
+                nright = max(0, np.max(inx) - len(self.hist) + 1)
+                if nleft > 0 or nright > 0:
+                    self.bins = self.bins[0] + width*np.arange(-nleft, len(self.hist) + nright + 1)
+                    self.hist = np.concatenate((np.zeros(nleft), self.hist, np.zeros(nright)))
+                    inx += nleft
+                # merge pairs of bins until there are at most twice nbins bins:
+                while len(self.hist) > 2*self.nbins:
+                    if len(self.hist) % 2 == 1:
+                        self.hist = np.append(self.hist, 0.0)
+                    self.hist = np.sum(self.hist.reshape((-1, 2)), axis=1)
+                    width *= 2.0
+                    self.bins = self.bins[0] + width*np.arange(len(self.hist) + 1)
+                    inx //= 2
+        else:
+            inx = np.searchsorted(self.bins, data, side='right') - 1
+        inx = np.clip(inx, 0, len(self.hist) - 1)
+        self.hist *= self.decay
+        self.hist += np.bincount(inx, minlength=len(self.hist))
+        self.count += 1
+        # recompute thresholds while the histogram warms up, periodically afterwards,
+        # or if mean or standard deviation of the histogram changed:
+        norm = np.sum(self.hist)
+        centers = 0.5*(self.bins[:-1] + self.bins[1:])
+        level = np.sum(self.hist*centers)/norm
+        spread = np.sqrt(np.sum(self.hist*(centers - level)**2)/norm)
+        period = 1.0/(1.0 - self.decay) if self.decay < 1.0 else np.inf
+        if self.thresholds is None or self.count <= period or \
+           self.count - self.last_count >= period or \
+           np.abs(level - self.level) > self.tolerance or \
+           np.abs(spread - self.spread) > self.tolerance:
+            self.level = level
+            self.spread = spread
+            self.last_count = self.count
+            thresholds = _histogram_thresholds(self.hist, self.bins, self.noise_factor,
+                                               self.hist_height, self.peak_factor)
+            # in the precision of the power spectrum as returned by threshold_estimate():
+            self.thresholds = tuple(data.dtype.type(t) for t in thresholds)
+        return self.thresholds
+
+
 def harmonic_groups(psd_freqs, psd, verbose=0, low_threshold=0.0, high_threshold=0.0,
                     thresh_bins=100, noise_fac=6.0, peak_fac=0.5,
                     max_peak_width_fac=3.5, min_peak_width=1.0,
@@ -622,12 +915,13 @@ def harmonic_groups(psd_freqs, psd, verbose=0, low_threshold=0.0, high_threshold
                     max_work_freq=4000.0, max_divisor=4, max_upper_fill=1,
                     max_double_use_harmonics=8, max_double_use_count=1,
                     max_fill_ratio=0.25, power_n_harmonics=10,
-                    min_group_size=3, max_harmonics=0, **kwargs):
+                    min_group_size=3, max_harmonics=0, prior_freqs=None, estimator=None, **kwargs):
     """Detect peaks in power spectrum and extract fundamentals of harmonic groups.
 
     Args:
         psd_freqs (array): frequencies of the power spectrum
-        psd (array): power spectrum (linear, not decible)
+        psd (array): power spectrum (linear, not decible). A single precision (np.float32)
+                     power spectrum is transformed to a single precision decibel spectrum.
         verbose (int): verbosity level
         low_threshold (float): the relative threshold for detecting all peaks
                                in the decibel spectrum.
@@ -664,6 +958,11 @@ def harmonic_groups(psd_freqs, psd, verbose=0, low_threshold=0.0, high_threshold
         min_group_size (int): minimum required number of harmonics that are not filled in and
                               are not part of other, so far detected,  harmonics groups.
         max_harmonics (int): maximum number of harmonics to be returned for each group.
+        prior_freqs (1-D array or None): fundamental frequencies expected in the power spectrum
+                                         used for a warm start of extract_fundamentals().
+        estimator (ThresholdEstimator or None): if given and no thresholds are specified,
+            the thresholds are estimated by this running estimator instead of
+            threshold_estimate() (thresh_bins, noise_fac, and peak_fac are then ignored).
 
     Returns:
         group_list (list of 2-D numpy arrays): list of all extracted harmonic groups, sorted
@@ -693,9 +992,12 @@ def harmonic_groups(psd_freqs, psd, verbose=0, low_threshold=0.0, high_threshold
     center = np.NaN
     if low_threshold <= 0.0 or high_threshold <= 0.0:
         n = len(log_psd)
-        low_threshold, high_threshold, center = threshold_estimate(log_psd[2 * n // 3:n * 9 // 10],
-                                                                   noise_fac, thresh_bins,
-                                                                   peak_factor=peak_fac)
+        if estimator is not None:
+            low_threshold, high_threshold, center = estimator.update(log_psd[2 * n // 3:n * 9 // 10])
+        else:
+            low_threshold, high_threshold, center = threshold_estimate(log_psd[2 * n // 3:n * 9 // 10],
+                                                                       noise_fac, thresh_bins,
+                                                                       peak_factor=peak_fac)
         
         if verbose > 1:
             print('')
@@ -704,8 +1006,7 @@ def harmonic_groups(psd_freqs, psd, verbose=0, low_threshold=0.0, high_threshold
             print('center=', center)
 
     # detect peaks in decibel power spectrum:
-    all_freqs, _ = detect_peaks(log_psd, low_threshold, psd_freqs,
-                                accept_peaks_size_width)
+    all_freqs = detect_peaks_size_width(log_psd, low_threshold, psd_freqs)
 
     if len(all_freqs) == 0:
         # TODO: Why has not been a peak detected?
@@ -733,11 +1034,171 @@ def harmonic_groups(psd_freqs, psd, verbose=0, low_threshold=0.0, high_threshold
                                                           max_double_use_harmonics,
                                                           max_double_use_count,max_fill_ratio,
                                                           power_n_harmonics, min_group_size,
-                                                          max_harmonics)
+                                                          max_harmonics, prior_freqs)
 
     return groups, fzero_harmonics, mains, all_freqs, freqs[:, 0], low_threshold, high_threshold, center
 
 
+HarmonicGroupsBatch = namedtuple('HarmonicGroupsBatch',
+                                 ['group_offsets', 'fundamentals', 'fzero_harmonics',
+                                  'harmonic_offsets', 'harmonics',
+                                  'low_thresholds', 'high_thresholds', 'centers'])
+"""Harmonic groups of a stack of power spectra as returned by harmonic_groups_batch().
+
+The harmonic groups of the p-th power spectrum are the groups
+group_offsets[p] to group_offsets[p+1] (excluding).
+The harmonics of the g-th group are the rows harmonic_offsets[g]
+to harmonic_offsets[g+1] (excluding) of harmonics.
+
+Members:
+    group_offsets (1-D array of ints): index of the first group of each power spectrum,
+        the last element is the total number of groups.
+    fundamentals (1-D array): fundamental frequency of each group.
+    fzero_harmonics (1-D array of ints): the harmonics from which the fundamental frequencies were computed.
+    harmonic_offsets (1-D array of ints): index of the first harmonic of each group,
+        the last element is the total number of harmonics.
+    harmonics (2-D array): frequency and power of the harmonics of all groups.
+    low_thresholds (1-D array): the low threshold used for each power spectrum.
+    high_thresholds (1-D array): the high threshold used for each power spectrum.
+    centers (1-D array): the baseline level of each power spectrum.
+"""
+
+
+def harmonic_groups_batch(psd_freqs, psds, verbose=0, low_threshold=0.0, high_threshold=0.0,
+                          thresh_bins=100, noise_fac=6.0, peak_fac=0.5,
+                          max_peak_width_fac=3.5, min_peak_width=1.0,
+                          freq_tol_fac=0.7, mains_freq=60.0, min_freq=0.0, max_freq=2000.0,
+                          max_work_freq=4000.0, max_divisor=4, max_upper_fill=1,
+                          max_double_use_harmonics=8, max_double_use_count=1,
+                          max_fill_ratio=0.25, power_n_harmonics=10,
+                          min_group_size=3, max_harmonics=0, warm_start=False, prior_freqs=None,
+                          estimator=None, batch_size=256, **kwargs):
+    """Detect peaks and extract fundamentals of harmonic groups in a stack of power spectra.
+
+    Returns the same harmonic groups as harmonic_groups() called on each power spectrum,
+    but computes the decibel power spectra, detects their peaks, and
+    removes the mains frequencies for many power spectra at once.
+
+    Args:
+        psd_freqs (array): frequencies of the power spectra
+        psds (2-D array): power spectra (linear, not decible), time as first
+                          and frequency as second dimension.
+        warm_start (bool): use the fundamental frequencies of each power spectrum as prior
+                           for the next one (see extract_fundamentals()).
+                           This speeds up the detection of harmonic groups in overlapping
+                           power spectra, but might result in slightly different groups.
+        prior_freqs (1-D array or None): fundamental frequencies expected in the first power spectrum
+                                         if warm_start is True.
+        estimator (ThresholdEstimator or None): running estimator of the thresholds
+                                                that is updated with each power spectrum.
+        batch_size (int): number of power spectra processed at once.
+        See harmonic_groups() for a description of the remaining arguments.
+
+    Returns:
+        groups (HarmonicGroupsBatch): the harmonic groups of all power spectra in columnar form.
+            Use batch_groups() to retrieve the list of groups of a single power spectrum
+            as returned by harmonic_groups().
+    """
+    nrows = len(psds)
+    deltaf = psd_freqs[1] - psd_freqs[0]
+    n = len(psd_freqs)
+    wthresh = max_peak_width_fac * deltaf
+    if wthresh < min_peak_width:
+        wthresh = min_peak_width
+    group_counts = []
+    fundamentals = []
+    fzero_harmonics = []
+    harmonic_counts = []
+    harmonics = []
+    low_thresholds = np.zeros(nrows)
+    high_thresholds = np.zeros(nrows)
+    centers = np.zeros(nrows) + np.NaN
+    for r0 in range(0, nrows, batch_size):
+        r1 = min(r0 + batch_size, nrows)
+
+        # decibel power spectra:
+        log_psds = decibel(psds[r0:r1])
+
+        # thresholds:
+        for r in range(r1 - r0):
+            if low_threshold <= 0.0 or high_threshold <= 0.0:
+                if estimator is not None:
+                    low_thresholds[r0 + r], high_thresholds[r0 + r], centers[r0 + r] = \
+                        estimator.update(log_psds[r, 2 * n // 3:n * 9 // 10])
+                else:
+                    low_thresholds[r0 + r], high_thresholds[r0 + r], centers[r0 + r] = \
+                        threshold_estimate(log_psds[r, 2 * n // 3:n * 9 // 10],
+                                           noise_fac, thresh_bins, peak_factor=peak_fac)
+            else:
+                low_thresholds[r0 + r] = low_threshold
+                high_thresholds[r0 + r] = high_threshold
+
+        # detect peaks in decibel power spectra,
+        # thresholds in the precision of the power spectra as in harmonic_groups():
+        all_peaks, offsets = detect_peaks_size_width(log_psds,
+                                                     low_thresholds[r0:r1].astype(log_psds.dtype),
+                                                     psd_freqs)
+        rows = np.repeat(np.arange(r1 - r0), np.diff(offsets))
+
+        # select good peaks:
+        good = ((all_peaks[:, 2] > high_thresholds[r0 + rows]) &
+                (all_peaks[:, 0] >= min_freq) &
+                (all_peaks[:, 0] <= max_work_freq) &
+                (all_peaks[:, 3] < wthresh))
+        # remove power line harmonics from good peaks:
+        if mains_freq > 0.0:
+            good &= ~mains_harmonics(all_peaks[:, 0], mains_freq)
+
+        # convert peak sizes back to power:
+        all_peaks[:, 1] = 10.0 ** (0.1 * all_peaks[:, 1])
+
+        # detect harmonic groups:
+        for r in range(r1 - r0):
+            all_freqs = all_peaks[offsets[r]:offsets[r + 1]]
+            freqs = all_freqs[good[offsets[r]:offsets[r + 1]]]
+            all_freqs[:, 4] = 0.0
+            groups = []
+            if len(all_freqs) > 0:
+                groups, fzero_harm = \
+                    _extract_groups(freqs, all_freqs, deltaf, verbose, freq_tol_fac,
+                                    mains_freq, min_freq, max_freq, max_divisor, max_upper_fill,
+                                    max_double_use_harmonics, max_double_use_count,
+                                    max_fill_ratio, power_n_harmonics, min_group_size,
+                                    max_harmonics, prior_freqs if warm_start else None)
+                fzero_harmonics.extend(fzero_harm)
+            prior_freqs = fundamental_freqs(groups)
+            group_counts.append(len(groups))
+            for group in groups:
+                fundamentals.append(group[0, 0])
+                harmonic_counts.append(len(group))
+                harmonics.append(group)
+
+    group_offsets = np.zeros(nrows + 1, dtype=int)
+    group_offsets[1:] = np.cumsum(group_counts)
+    harmonic_offsets = np.zeros(len(fundamentals) + 1, dtype=int)
+    harmonic_offsets[1:] = np.cumsum(harmonic_counts)
+    harmonics = np.vstack(harmonics) if len(harmonics) > 0 else np.zeros((0, 2))
+    return HarmonicGroupsBatch(group_offsets, np.array(fundamentals),
+                               np.array(fzero_harmonics, dtype=int),
+                               harmonic_offsets, harmonics,
+                               low_thresholds, high_thresholds, centers)
+
+
+def batch_groups(groups, index):
+    """List of harmonic groups of a single power spectrum.
+
+    Args:
+        groups (HarmonicGroupsBatch): harmonic groups as returned by harmonic_groups_batch().
+        index (int): index of the power spectrum.
+
+    Returns:
+        group_list (list of 2-D numpy arrays): list of the harmonic groups of the power spectrum,
+            as returned by harmonic_groups().
+    """
+    return [groups.harmonics[groups.harmonic_offsets[g]:groups.harmonic_offsets[g + 1]]
+            for g in range(groups.group_offsets[index], groups.group_offsets[index + 1])]
+
+
 def fundamental_freqs(group_list):
     """
     Extract the fundamental frequencies from lists of harmonic groups.
@@ -3,17 +3,23 @@ Detecting peaks in arrays.
 
 detect_peaks(): peak and trough detection with a relative threshold.
 detect_dynamic_peaks(): peak and trough detection with a dynamically adapted threshold.
+detect_peaks_size_width(): fast detection of peaks together with their size and width.
+PeakDetector: peak and trough detection in consecutive blocks of data.
 
 accept_peak(): make detect_peaks() return index/time and size of peaks.
 accept_peak_size_threshold(): adapt the dection threshold to the size of the detected peaks.
 accept_peaks_size_width(): make detect_peaks() return time, height, size, and width of peaks.
 
+QuantileSketch: mergeable streaming histogram for approximate quantiles.
+WindowedThreshold: thresholds of windows lazily broadcast to the data.
 std_threshold(): estimate detection threshold based on the standard deviation.
 hist_threshold(): esimate detection threshold based on a histogram of the data.
 minmax_threshold(): estimate detection threshold based on maximum minus minimum value.
 percentile_threshold(): estimate detection threshold based on interpercentile range.
 
+snippet_windows(): zero-copy access to data snippets around a list of indices.
 snippets(): cut out data snippets around a list of indices.
+snippets_mean_std(): mean and standard deviation of data snippets without materializing them.
 
 trim(): make the list of peaks and troughs returned by detect_peaks() the same length.
 trim_to_peak(): ensure that the peak is first.
@@ -21,18 +27,23 @@ trim_closest(): ensure that peaks minus troughs is smallest.
 """
 
 import numpy as np
+try:
+    from numpy.lib.stride_tricks import sliding_window_view
+except ImportError:
+    sliding_window_view = None
 
 
 def detect_peaks(data, threshold, time=None,
-                 check_peak_func=None, check_trough_func=None, **kwargs):
+                 check_peak_func=None, check_trough_func=None, axis=0, **kwargs):
     """
     Detect peaks and troughs using a fixed, relative threshold according to
     Bryan S. Todd and David C. Andrews (1999): The identification of peaks in physiological signals.
     Computers and Biomedical Research 32, 322-335.
 
     Args:
-        data (array): an 1-D array of input data where peaks are detected
-        threshold (float or array): a positive number setting the minimum distance between peaks and troughs
+        data (array): an 1-D array of input data where peaks are detected,
+          or a 2-D array with the data of several channels (see below)
+        threshold (float or array or WindowedThreshold): a positive number setting the minimum distance between peaks and troughs
         time (array): the (optional) 1-D array with the time corresponding to the data values
         check_peak_func (function): an optional function to be used for further evaluating and analysing a peak
           The signature of the function is
@@ -62,6 +73,7 @@ def detect_peaks(data, threshold, time=None,
                                     or None to skip the trough
             th (float): a new value for the threshold (is overwritten by an threshold array)
                         or None (to keep the original value)            
+        axis (int): for 2-D data the axis along which the data of each channel are arranged
         kwargs: arguments passed on to check_peak_func and check_trough_func
     
     Returns: 
@@ -71,11 +83,32 @@ def detect_peaks(data, threshold, time=None,
           if time is given and no check_peak_func/check_trough_func is given, then these are lists of the times where the peaks/troughs occur.
           if check_peak_func or check_trough_func is given, then these are lists of whatever check_peak_func/check_trough_func return.
 
+    Without check_peak_func and check_trough_func, peaks and troughs are detected with
+    array operations (see _peak_trough_events()) instead of looping through the data.
+
+    For 2-D data peaks and troughs are detected in each channel independently.
+    The threshold is then either a single number, an 1-D array with a threshold
+    for each channel, or an array of the shape of data. Results are returned
+    in a compact layout:
+        peak_list (np.array): the peaks of all channels
+        trough_list (np.array): the troughs of all channels
+        peak_offsets (np.array of ints): the peaks of channel i are
+          peak_list[peak_offsets[i]:peak_offsets[i+1]]
+        trough_offsets (np.array of ints): the troughs of channel i are
+          trough_list[trough_offsets[i]:trough_offsets[i+1]]
+    Indices are indices into the data of each channel.
+    Without check functions and with a single threshold or one threshold
+    per channel, all channels are processed at once.
+
     Raises:
         ValueError: if threshold <= 0.
         IndexError: if data, time, and threshold arrays differ in length.
     """
 
+    if np.ndim(data) > 1:
+        return _detect_channel_peaks(data, threshold, time, check_peak_func,
+                                     check_trough_func, axis, **kwargs)
+
     thresh_array = True
     thresh = 0.0
     if np.isscalar(threshold):
@@ -88,6 +121,9 @@ def detect_peaks(data, threshold, time=None,
     if time is not None and len(data) != len(time):
         raise IndexError('input arrays time and data must have same length!')
 
+    if not check_peak_func and not check_trough_func and len(data) > 0:
+        return _fast_detect_peaks(data, threshold, time)
+
     peaks_list = list()
     troughs_list = list()
 
@@ -240,6 +276,11 @@ def detect_dynamic_peaks(data, threshold, min_thresh, tau, time=None,
           if time is given and no check_peak_func/check_trough_func is given, then these are lists of the times where the peaks/troughs occur.
           if check_peak_func or check_trough_func is given, then these are lists of whatever check_peak_func/check_trough_func return.
 
+    The decay of the threshold is computed up to its fixpoint between the events,
+    and the algorithm jumps from one peak or trough to the next by means of
+    cumulative extrema. Only where peaks and troughs are very close to each other
+    it loops through the data.
+
     Raises:
         ValueError: if threshold <= 0 or min_thresh <= 0 or tau <= 0.
         IndexError: if data and time arrays differ in length.
@@ -254,111 +295,1075 @@ def detect_dynamic_peaks(data, threshold, min_thresh, tau, time=None,
     if time is not None and len(data) != len(time):
         raise IndexError('input arrays time and data must have same length!')
 
+    # decay of the threshold (1. order low pass filter) at each data element:
+    n = len(data)
+    dt = None
+    if time is not None:
+        dt = np.zeros(n)
+        dt[:-1] = np.diff(time)
+        if n > 0:
+            dt[-1] = time[n - 1] - time[n - 2]
+        dt_range = (np.min(dt), np.max(dt)) if n > 0 else (0.0, 0.0)
+        dt = dt.tolist()
+    dtype = _threshold_type(data, float(threshold))
+    values = np.asarray(data).astype(dtype)
+    thresholds = np.empty(n, dtype=dtype)
+    # the thresholds as computed by the recurrence, before conversion to dtype:
+    thresholds64 = np.empty(n)
+
+    def decay_thresholds(start, stop, thresh):
+        # thresholds[start:stop] decaying from thresh before start.
+        # The recurrence is evaluated as in the loop to get exactly the same values,
+        # but only until it reaches its fixpoint (slightly off min_thresh):
+        index = start
+        while index < stop:
+            if dt is None:
+                new_thresh = thresh + (min_thresh - thresh) / tau
+                fixed = new_thresh == thresh
+            else:
+                new_thresh = thresh + (min_thresh - thresh) * dt[index] / tau
+                fixed = new_thresh == thresh and \
+                    thresh + (min_thresh - thresh) * dt_range[0] / tau == thresh and \
+                    thresh + (min_thresh - thresh) * dt_range[1] / tau == thresh
+            if fixed:
+                break
+            thresh = new_thresh
+            thresholds64[index] = thresh
+            index += 1
+        thresholds64[index:stop] = thresh
+        thresholds[start:stop] = thresholds64[start:stop]
+
+    if not check_peak_func and not check_trough_func:
+        # the threshold is never reset:
+        decay_thresholds(0, n, threshold)
+        events = _peak_trough_events(values, thresholds)
+        peaks = events[0] if time is None else np.asarray(time)[events[0]]
+        troughs = events[3] if time is None else np.asarray(time)[events[3]]
+        # as np.asarray() of an empty list:
+        if len(peaks) == 0:
+            peaks = np.array([])
+        if len(troughs) == 0:
+            troughs = np.array([])
+        return peaks, troughs
+
     peaks_list = list()
     troughs_list = list()
 
-    # initialize:
-    dir = 0
-    min_inx = 0
-    max_inx = 0
-    min_value = data[0]
-    max_value = min_value
+    def check_event(event_type, event_inx, index, other_inx, thresh):
+        # report a peak or trough and return the new threshold:
+        check_func = check_peak_func if event_type > 0 else check_trough_func
+        events_list = peaks_list if event_type > 0 else troughs_list
+        if check_func:
+            r, th = check_func(time, data, event_inx, index, other_inx, thresh,
+                               min_thresh=min_thresh, tau=tau, **kwargs)
+            if r is not None:
+                events_list.append(r)
+            if th is not None:
+                thresh = th
+                if thresh < min_thresh:
+                    thresh = min_thresh
+        elif time is None:
+            events_list.append(event_inx)
+        else:
+            events_list.append(time[event_inx])
+        return thresh
+
+    def loop_events(start, stop, thresh):
+        # loop through data[start:stop], returns threshold at stop-1 and number of events:
+        direction, max_inx, max_value, min_inx, min_value = state
+        nevents = 0
+        for index, value in enumerate(values[start:stop].tolist(), start):
+            if time is None:
+                thresh += (min_thresh - thresh) / tau
+            else:
+                thresh += (min_thresh - thresh) * dt[index] / tau
+            # rising?
+            if direction > 0:
+                if value > max_value:
+                    max_inx = index
+                    max_value = value
+                elif max_value >= value + thresh:
+                    # this is a peak:
+                    thresh = check_event(1, max_inx, index, min_inx, thresh)
+                    nevents += 1
+                    min_inx = index
+                    min_value = value
+                    direction = -1
+            # falling?
+            elif direction < 0:
+                if value < min_value:
+                    min_inx = index
+                    min_value = value
+                elif value >= min_value + thresh:
+                    # this is a trough:
+                    thresh = check_event(-1, min_inx, index, max_inx, thresh)
+                    nevents += 1
+                    max_inx = index
+                    max_value = value
+                    direction = 1
+            # don't know direction yet:
+            else:
+                if max_value >= value + thresh:
+                    direction = -1
+                elif value >= min_value + thresh:
+                    direction = 1
+                if max_value < value:
+                    max_inx = index
+                    max_value = value
+                elif value < min_value:
+                    min_inx = index
+                    min_value = value
+        state[:] = [direction, max_inx, max_value, min_inx, min_value]
+        return thresh, nevents
+
+    # jump from event to event with thresholds computed in growing blocks,
+    # but loop through the data where events are close to each other:
+    state = [0, 0, values[0], 0, values[0]]
+    index = 0
+    block = 64
+    mean_gap = float(n)
+    prev_event = 0
+    while index < n:
+        if mean_gap < 32:
+            stop = min(index + 1024, n)
+            threshold, nevents = loop_events(index, stop, threshold)
+            mean_gap = (stop - index) / (nevents + 0.5)
+            index = stop
+            prev_event = stop
+            continue
+        stop = min(index + block, n)
+        decay_thresholds(index, stop, threshold)
+        events, index = _jump_events(values, thresholds, index, stop, state, max_events=1)
+        if len(events) == 0:
+            threshold = thresholds64[stop - 1]
+            block *= 2
+            continue
+        event_type, event_inx, other_inx, index = events[0]
+        threshold = check_event(event_type, event_inx, index, other_inx, thresholds64[index])
+        mean_gap += 0.2 * (index - prev_event - mean_gap)
+        prev_event = index
+        index += 1
+        block = 64
 
-    # loop through the data:
-    for index, value in enumerate(data):
+    return np.asarray(peaks_list), np.asarray(troughs_list)
 
-        # decaying threshold (1. order low pass filter):
-        if time is None:
-            threshold += (min_thresh - threshold) / tau
+
+def _jump_extremum(data, threshold, start, stop, value, inx, rising, block=64):
+    """Find the next peak (rising) or trough (falling) of the Todd and Andrews algorithm.
+
+    The running maximum (rising) or minimum (falling) is computed block-wise with
+    cumulative extrema of blocks of increasing size.
+
+    Args:
+        data (1-D array): the data.
+        threshold (float or 1-D array): the threshold with the same type as data.
+        start (int): index from where to continue.
+        stop (int): index where to stop.
+        value (float): the current maximum (rising) or minimum (falling).
+        inx (int): the index of value.
+        rising (bool): search for a peak or for a trough.
+        block (int): initial number of data elements processed at once.
+
+    Returns:
+        index (int): index where the peak or trough was detected, stop if none was found.
+        inx (int): index of the maximum (rising) or minimum (falling) before index.
+        value (float): the maximum (rising) or minimum (falling) before index.
+    """
+    if value != value:
+        # nothing is larger or smaller than NaN:
+        return stop, inx, value
+    thresh_array = not np.isscalar(threshold)
+    a = start
+    while a < stop:
+        b = min(a + block, stop)
+        seg = data[a:b]
+        ths = threshold[a:b] if thresh_array else threshold
+        # running extremum before each element:
+        prev = np.empty(len(seg), dtype=data.dtype)
+        prev[0] = value
+        if rising:
+            np.fmax.accumulate(seg[:-1], out=prev[1:])
+            np.fmax(prev[1:], value, out=prev[1:])
+            events = prev >= seg + ths
+        else:
+            np.fmin.accumulate(seg[:-1], out=prev[1:])
+            np.fmin(prev[1:], value, out=prev[1:])
+            events = seg >= prev + ths
+        k = np.argmax(events)
+        if not events[k]:
+            k = len(seg)
+        # extremum before the event:
+        if k < len(seg):
+            extremum = prev[k]
+        elif rising:
+            extremum = max(prev[-1], seg[-1]) if seg[-1] == seg[-1] else prev[-1]
         else:
-            idx = index
-            if idx + 1 >= len(data):
-                idx = len(data) - 2
-            threshold += (min_thresh - threshold) * (time[idx + 1] - time[idx]) / tau
+            extremum = min(prev[-1], seg[-1]) if seg[-1] == seg[-1] else prev[-1]
+        if extremum != value:
+            # the first element with this value is the last new extremum:
+            j = np.argmax(seg[:k] == extremum)
+            inx = a + j
+            value = seg[j]
+        if k < len(seg):
+            return a + k, inx, value
+        a = b
+        block *= 2
+    return stop, inx, value
+
+
+def _jump_events(data, threshold, start, stop, state, event_types=None, block=64,
+                 max_events=None):
+    """Peaks and troughs of the Todd and Andrews algorithm in a single piece of data.
+
+    Jumps from one peak or trough to the next by means of cumulative extrema.
+    Fast if peaks and troughs are far apart.
 
-        # rising?
-        if dir > 0:
-            # if the new value is bigger than the old maximum: set it as new maximum:
-            if value > max_value:
-                max_inx = index  # maximum element
-                max_value = value
+    Args:
+        data (1-D array): the data.
+        threshold (float or 1-D array): the threshold with the same type as data.
+        start (int): index of the first data element to be processed.
+        stop (int): index after the last data element to be processed.
+        state (list): direction, index and value of maximum, index and value of minimum.
+            Updated to the state at the end.
+        event_types (function or None): if given, returns for an index of a data element
+            the type of an already known event (1: peak, -1: trough, 0: none).
+            Stop at the first event that matches.
+        block (int): initial number of data elements processed at once.
+        max_events (int or None): if given, stop after this number of events.
 
-            # otherwise, if the new value is falling below the maximum value minus the threshold:
-            # the maximum is a peak!
-            elif max_value >= value + threshold:
-                # check and update peak with the check_peak_func function:
-                if check_peak_func:
-                    r, th = check_peak_func(time, data, max_inx, index,
-                                            min_inx, threshold,
-                                            min_thresh=min_thresh, tau=tau, **kwargs)
-                    if r is not None:
-                        # this really is a peak:
-                        peaks_list.append(r)
-                    if th is not None:
-                        threshold = th
-                        if threshold < min_thresh:
-                            threshold = min_thresh
-                else:
-                    # this is a peak:
-                    if time is None:
-                        peaks_list.append(max_inx)
-                    else:
-                        peaks_list.append(time[max_inx])
+    Returns:
+        events (list of tuples): type (1: peak, -1: trough), index of the peak or trough,
+            index of the previous trough or peak, and index where the event was detected.
+        index (int): index of the matching or last event, stop if there was none.
+    """
+    direction, max_inx, max_value, min_inx, min_value = state
+    thresh_array = not np.isscalar(threshold)
+    events = []
+    index = start
+    if direction == 0 and max_value == max_value:
+        # don't know direction yet:
+        a = start
+        while a < stop:
+            b = min(a + block, stop)
+            seg = data[a:b]
+            ths = threshold[a:b] if thresh_array else threshold
+            prev_max = np.empty(len(seg), dtype=data.dtype)
+            prev_min = np.empty(len(seg), dtype=data.dtype)
+            prev_max[0] = max_value
+            prev_min[0] = min_value
+            np.fmax.accumulate(seg[:-1], out=prev_max[1:])
+            np.fmax(prev_max[1:], max_value, out=prev_max[1:])
+            np.fmin.accumulate(seg[:-1], out=prev_min[1:])
+            np.fmin(prev_min[1:], min_value, out=prev_min[1:])
+            falling = prev_max >= seg + ths
+            inx = np.flatnonzero(falling | (seg >= prev_min + ths))
+            k = inx[0] if len(inx) > 0 else len(seg)
+            # maximum and minimum including the element where the direction is set:
+            m = min(k + 1, len(seg))
+            inx = np.flatnonzero(seg[:m] > prev_max[:m])
+            if len(inx) > 0:
+                max_inx = a + inx[-1]
+                max_value = seg[inx[-1]]
+            inx = np.flatnonzero(seg[:m] < prev_min[:m])
+            if len(inx) > 0:
+                min_inx = a + inx[-1]
+                min_value = seg[inx[-1]]
+            if k < len(seg):
+                index = a + k + 1
+                direction = -1 if falling[k] else 1
+                break
+            a = b
+            block *= 2
+        if direction == 0:
+            index = stop
+    elif direction == 0:
+        index = stop
+    # jump from peak to trough to peak:
+    while index < stop:
+        if direction > 0:
+            index, max_inx, max_value = _jump_extremum(data, threshold, index, stop,
+                                                       max_value, max_inx, True, block)
+            if index >= stop:
+                break
+            events.append((1, max_inx, min_inx, index))
+            min_inx = index
+            min_value = data[index]
+            direction = -1
+        else:
+            index, min_inx, min_value = _jump_extremum(data, threshold, index, stop,
+                                                       min_value, min_inx, False, block)
+            if index >= stop:
+                break
+            events.append((-1, min_inx, max_inx, index))
+            max_inx = index
+            max_value = data[index]
+            direction = 1
+        if event_types is not None and event_types(index) == events[-1][0]:
+            break
+        if max_events is not None and len(events) >= max_events:
+            break
+        index += 1
+    state[:] = [direction, max_inx, max_value, min_inx, min_value]
+    return events, min(index, stop)
 
-                # change direction:
-                min_inx = index  # minimum element
-                min_value = value
-                dir = -1
 
-        # falling?
-        elif dir < 0:
-            if value < min_value:
-                min_inx = index  # minimum element
-                min_value = value
+def _step(value, thresh, pos, state):
+    """One step of the Todd and Andrews algorithm for many pieces of data at once.
 
-            elif value >= min_value + threshold:
-                # there was a trough:
+    Args:
+        value (1-D array): the current data element of each piece.
+        thresh (float or 1-D array): the threshold for each piece.
+        pos (int or 1-D array of ints): the index of the current data elements.
+        state (list of 1-D arrays): direction, index and value of maximum, index and value
+            of minimum for each piece. Updated in place.
 
-                # check and update trough with the check_trough function:
-                if check_trough_func:
-                    r, th = check_trough_func(time, data, min_inx, index,
-                                              max_inx, threshold,
-                                              min_thresh=min_thresh, tau=tau, **kwargs)
-                    if r is not None:
-                        # this really is a trough:
-                        troughs_list.append(r)
-                    if th is not None:
-                        threshold = th
-                        if threshold < min_thresh:
-                            threshold = min_thresh
-                else:
-                    # this is a trough:
-                    if time is None:
-                        troughs_list.append(min_inx)
-                    else:
-                        troughs_list.append(time[min_inx])
+    Returns:
+        types (1-D array of int8): for each piece 1 if a peak, -1 if a trough,
+            and 0 if nothing was detected.
+        extrema (1-D array of ints): index of the detected peak or trough.
+        others (1-D array of ints): index of the trough or peak preceding the detected one.
+    """
+    direction, max_inx, max_value, min_inx, min_value = state
+    rising = direction > 0
+    falling = direction < 0
+    unknown = direction == 0
+    above_max = max_value < value
+    below_min = value < min_value
+    fall = max_value >= value + thresh
+    rise = value >= min_value + thresh
+    peak = rising & ~above_max & fall
+    trough = falling & ~below_min & rise
+    types = peak.view(np.int8) - trough.view(np.int8)
+    extrema = np.where(peak, max_inx, min_inx)
+    others = np.where(peak, min_inx, max_inx)
+    set_max = (above_max & ~falling) | trough
+    np.putmask(max_inx, set_max, pos)
+    np.putmask(max_value, set_max, value)
+    set_min = (below_min & (falling | (unknown & ~above_max))) | peak
+    np.putmask(min_inx, set_min, pos)
+    np.putmask(min_value, set_min, value)
+    np.putmask(direction, peak | (unknown & fall), -1)
+    np.putmask(direction, trough | (unknown & ~fall & rise), 1)
+    return types, extrema, others
+
+
+def _step_pieces(data, threshold, piece_size, state, events):
+    """Peaks and troughs of the Todd and Andrews algorithm in many pieces of data at once.
+
+    Steps through all consecutive pieces of piece_size data elements simultaneously.
 
-                # change direction:
-                max_inx = index  # maximum element
-                max_value = value
-                dir = 1
+    Args:
+        data (1-D array): the data, a multiple of piece_size long.
+        threshold (1-D array): the threshold with the same type as data,
+            either one for each piece or one for each data element.
+        piece_size (int): number of data elements of each piece.
+        state (list of 1-D arrays): direction, index and value of maximum, index and value
+            of minimum for each piece. Updated to the states at the end.
+        events (tuple of 2-D arrays): for each data element the type of event detected
+            there (1: peak, -1: trough), the index of the peak or trough,
+            and the index of the previous trough or peak.
+            Pieces are the second dimension. Updated in place.
+    """
+    npieces = len(data) // piece_size
+    # contiguous data elements for each step:
+    data_t = np.ascontiguousarray(data.reshape(npieces, piece_size).T)
+    sample_threshold = len(threshold) == len(data) and len(threshold) != npieces
+    if sample_threshold:
+        threshold = np.ascontiguousarray(threshold.reshape(npieces, piece_size).T)
+    starts = np.arange(npieces) * piece_size
+    for k in range(piece_size):
+        thresh = threshold[k] if sample_threshold else threshold
+        events[0][k], events[1][k], events[2][k] = _step(data_t[k], thresh, starts + k, state)
 
-        # don't know direction yet:
+
+def _match_pieces(data, threshold, starts, stops, state, event_types, max_steps):
+    """Run the Todd and Andrews algorithm on many pieces of data until the events match.
+
+    Steps through all pieces simultaneously, one data element per step,
+    and stops each piece at the first event that matches event_types.
+
+    Args:
+        data (1-D array): the data.
+        threshold (1-D array): the threshold with the same type as data,
+            either one for each piece or one for each data element.
+        starts (1-D array of ints): indices of the first data element of each piece.
+        stops (1-D array of ints): indices after the last data element of each piece.
+        state (list of 1-D arrays): direction, index and value of maximum, index and value
+            of minimum for each piece. Updated to the states at the end.
+        event_types (function): returns for indices of data elements the type of
+            an already known event (1: peak, -1: trough, 0: none).
+        max_steps (int): maximum number of steps.
+
+    Returns:
+        events (2-D array of ints): piece, type (1: peak, -1: trough), index of the peak
+            or trough, index of the previous trough or peak, and index where the event was detected.
+        index (1-D array of ints): for each piece the index of the matching event,
+            or the index of the next data element to be processed.
+        matched (1-D array of bools): for each piece whether an event matched.
+    """
+    sample_threshold = len(threshold) == len(data) and len(threshold) != len(starts)
+    index = np.array(stops)
+    matched = np.zeros(len(starts), dtype=bool)
+    # pieces still being processed:
+    pieces = np.arange(len(starts))
+    pos = np.array(starts)
+    ends = np.minimum(stops, starts + max_steps)
+    ths = threshold if sample_threshold else np.array(threshold)
+    piece_state = [np.array(a) for a in state]
+    event_list = []
+    while len(pieces) > 0:
+        # remove finished pieces:
+        done = pos >= ends
+        if np.any(done):
+            for a, b in zip(state, piece_state):
+                a[pieces[done]] = b[done]
+            index[pieces[done]] = np.where(matched[pieces[done]],
+                                           index[pieces[done]], pos[done])
+            keep = ~done
+            pieces = pieces[keep]
+            pos = pos[keep]
+            ends = ends[keep]
+            if not sample_threshold:
+                ths = ths[keep]
+            piece_state = [a[keep] for a in piece_state]
+            if len(pieces) == 0:
+                break
+        thresh = ths[pos] if sample_threshold else ths
+        types, extrema, others = _step(np.take(data, pos), thresh, pos, piece_state)
+        inx = np.flatnonzero(types)
+        if len(inx) > 0:
+            event_list.append(np.column_stack((pieces[inx], types[inx], extrema[inx],
+                                               others[inx], pos[inx])))
+        match = (types != 0) & (event_types(pos) == types)
+        if np.any(match):
+            index[pieces[match]] = pos[match]
+            matched[pieces[match]] = True
+            # stop these pieces:
+            ends[match] = pos[match]
+        pos += 1
+    if len(event_list) == 0:
+        return np.zeros((0, 5), dtype=int), index, matched
+    return np.vstack(event_list), index, matched
+
+
+def _jump_rows(data, threshold, row_size):
+    """Peaks and troughs of the Todd and Andrews algorithm in each row of data.
+
+    See _peak_trough_events() for details on arguments and return values.
+    """
+    sample_threshold = not np.isscalar(threshold) and len(threshold) == len(data)
+    events = []
+    for r, start in enumerate(range(0, len(data), row_size)):
+        ths = threshold if sample_threshold or np.isscalar(threshold) else threshold[r]
+        state = [0, start, data[start], start, data[start]]
+        events.extend(_jump_events(data, ths, start, start + row_size, state)[0])
+    events = np.array(events, dtype=int).reshape(-1, 4)
+    peaks = events[events[:, 0] > 0]
+    troughs = events[events[:, 0] < 0]
+    return peaks[:, 1], peaks[:, 2], peaks[:, 3], troughs[:, 1], troughs[:, 2], troughs[:, 3]
+
+
+def _peak_trough_events(data, threshold, row_size=None, piece_size=None):
+    """Peaks and troughs of the Todd and Andrews algorithm as in detect_peaks().
+
+    The data are split into pieces that are processed simultaneously,
+    each starting with an unknown direction. Starting from the state at
+    the end of the previous piece, each piece is then processed again
+    until it results in the same peak or trough. From there on the states
+    of both runs are the same.
+    If peaks and troughs are far apart, the data are processed
+    by jumping from one peak or trough to the next instead.
+
+    Args:
+        data (1-D array): the data.
+        threshold (float or 1-D array): positive threshold with the same type as data.
+            Either a single number, one for each row, or one for each data element.
+        row_size (int or None): data consist of independent rows of this size.
+        piece_size (int or None): number of data elements of each piece.
+            If None, choose it according to the density of peaks and troughs.
+
+    Returns:
+        peaks (1-D array of ints): indices of the peaks.
+        peak_troughs (1-D array of ints): indices of the troughs preceding the peaks.
+        peak_events (1-D array of ints): indices where the peaks were detected.
+        troughs (1-D array of ints): indices of the troughs.
+        trough_peaks (1-D array of ints): indices of the peaks preceding the troughs.
+        trough_events (1-D array of ints): indices where the troughs were detected.
+    """
+    n = len(data)
+    if row_size is None or row_size <= 0:
+        row_size = n
+    if n == 0:
+        return tuple(np.zeros(0, dtype=int) for k in range(6))
+    nrows = n // row_size
+    sample_threshold = not np.isscalar(threshold) and len(threshold) == n and row_size == n
+    auto_size = piece_size is None
+    if auto_size:
+        piece_size = min(max(n // 1024, 16), 1024)
+    piece_size = min(piece_size, row_size)
+    row_data = data
+    row_threshold = threshold
+    npieces = (row_size + piece_size - 1) // piece_size
+    piece_size = (row_size + npieces - 1) // npieces
+    padded_size = npieces * piece_size
+    if padded_size > row_size:
+        # pad rows with NaNs, they never change the state:
+        if not np.issubdtype(data.dtype, np.inexact):
+            data = data.astype(np.float64)
+            threshold = np.asarray(threshold).astype(np.float64)[()]
+        data = np.hstack((data.reshape(nrows, row_size),
+                          np.zeros((nrows, padded_size - row_size), dtype=data.dtype) +
+                          np.nan)).ravel()
+        if sample_threshold:
+            threshold = np.hstack((threshold, np.ones(padded_size - row_size,
+                                                      dtype=threshold.dtype)))
+    starts = np.arange(nrows * npieces) * piece_size
+    # the padding is not part of the pieces:
+    stops = np.minimum(starts + piece_size, (starts // padded_size) * padded_size + row_size)
+    first = np.zeros(len(starts), dtype=bool)
+    first[::npieces] = True
+    if sample_threshold:
+        piece_thresh = threshold
+    elif np.isscalar(threshold):
+        piece_thresh = np.zeros(len(starts), dtype=data.dtype) + threshold
+    else:
+        piece_thresh = np.repeat(threshold, npieces)
+    # first run of all pieces with unknown direction:
+    state = [np.zeros(len(starts), dtype=int), starts.copy(), data[starts],
+             starts.copy(), data[starts]]
+    events = (np.zeros((piece_size, len(starts)), dtype=np.int8),
+              np.zeros((piece_size, len(starts)), dtype=int),
+              np.zeros((piece_size, len(starts)), dtype=int))
+    _step_pieces(data, piece_thresh, piece_size, state, events)
+    if auto_size and piece_size < row_size:
+        # pieces should contain several peaks and troughs:
+        nevents = np.count_nonzero(events[0])
+        size = min(max(piece_size, 8 * len(data) // max(1, nevents)), row_size)
+        # estimated computation times in microseconds:
+        step_time = 40 * size + 0.04 * len(data)
+        jump_time = 25 * nevents
+        if jump_time < step_time:
+            return _jump_rows(row_data, row_threshold, row_size)
+        elif size > piece_size:
+            return _peak_trough_events(row_data, row_threshold, row_size, size)
+    events = [a.ravel() for a in events]
+
+    def transposed(inx):
+        return (inx % piece_size) * len(starts) + inx // piece_size
+
+    def event_types(inx):
+        return events[0][transposed(inx)]
+
+    # second run from the end state of the previous piece until an event matches:
+    second = np.flatnonzero(~first)
+    second_state = [a[second - 1] for a in state]
+    second_events, index, matched = _match_pieces(data, piece_thresh if sample_threshold
+                                                  else piece_thresh[second],
+                                                  starts[second], stops[second],
+                                                  second_state, event_types, 128)
+    second_events[:, 0] = second[second_events[:, 0]]
+    # first valid event of the first run:
+    valid = starts.copy()
+    valid[second] = index + 1
+    # continue pieces without matching events, and redo the following ones:
+    redone = np.zeros(len(starts), dtype=bool)
+    redo_events = []
+    for k in np.flatnonzero(~matched):
+        c = second[k]
+        if redone[c]:
+            continue
+        true_state = [a[k] for a in second_state]
+        start = index[k]
+        while True:
+            ths = threshold if sample_threshold else piece_thresh[c]
+            ev, inx = _jump_events(data, ths, start, stops[c], true_state, event_types)
+            if len(ev) > 0:
+                redo_events.append(np.column_stack((np.zeros(len(ev), dtype=int) + c,
+                                                    np.array(ev, dtype=int))))
+            valid[c] = inx + 1
+            c += 1
+            if inx < stops[c - 1] or c >= len(starts) or first[c]:
+                break
+            redone[c] = True
+            start = starts[c]
+    # remove events of the first run before the first valid ones:
+    lengths = np.minimum(valid, stops) - starts
+    offs = np.cumsum(lengths) - lengths
+    inx = np.arange(np.sum(lengths)) + np.repeat(starts - offs, lengths)
+    events[0][transposed(inx)] = 0
+    # add events of the other runs:
+    for ev in [second_events[~redone[second_events[:, 0]]]] + redo_events:
+        inx = transposed(ev[:, 4])
+        events[0][inx] = ev[:, 1]
+        events[1][inx] = ev[:, 2]
+        events[2][inx] = ev[:, 3]
+    event_inx = np.flatnonzero(events[0].reshape(piece_size, len(starts)).T)
+    inx = transposed(event_inx)
+    types = events[0][inx]
+    extrema = events[1][inx]
+    # the previous peak or trough is the one of the previous event:
+    others = events[2][inx]
+    same_row = event_inx[1:] // padded_size == event_inx[:-1] // padded_size
+    others[1:][same_row] = extrema[:-1][same_row]
+    if padded_size > row_size:
+        # indices without padding:
+        for a in (extrema, others, event_inx):
+            a -= (a // padded_size) * (padded_size - row_size)
+    peaks = types > 0
+    troughs = types < 0
+    return (extrema[peaks], others[peaks], event_inx[peaks],
+            extrema[troughs], others[troughs], event_inx[troughs])
+
+
+def _threshold_type(data, threshold):
+    """Type of the sum of data and threshold as computed by the loop of detect_peaks()."""
+    zero = np.asarray(data).dtype.type(0)
+    if isinstance(threshold, (int, float)):
+        return (zero + threshold).dtype
+    return (zero + np.asarray(threshold).dtype.type(0)).dtype
+
+
+def _fast_detect_peaks(data, threshold, time=None):
+    """Peaks and troughs as detect_peaks() without check functions, but using array operations.
+
+    Args:
+        data (1-D array): the data, not empty.
+        threshold (float or 1-D array or WindowedThreshold): positive threshold,
+            a single number or one for each data element.
+        time (1-D array or None): the time of the data values.
+
+    Returns:
+        peaks (1-D array): indices or times of the peaks.
+        troughs (1-D array): indices or times of the troughs.
+    """
+    data = np.asarray(data)
+    if isinstance(threshold, WindowedThreshold):
+        # process chunks of windows without materializing the whole threshold array:
+        detector = PeakDetector(1.0)
+        chunk = max(1, (1 << 20) // threshold.win_size) * threshold.win_size
+        events = [detector.process(data[k:k + chunk], threshold[k:k + chunk])
+                  for k in range(0, len(data), chunk)]
+        peaks = np.concatenate([e[0] for e in events])
+        troughs = np.concatenate([e[1] for e in events])
+    else:
+        dtype = _threshold_type(data, threshold)
+        if np.isscalar(threshold):
+            thresh = dtype.type(threshold)
         else:
-            if max_value >= value + threshold:
-                dir = -1  # falling
-            elif value >= min_value + threshold:
-                dir = 1  # rising
+            thresh = np.asarray(threshold).astype(dtype)
+        events = _peak_trough_events(data.astype(dtype), thresh)
+        peaks = events[0]
+        troughs = events[3]
+    if time is not None:
+        time = np.asarray(time)
+        peaks = time[peaks]
+        troughs = time[troughs]
+    # as np.asarray() of an empty list:
+    if len(peaks) == 0:
+        peaks = np.array([])
+    if len(troughs) == 0:
+        troughs = np.array([])
+    return peaks, troughs
+
+
+def _detect_channel_peaks(data, threshold, time, check_peak_func,
+                          check_trough_func, axis, **kwargs):
+    """Peaks and troughs in each channel of 2-D data as detect_peaks().
 
-            if max_value < value:
-                max_inx = index  # maximum element
-                max_value = value
+    Returns:
+        peaks (1-D array): peaks of all channels.
+        troughs (1-D array): troughs of all channels.
+        peak_offsets (1-D array of ints): the peaks of channel i are
+            peaks[peak_offsets[i]:peak_offsets[i+1]].
+        trough_offsets (1-D array of ints): the troughs of channel i are
+            troughs[trough_offsets[i]:trough_offsets[i+1]].
+    """
+    data = np.moveaxis(np.asarray(data), axis, -1)
+    nchannels, n = data.shape
+    if isinstance(threshold, WindowedThreshold):
+        raise ValueError('WindowedThreshold is not supported for 2-D data!')
+    if not np.isscalar(threshold):
+        threshold = np.asarray(threshold)
+        if threshold.ndim > 1:
+            threshold = np.moveaxis(threshold, axis, -1)
+            if threshold.shape != data.shape:
+                raise IndexError('input arrays data and threshold must have same shape!')
+        elif len(threshold) != nchannels:
+            raise IndexError('input array threshold must have a value for each channel!')
+    if np.any(np.asarray(threshold) <= 0):
+        raise ValueError('input argument threshold must be positive!')
+    if time is not None and len(time) != n:
+        raise IndexError('input arrays time and data must have same length!')
 
-            elif value < min_value:
-                min_inx = index  # minimum element
-                min_value = value
+    if not check_peak_func and not check_trough_func and np.ndim(threshold) < 2 and n > 0:
+        # all channels at once:
+        dtype = _threshold_type(data, threshold if np.isscalar(threshold) else threshold[0])
+        thresh = dtype.type(threshold) if np.isscalar(threshold) else threshold.astype(dtype)
+        events = _peak_trough_events(np.ascontiguousarray(data, dtype=dtype).ravel(),
+                                     thresh, n)
+        results = []
+        for inx in (events[0], events[3]):
+            rows = inx // n
+            inx = inx - rows * n
+            results.append(np.asarray(time)[inx] if time is not None else inx)
+            results.append(np.searchsorted(rows, np.arange(nchannels + 1)))
+        return results[0], results[2], results[1], results[3]
+
+    peaks_list = []
+    troughs_list = []
+    for c in range(nchannels):
+        th = threshold if np.ndim(threshold) == 0 else threshold[c]
+        peaks, troughs = detect_peaks(data[c], th, time, check_peak_func,
+                                      check_trough_func, **kwargs)
+        peaks_list.append(np.asarray(peaks))
+        troughs_list.append(np.asarray(troughs))
+    results = []
+    for values in (peaks_list, troughs_list):
+        offsets = np.concatenate(([0], np.cumsum([len(v) for v in values])))
+        values = [v for v in values if len(v) > 0]
+        results.append(np.concatenate(values) if len(values) > 0 else np.array([]))
+        results.append(offsets)
+    return results[0], results[2], results[1], results[3]
+
+
+def detect_peaks_size_width(data, threshold, time, pfac=0.75):
+    """
+    Detect peaks and compute their size and width.
 
-    return np.asarray(peaks_list), np.asarray(troughs_list)
+    Returns the same peaks as
+    `detect_peaks(data, threshold, time, accept_peaks_size_width, pfac=pfac)`,
+    but instead of looping through each data element in Python,
+    peaks are found with cumulative extrema and their widths are measured
+    for all peaks at once. This is much faster for smooth data like power spectra.
+
+    Args:
+        data (1-D or 2-D array): the data. For a 2-D array, peaks are detected
+                                 in each row (e.g. in each power spectrum of a spectrogram).
+        threshold (float or 1-D array): a positive number setting the minimum distance
+                                        between peaks and troughs. For 2-D data
+                                        an array with a threshold for each row.
+        time (1-D array): the time (or frequency) of the data values (second dimension of data).
+        pfac (float): fraction of peak height where its width is measured.
+
+    Returns:
+        peaks (2-D array): for each peak its time, height (value of data at the peak),
+                           size (peak minus previous trough), width (at pfac*size), and zero.
+        offsets (1-D array of ints): only for 2-D data: the peaks of row i are
+                                     peaks[offsets[i]:offsets[i+1]].
+
+    Raises:
+        ValueError: if threshold <= 0.
+        IndexError: if data, time, and threshold arrays differ in length.
+    """
+    data = np.asarray(data)
+    time = np.asarray(time)
+    rows_data = data if data.ndim > 1 else data.reshape(1, -1)
+    if len(time) != rows_data.shape[1]:
+        raise IndexError('input arrays time and data must have same length!')
+    if data.ndim > 1 and not np.isscalar(threshold):
+        if len(threshold) != len(data):
+            raise IndexError('input arrays data and threshold must have same number of rows!')
+        thresholds = threshold
+    else:
+        thresholds = [threshold]*len(rows_data)
+    if np.any(np.asarray(thresholds) <= 0):
+        raise ValueError('input argument threshold must be positive!')
+
+    # peak indices:
+    dtype = _threshold_type(rows_data, thresholds[0])
+    flat_data = rows_data.astype(dtype).ravel()
+    if data.ndim > 1:
+        flat_thresh = np.asarray(thresholds).astype(dtype)
+    else:
+        flat_thresh = dtype.type(threshold) if np.isscalar(threshold) else \
+            np.asarray(threshold).astype(dtype)
+    n = rows_data.shape[1]
+    pinx, tinx, einx = _peak_trough_events(flat_data, flat_thresh, n)[:3]
+    rows = pinx // n
+    flat_data = rows_data.ravel()
+    flat_time = np.tile(time, 1 if data.ndim == 1 else len(rows_data))
+
+    # size and width of peaks (as accept_peaks_size_width()):
+    heights = flat_data[pinx]
+    troughs = flat_data[tinx]
+    sizes = heights - troughs
+    wthresh = troughs + pfac * sizes
+    width = np.zeros(len(pinx))
+    # left side of peaks:
+    k = pinx.copy()
+    active = np.nonzero(k > tinx)[0]
+    while len(active) > 0:
+        below = flat_data[k[active]] < wthresh[active]
+        found = active[below]
+        width[found] = flat_time[pinx[found]] - flat_time[k[found]]
+        active = active[~below]
+        k[active] -= 1
+        active = active[k[active] > tinx[active]]
+    # right side of peaks:
+    k = pinx.copy()
+    active = np.nonzero(k < einx)[0]
+    while len(active) > 0:
+        below = flat_data[k[active]] < wthresh[active]
+        found = active[below]
+        width[found] += flat_time[k[found]] - flat_time[pinx[found]]
+        active = active[~below]
+        k[active] += 1
+        active = active[k[active] < einx[active]]
+    peaks = np.column_stack((flat_time[pinx], heights, sizes, width, np.zeros(len(pinx))))
+    if data.ndim > 1:
+        return peaks, np.searchsorted(rows, np.arange(len(rows_data) + 1))
+    return peaks
+
+
+class PeakDetector(object):
+    """
+    Stateful peak and trough detection in consecutive blocks of data.
+
+    The direction, the current maximum and minimum, and the threshold
+    of the Todd and Andrews algorithm are kept between calls of process().
+    Detecting peaks block by block therefore results in exactly the same
+    peaks and troughs as detecting them in the whole recording at once
+    with detect_peaks() (fixed threshold) or detect_dynamic_peaks()
+    (decaying threshold, tau in indices, and, if thresh_ampl_fac is given,
+    accept_peak_size_threshold() as check function for peaks and troughs).
+
+    Usage:
+    ```
+    detector = PeakDetector(threshold)
+    for peaks, troughs in detector.blocks(data, 100000):
+        # peaks and troughs are indices into data
+        ...
+    ```
+
+    Member variables:
+      threshold (float): the current threshold.
+      min_thresh (float or None): the minimum value of a decaying threshold.
+      tau (float or None): the time constant of the decay of the threshold in indices.
+      thresh_ampl_fac (float or None): if not None, the threshold is adapted
+        to thresh_ampl_fac times the size of each detected peak and trough.
+      thresh_weight (float): weight of the size of a peak or trough for adapting the threshold.
+      offset (int): the index of the first data element of the next block.
+    """
+
+    def __init__(self, threshold, min_thresh=None, tau=None,
+                 thresh_ampl_fac=None, thresh_weight=0.02):
+        """
+        Args:
+          threshold (float): a positive number setting the minimum distance between peaks and troughs.
+          min_thresh (float or None): if not None, the threshold decays towards min_thresh.
+          tau (float or None): the time constant of the decay of the threshold in indices.
+          thresh_ampl_fac (float or None): if not None, adapt the threshold to
+            the size of the detected peaks and troughs (see accept_peak_size_threshold()).
+          thresh_weight (float): new threshold is weighted against current threshold with thresh_weight.
+
+        Raises:
+          ValueError: if threshold <= 0 or min_thresh <= 0 or tau <= 0.
+        """
+        if threshold <= 0:
+            raise ValueError('input argument threshold must be positive!')
+        if min_thresh is not None and min_thresh <= 0:
+            raise ValueError('input argument min_thresh must be positive!')
+        if min_thresh is not None and (tau is None or tau <= 0):
+            raise ValueError('input argument tau must be positive!')
+        self.init_threshold = threshold
+        self.min_thresh = min_thresh
+        self.tau = tau
+        self.thresh_ampl_fac = thresh_ampl_fac
+        self.thresh_weight = thresh_weight
+        self.reset()
+
+    def reset(self, offset=0):
+        """Discard the state and start a new stream.
+
+        Args:
+          offset (int): index of the first data element of the next block.
+        """
+        self.threshold = self.init_threshold
+        self.offset = offset
+        self.direction = 0
+        self.max_inx = offset
+        self.max_value = None
+        self.min_inx = offset
+        self.min_value = None
+
+    def process(self, block, threshold=None):
+        """Peaks and troughs detected in the next block of data.
+
+        Peaks and troughs are reported in the block where they are detected,
+        i.e. where the data have fallen (risen) by threshold after them.
+        They therefore might be located in one of the previous blocks.
+
+        Args:
+          block (1-D array): the data following the previous block.
+          threshold (1-D array or None): only for a fixed threshold,
+            a positive threshold for each element of the block.
+            If None, use the threshold member variable.
+
+        Returns:
+          peaks (1-D array of ints): indices of the peaks relative to the start of the stream.
+          troughs (1-D array of ints): indices of the troughs relative to the start of the stream.
+        """
+        data = np.asarray(block)
+        if len(data) == 0:
+            return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+        if self.max_value is None:
+            self.max_value = data[0]
+            self.min_value = data[0]
+        if self.min_thresh is None:
+            peaks, troughs = self._process_fixed(data, self.threshold if threshold is None
+                                                 else threshold)
+        else:
+            peaks, troughs = self._process_dynamic(data)
+        self.offset += len(data)
+        return peaks, troughs
+
+    def _process_fixed(self, data, threshold):
+        """Peaks and troughs for a fixed threshold using array operations.
+
+        The block is analysed on its own as in detect_peaks(). Starting from
+        the state at the end of the previous block, the algorithm is then
+        run until it detects the same peak or trough. From there on
+        the states of both runs are the same.
+        """
+        dtype = _threshold_type(data, threshold)
+        data = data.astype(dtype)
+        if np.isscalar(threshold):
+            thresh = dtype.type(threshold)
+        else:
+            thresh = np.asarray(threshold).astype(dtype)
+        n = len(data)
+        peaks, _, peak_events, troughs, _, trough_events = _peak_trough_events(data, thresh)
+        types = np.zeros(n, dtype=np.int8)
+        types[peak_events] = 1
+        types[trough_events] = -1
+        # continue from the previous block until an event matches:
+        state = [self.direction, self.max_inx - self.offset, dtype.type(self.max_value),
+                 self.min_inx - self.offset, dtype.type(self.min_value)]
+        events, index = _jump_events(data, thresh, 0, n, state, lambda inx: types[inx])
+        events = np.array(events, dtype=int).reshape(-1, 4)
+        if index < n:
+            # take over the events of the block detected after the matching one:
+            later_peaks = peak_events > index
+            later_troughs = trough_events > index
+            peaks = np.concatenate((events[events[:, 0] > 0, 1], peaks[later_peaks]))
+            troughs = np.concatenate((events[events[:, 0] < 0, 1], troughs[later_troughs]))
+            start = index + 1
+            if np.any(later_peaks) or np.any(later_troughs):
+                # state right after the last event of the block:
+                last_peak = peak_events[-1] if len(peak_events) > 0 else -1
+                last_trough = trough_events[-1] if len(trough_events) > 0 else -1
+                if last_peak > last_trough:
+                    state = [-1, peaks[-1], data[peaks[-1]], last_peak, data[last_peak]]
+                    start = last_peak + 1
+                else:
+                    state = [1, last_trough, data[last_trough], troughs[-1], data[troughs[-1]]]
+                    start = last_trough + 1
+            # update the state to the end of the block:
+            if start < n:
+                _jump_events(data, thresh, start, n, state)
+        else:
+            peaks = events[events[:, 0] > 0, 1]
+            troughs = events[events[:, 0] < 0, 1]
+        self.direction = int(state[0])
+        self.max_inx = int(state[1]) + self.offset
+        self.max_value = state[2]
+        self.min_inx = int(state[3]) + self.offset
+        self.min_value = state[4]
+        return peaks + self.offset, troughs + self.offset
+
+    def _process_dynamic(self, data):
+        """Peaks and troughs for a decaying threshold as in detect_dynamic_peaks()."""
+        peaks_list = list()
+        troughs_list = list()
+        direction = self.direction
+        max_inx = self.max_inx
+        max_value = self.max_value
+        min_inx = self.min_inx
+        min_value = self.min_value
+        threshold = self.threshold
+        min_thresh = self.min_thresh
+        tau = self.tau
+        adapt = self.thresh_ampl_fac is not None
+        for index, value in enumerate(data, self.offset):
+            # decaying threshold (1. order low pass filter):
+            threshold += (min_thresh - threshold) / tau
+            # rising?
+            if direction > 0:
+                if value > max_value:
+                    max_inx = index
+                    max_value = value
+                elif max_value >= value + threshold:
+                    # this is a peak:
+                    peaks_list.append(max_inx)
+                    if adapt:
+                        size = max_value - min_value
+                        threshold += self.thresh_weight * (self.thresh_ampl_fac * size - threshold)
+                        if threshold < min_thresh:
+                            threshold = min_thresh
+                    min_inx = index
+                    min_value = value
+                    direction = -1
+            # falling?
+            elif direction < 0:
+                if value < min_value:
+                    min_inx = index
+                    min_value = value
+                elif value >= min_value + threshold:
+                    # this is a trough:
+                    troughs_list.append(min_inx)
+                    if adapt:
+                        size = min_value - max_value
+                        threshold += self.thresh_weight * (self.thresh_ampl_fac * size - threshold)
+                        if threshold < min_thresh:
+                            threshold = min_thresh
+                    max_inx = index
+                    max_value = value
+                    direction = 1
+            # don't know direction yet:
+            else:
+                if max_value >= value + threshold:
+                    direction = -1
+                elif value >= min_value + threshold:
+                    direction = 1
+                if max_value < value:
+                    max_inx = index
+                    max_value = value
+                elif value < min_value:
+                    min_inx = index
+                    min_value = value
+        self.direction = direction
+        self.max_inx = max_inx
+        self.max_value = max_value
+        self.min_inx = min_inx
+        self.min_value = min_value
+        self.threshold = threshold
+        return np.array(peaks_list, dtype=int), np.array(troughs_list, dtype=int)
+
+    def blocks(self, data, block_size, start=0, stop=-1, channel=None):
+        """Generator for the peaks and troughs of consecutive data blocks.
+
+        Args:
+          data (array or DataLoader): the data.
+          block_size (int): number of data points read at once.
+          start (int): index of the first data point to be analysed.
+          stop (int): index after the last data point to be analysed.
+                      If negative analyse up to the end of the data.
+          channel (int or None): if not None the channel (second index) of the data to be analysed.
+
+        Yields:
+          peaks (1-D array of ints): indices of the peaks detected in each block.
+          troughs (1-D array of ints): indices of the troughs detected in each block.
+        """
+        if stop < 0 or stop > len(data):
+            stop = len(data)
+        self.reset(start)
+        for inx0 in range(start, stop, block_size):
+            inx1 = min(inx0 + block_size, stop)
+            if channel is None:
+                block = data[inx0:inx1]
+            else:
+                block = data[inx0:inx1, channel]
+            yield self.process(block)
 
 
 def accept_peak(time, data, event_inx, index, min_inx, threshold):
@@ -452,39 +1457,487 @@ def accept_peaks_size_width(time, data, peak_inx, index, min_inx, threshold, pfa
     return [time[peak_inx], data[peak_inx], size, width, 0.0], None
 
 
-def std_threshold(data, samplerate=None, win_size=None, th_factor=5.):
+class QuantileSketch(object):
+    """
+    Mergeable streaming histogram for approximate quantiles of large data.
+
+    Data are counted in bins of equal width that are aligned to multiples
+    of the bin width. The bin width is a power of two. Whenever the data
+    span more than max_bins bins, pairs of neighboring bins are combined
+    and the bin width is doubled. The error of the quantiles is therefore
+    bounded by the bin width, i.e. by at most twice the range of the data
+    divided by max_bins. Minimum and maximum of the data are exact.
+
+    Sketches of consecutive chunks of data or from parallel workers
+    can be combined with merge(). The result is the same as
+    adding all the data to a single sketch.
+
+    Usage:
+    ```
+    sketch = QuantileSketch()
+    for block in blocks:
+        sketch.add(block)
+    lower, upper = sketch.percentile([1.0, 99.0])
+    ```
+
+    Member variables:
+      max_bins (int): maximum number of bins.
+      bin_width (float or None): the width of the bins.
+      start (int): index of the first bin, i.e. the first bin starts at start*bin_width.
+      counts (1-D array of ints): number of data elements in each bin.
+      count (int): total number of data elements.
+      min_value (float): the smallest data value.
+      max_value (float): the largest data value.
+    """
+
+    def __init__(self, max_bins=4096, bin_width=None):
+        """
+        Args:
+          max_bins (int): maximum number of bins.
+          bin_width (float or None): initial width of the bins, rounded to a power of two.
+            If None, it is set from the range of the first data.
+        """
+        self.max_bins = int(max_bins)
+        self.bin_width = None
+        if bin_width is not None:
+            self.bin_width = 2.0**np.floor(np.log2(bin_width))
+        self.start = 0
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.count = 0
+        self.min_value = np.inf
+        self.max_value = -np.inf
+
+    def _coarsen(self, factor):
+        """Combine factor neighboring bins, factor must be a power of two."""
+        inx = (self.start + np.arange(len(self.counts))) // factor
+        self.start = self.start // factor
+        self.counts = np.bincount(inx - self.start, weights=self.counts).astype(np.int64)
+        self.bin_width *= factor
+
+    def _fit(self, first, last):
+        """Extend and coarsen the bins to cover the bins first to last of the current width.
+
+        Returns:
+          factor (int): the factor by which the bin width was increased.
+        """
+        if len(self.counts) > 0:
+            first = min(first, self.start)
+            last = max(last, self.start + len(self.counts) - 1)
+        factor = 1
+        while last // factor - first // factor + 1 > self.max_bins:
+            factor *= 2
+        if factor > 1:
+            self._coarsen(factor)
+        first //= factor
+        last //= factor
+        if len(self.counts) == 0:
+            self.counts = np.zeros(last - first + 1, dtype=np.int64)
+        else:
+            self.counts = np.concatenate((np.zeros(self.start - first, dtype=np.int64),
+                                          self.counts,
+                                          np.zeros(last - self.start - len(self.counts) + 1,
+                                                   dtype=np.int64)))
+        self.start = first
+        return factor
+
+    def add(self, data):
+        """Add data to the sketch.
+
+        Args:
+          data (array): the data, non-finite values are ignored.
+
+        Returns:
+          self (QuantileSketch): the sketch.
+        """
+        data = np.asarray(data).ravel()
+        data = data[np.isfinite(data)]
+        if len(data) == 0:
+            return self
+        min_value = np.min(data)
+        max_value = np.max(data)
+        if self.bin_width is None:
+            span = float(max_value) - float(min_value)
+            if span <= 0.0:
+                span = max(abs(float(max_value)), 1.0)
+            self.bin_width = 2.0**np.floor(np.log2(2.0 * span / self.max_bins))
+        first = int(np.floor(min_value / self.bin_width))
+        last = int(np.floor(max_value / self.bin_width))
+        self._fit(first, last)
+        inx = np.floor(data / self.bin_width).astype(np.int64) - self.start
+        self.counts += np.bincount(inx, minlength=len(self.counts))
+        self.count += len(data)
+        self.min_value = min(self.min_value, min_value)
+        self.max_value = max(self.max_value, max_value)
+        return self
+
+    def merge(self, other):
+        """Add the data of another sketch.
+
+        Args:
+          other (QuantileSketch): the sketch to be merged into this one.
+
+        Returns:
+          self (QuantileSketch): the sketch.
+        """
+        if other.count == 0:
+            return self
+        other_start = other.start
+        other_counts = other.counts
+        if self.bin_width is None:
+            self.bin_width = other.bin_width
+        elif other.bin_width < self.bin_width:
+            # coarsen the bins of the other sketch:
+            factor = int(round(self.bin_width / other.bin_width))
+            inx = (other_start + np.arange(len(other_counts))) // factor
+            other_start //= factor
+            other_counts = np.bincount(inx - other_start, weights=other_counts).astype(np.int64)
+        elif other.bin_width > self.bin_width:
+            self._coarsen(int(round(other.bin_width / self.bin_width)))
+        factor = self._fit(other_start, other_start + len(other_counts) - 1)
+        if factor > 1:
+            inx = (other_start + np.arange(len(other_counts))) // factor
+            other_start //= factor
+            other_counts = np.bincount(inx - other_start, weights=other_counts).astype(np.int64)
+        self.counts[other_start - self.start:other_start - self.start + len(other_counts)] += other_counts
+        self.count += other.count
+        self.min_value = min(self.min_value, other.min_value)
+        self.max_value = max(self.max_value, other.max_value)
+        return self
+
+    def quantile(self, q):
+        """Approximate quantiles of the data.
+
+        The data are assumed to be uniformly distributed within each bin.
+        The returned quantile deviates by at most the bin width from the range
+        spanned by the two data elements np.percentile() interpolates between.
+
+        Args:
+          q (float or array of floats): the quantiles between 0 and 1.
+
+        Returns:
+          values (float or array): the quantiles of the data, NaN for an empty sketch.
+        """
+        q = np.asarray(q, dtype=np.float64)
+        if self.count == 0:
+            return np.zeros(q.shape) + np.nan
+        cumcounts = np.cumsum(self.counts)
+        # rank of the quantile as in np.percentile(), centered on the data elements:
+        target = q * (self.count - 1) + 0.5
+        inx = np.minimum(np.searchsorted(cumcounts, target), len(self.counts) - 1)
+        before = np.where(inx > 0, cumcounts[inx - 1], 0)
+        frac = (target - before) / np.maximum(self.counts[inx], 1)
+        values = (self.start + inx + np.clip(frac, 0.0, 1.0)) * self.bin_width
+        return np.clip(values, self.min_value, self.max_value)[()]
+
+    def percentile(self, p):
+        """Approximate percentiles of the data.
+
+        Args:
+          p (float or array of floats): the percentiles between 0 and 100.
+
+        Returns:
+          values (float or array): the percentiles of the data.
+        """
+        return self.quantile(np.asarray(p) / 100.0)
+
+    def histogram(self, nbins=100):
+        """Histogram of the data with nbins equal bins between minimum and maximum value.
+
+        The counts of the bins of the sketch are distributed to the bins of
+        the histogram according to their overlap.
+
+        Args:
+          nbins (int or list of floats): number of bins or the bins of the histogram.
+
+        Returns:
+          hist (1-D array): the density of the data in each bin (as np.histogram(..., density=True)).
+          bins (1-D array): the edges of the bins.
+        """
+        if np.isscalar(nbins):
+            lower = self.min_value
+            upper = self.max_value
+            if self.count == 0:
+                lower, upper = 0.0, 1.0
+            elif upper <= lower:
+                lower -= 0.5
+                upper += 0.5
+            bins = np.linspace(lower, upper, nbins + 1)
+        else:
+            bins = np.asarray(nbins, dtype=np.float64)
+        if self.count == 0:
+            counts = np.zeros(len(bins) - 1)
+        else:
+            # piecewise linear cumulative counts:
+            edges = (self.start + np.arange(len(self.counts) + 1)) * self.bin_width
+            cumcounts = np.concatenate(([0.0], np.cumsum(self.counts)))
+            counts = np.diff(np.interp(bins, edges, cumcounts))
+        total = np.sum(counts)
+        hist = counts / np.diff(bins) / (total if total > 0 else 1.0)
+        return hist, bins
+
+
+def _sketch_percentiles(rows, max_bins, p):
+    """Percentiles of each row of the data as approximated by a QuantileSketch.
+
+    The same as QuantileSketch(max_bins).add(row).percentile(p) for each row,
+    but the bins of all rows are counted at once.
+
+    Args:
+      rows (2-D array): the data, percentiles are computed for each row.
+      max_bins (int): maximum number of bins of the sketches.
+      p (1-D array of floats): the percentiles between 0 and 100.
+
+    Returns:
+      values (2-D array): the percentiles of each row (first dimension),
+        NaN for rows without finite data.
+    """
+    rows = np.asarray(rows)
+    max_bins = int(max_bins)
+    nrows = rows.shape[0]
+    finite = np.isfinite(rows)
+    count = np.sum(finite, axis=1)
+    valid = count > 0
+    values = np.where(finite, rows, np.inf)
+    min_value = np.min(values, axis=1)
+    max_value = np.max(np.where(finite, rows, -np.inf), axis=1)
+    # bin width of the first data added to a sketch:
+    span = max_value.astype(np.float64) - min_value.astype(np.float64)
+    span = np.where(span > 0.0, span, np.maximum(np.abs(max_value.astype(np.float64)), 1.0))
+    span[~valid] = 1.0
+    bin_width = 2.0**np.floor(np.log2(2.0 * span / max_bins))
+    first = np.floor(np.where(valid, min_value, 0.0) / bin_width).astype(np.int64)
+    last = np.floor(np.where(valid, max_value, 0.0) / bin_width).astype(np.int64)
+    # coarsen as QuantileSketch._fit():
+    factor = np.ones(nrows, dtype=np.int64)
+    coarsen = last // factor - first // factor + 1 > max_bins
+    while np.any(coarsen):
+        factor[coarsen] *= 2
+        coarsen = last // factor - first // factor + 1 > max_bins
+    start = first // factor
+    nbins = last // factor - start + 1
+    # as QuantileSketch.quantile(), rank of the quantile centered on the data elements:
+    target = (np.asarray(p, dtype=np.float64) / 100.0)[np.newaxis, :] * \
+        (count[:, np.newaxis] - 1) + 0.5
+    if 4 * np.sum(nbins) <= rows.size:
+        # cumulative counts of the bins of all rows, offset by the row:
+        offsets = np.concatenate(([0], np.cumsum(nbins)))
+        ids = np.floor(rows / bin_width[:, np.newaxis])
+        ids[~finite] = 0
+        ids = ids.astype(np.int64) // factor[:, np.newaxis] - start[:, np.newaxis] + \
+            offsets[:-1, np.newaxis]
+        counts = np.bincount(ids[finite], minlength=offsets[-1])
+        cumcounts = np.cumsum(counts)
+        before_row = np.concatenate(([0], cumcounts))[offsets[:-1]]
+        inx = np.searchsorted(cumcounts, before_row[:, np.newaxis] + target) - \
+            offsets[:-1, np.newaxis]
+        inx = np.minimum(inx, nbins[:, np.newaxis] - 1)
+        ginx = offsets[:-1, np.newaxis] + inx
+        before = np.where(inx > 0, cumcounts[ginx - 1] - before_row[:, np.newaxis], 0)
+        counts = counts[ginx]
+    else:
+        # more bins than data: the quantile is in the bin of the element of rank ceil(target):
+        rank = np.clip(np.ceil(target).astype(np.int64) - 1, 0,
+                       np.maximum(count, 1)[:, np.newaxis] - 1)
+        if np.all(count == count[0]):
+            values = np.partition(values, np.unique(rank), axis=1)
+        else:
+            values = np.sort(values, axis=1)
+        selected = values[np.arange(nrows)[:, np.newaxis], rank]
+        selected[~valid] = 0.0
+        inx = np.floor(selected / bin_width[:, np.newaxis]).astype(np.int64) // \
+            factor[:, np.newaxis] - start[:, np.newaxis]
+        # count the data below and within the bins from their edges:
+        width = (bin_width * factor)[:, np.newaxis]
+        lower = (start[:, np.newaxis] + inx) * width
+        before = np.sum(values[:, np.newaxis, :] < lower[:, :, np.newaxis], axis=2)
+        counts = np.sum(values[:, np.newaxis, :] < (lower + width)[:, :, np.newaxis], axis=2) - before
+    frac = (target - before) / np.maximum(counts, 1)
+    values = (start[:, np.newaxis] + inx + np.clip(frac, 0.0, 1.0)) * \
+        (bin_width * factor)[:, np.newaxis]
+    values = np.clip(values, min_value[:, np.newaxis], max_value[:, np.newaxis])
+    values[~valid] = np.nan
+    return values
+
+
+class WindowedThreshold(object):
+    """
+    Thresholds of non-overlapping windows lazily broadcast to the data.
+
+    Returned by the threshold estimators with compact=True. Behaves like
+    the array of the same size as the data holding the threshold of
+    the corresponding window for each data element, but stores only
+    one value per window. detect_peaks() uses it without
+    materializing the full array. Use np.asarray() to get the full array.
+
+    Member variables:
+      values (1-D array): the threshold of each window.
+      win_size (int): number of data elements of each window.
+      size (int): number of data elements.
+    """
+
+    def __init__(self, values, win_size, size):
+        """
+        Args:
+          values (1-D array): the threshold of each window.
+          win_size (int): number of data elements of each window.
+          size (int): number of data elements.
+        """
+        self.values = np.asarray(values)
+        self.win_size = int(win_size)
+        self.size = int(size)
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, key):
+        """Thresholds of the data elements selected by an index, a slice, or an index array."""
+        if isinstance(key, slice):
+            inx = np.arange(*key.indices(self.size))
+        else:
+            inx = np.asarray(key)
+            if np.any(inx >= self.size) or np.any(inx < -self.size):
+                raise IndexError('index out of bounds')
+            inx = np.where(inx < 0, inx + self.size, inx)
+        return self.values[inx // self.win_size]
+
+    def __array__(self, dtype=None):
+        return np.asarray(np.repeat(self.values, self.win_size)[:self.size], dtype=dtype)
+
+
+def _window_values(data, win_size_indices, func):
+    """Apply func to the rows of a (windows, samples) view of the data.
+
+    Args:
+        data (1-D or 2-D array): the data, for 2-D data (channels, samples).
+        win_size_indices (int): number of data elements of each window.
+        func (function): computes from a 2-D array a value for each row
+            (last dimension of the returned array).
+
+    Returns:
+        values (array of floats): the values of all full windows followed by the one
+            of the final incomplete window (last dimension), for 2-D data for each channel
+            (second to last dimension).
+    """
+    data = np.asarray(data)
+    channels = data.shape[:-1]
+    nrows = int(np.prod(channels))
+    n = data.shape[-1]
+    rows = data.reshape(nrows, n)
+    nwins = n // win_size_indices
+    values = []
+    if nwins > 0:
+        v = func(rows[:, :nwins * win_size_indices].reshape(nrows * nwins, win_size_indices))
+        values.append(v.reshape(v.shape[:-1] + (nrows, nwins)))
+    if nwins * win_size_indices < n:
+        v = func(rows[:, nwins * win_size_indices:])
+        values.append(v.reshape(v.shape[:-1] + (nrows, 1)))
+    values = np.concatenate(values, axis=-1).astype(np.float64)
+    return values.reshape(values.shape[:-2] + channels + values.shape[-1:])
+
+
+def _window_threshold(values, win_size_indices, size, compact, axis=0):
+    """Thresholds of the windows as WindowedThreshold or as array for each data element.
+
+    For 2-D values (channels, windows) an array with samples along axis is returned.
+    """
+    if np.ndim(values) > 1:
+        if compact:
+            raise ValueError('compact thresholds are only supported for 1-D data!')
+        return np.moveaxis(np.repeat(values, win_size_indices, axis=-1)[..., :size], -1, axis)
+    threshold = WindowedThreshold(values, win_size_indices, size)
+    if compact:
+        return threshold
+    return np.asarray(threshold, dtype=np.float64)
+
+
+def _samples_last(data, axis):
+    """Data as array with the samples along the last dimension."""
+    data = np.asarray(data)
+    if data.ndim > 1:
+        data = np.moveaxis(data, axis, -1)
+    return data
+
+
+def std_threshold(data, samplerate=None, win_size=None, th_factor=5., compact=False, axis=0):
     """Esimates a threshold for detect_peaks() based on the standard deviation of the data.
 
     The threshold is computed as the standard deviation of the data multiplied with th_factor.
 
     If samplerate and win_size is given, then the threshold is computed for
     each non-overlapping window of duration win_size separately.
-    In this case the returned threshold is an array of the same size as data.
+    In this case the returned threshold is an array of the same size as data,
+    or a WindowedThreshold if compact is True.
     Without a samplerate and win_size a single threshold value determined from
     the whole data array is returned.
+    For 2-D data the thresholds are computed for each channel,
+    i.e. along axis, resulting in an array of thresholds for the channels
+    or a 2-D array of the shape of data.
 
-    :param data: (1-D array). The data to be analyzed.
+    :param data: (1-D or 2-D array). The data to be analyzed.
     :param samplerate: (float or None). Sampling rate of the data in Hz.
     :param win_size: (float or None). Size of window in which a threshold value is computed.
     :param th_factor: (float). Factor by which the standard deviation is multiplied to set the threshold.
-    :return: threshold: (float or 1-D array). The computed threshold.
+    :param compact: (boolean). Return the thresholds of the windows as a WindowedThreshold.
+    :param axis: (int). For 2-D data the axis of the samples.
+    :return: threshold: (float or array or WindowedThreshold). The computed threshold.
     """
 
+    data = _samples_last(data, axis)
     if samplerate and win_size:
-        threshold = np.zeros(len(data))
         win_size_indices = int(win_size * samplerate)
+        std = _window_values(data, win_size_indices, lambda x: np.std(x, axis=1, ddof=1))
+        return _window_threshold(std * th_factor, win_size_indices, data.shape[-1], compact, axis)
+    else:
+        return np.std(data, axis=-1, ddof=1) * th_factor
 
-        for inx0 in range(0, len(data), win_size_indices):
-            inx1 = inx0 + win_size_indices
-            std = np.std(data[inx0:inx1], ddof=1)
-            threshold[inx0:inx1] = std * th_factor
-        return threshold
+
+def _hist_width(data, nbins, hist_height):
+    """Lower and upper edge of the histograms of each row of data at hist_height relative height.
+
+    Same bins as np.histogram() for each row.
+    """
+    nrows = data.shape[0]
+    if np.isscalar(nbins):
+        # equally spaced bins between minimum and maximum of each row:
+        bin_type = data.dtype if np.issubdtype(data.dtype, np.inexact) else np.float64
+        first = np.min(data, axis=1).astype(bin_type)
+        last = np.max(data, axis=1).astype(bin_type)
+        same = first == last
+        first[same] -= 0.5
+        last[same] += 0.5
+        edges = np.linspace(first.astype(np.float64), last.astype(np.float64),
+                            nbins + 1, axis=1).astype(bin_type)
+        inx = ((data - first[:, None]) / (last - first)[:, None] * nbins).astype(np.intp)
+        inx[inx == nbins] -= 1
+        # correct for rounding errors as np.histogram() does:
+        rows = np.arange(nrows)[:, None]
+        inx[data < edges[rows, inx]] -= 1
+        inx[(data >= edges[rows, inx + 1]) & (inx != nbins - 1)] += 1
+        counts = np.bincount((inx + rows * nbins).ravel(),
+                             minlength=nrows * nbins).reshape(nrows, nbins)
+        widths = np.diff(edges, axis=1)
     else:
-        return np.std(data, ddof=1) * th_factor
+        edges = np.broadcast_to(np.asarray(nbins, dtype=np.float64), (nrows, len(nbins)))
+        nbins = len(nbins) - 1
+        inx = np.searchsorted(edges[0], data, side='right') - 1
+        inx[data == edges[0, -1]] = nbins - 1
+        valid = (inx >= 0) & (inx < nbins)
+        rows = np.broadcast_to(np.arange(nrows)[:, None], inx.shape)
+        counts = np.bincount(inx[valid] + rows[valid] * nbins,
+                             minlength=nrows * nbins).reshape(nrows, nbins)
+        widths = np.diff(edges, axis=1)
+    # density only matters for unequal bins:
+    hist = counts / widths
+    above = hist > np.max(hist, axis=1)[:, None] * hist_height
+    rows = np.arange(nrows)
+    lower = edges[rows, np.argmax(above, axis=1)]
+    # needs to return the next bin:
+    upper = edges[rows, nbins - np.argmax(above[:, ::-1], axis=1)]
+    return lower, upper
+
 
-    
 def hist_threshold(data, samplerate=None, win_size=None, th_factor=5.,
-                   nbins=100, hist_height=1.0/ np.sqrt(np.e)):
+                   nbins=100, hist_height=1.0/ np.sqrt(np.e), compact=False, axis=0):
     """Esimate a threshold for detect_peaks() based on a histogram of the data.
 
     The standard deviation of the data is estimated from the
@@ -492,39 +1945,51 @@ def hist_threshold(data, samplerate=None, win_size=None, th_factor=5.,
 
     If samplerate and win_size is given, then the threshold is computed for
     each non-overlapping window of duration win_size separately.
-    In this case the returned threshold is an array of the same size as data.
+    In this case the returned threshold is an array of the same size as data,
+    or a WindowedThreshold if compact is True.
     Without a samplerate and win_size a single threshold value determined from
     the whole data array is returned.
+    For 2-D data the thresholds are computed for each channel, i.e. along axis.
+    If data is a QuantileSketch, its histogram is used.
 
     Args:
-        data (1-D array): the data to be analyzed.
+        data (1-D or 2-D array or QuantileSketch): the data to be analyzed.
         samplerate (float or None): sampling rate of the data in Hz.
         win_size (float or None): Size of window in which a threshold value is computed in sec.
         th_factor (float): factor by which the width of the histogram is multiplied to set the threshold.
         nbins (int or list of floats): number of bins or the bins for computing the histogram.
         hist_height (float): height between 0 and 1 at which the width of the histogram is computed.
+        compact (boolean): return the thresholds and centers of the windows as WindowedThreshold.
+        axis (int): for 2-D data the axis of the samples.
 
     Returns:
-        threshold (float or 1-D array): the computed threshold.
-        center (float or 1-D array): the center (mean) of the width of the histogram.
+        threshold (float or array or WindowedThreshold): the computed threshold.
+        center (float or array or WindowedThreshold): the center (mean) of the width of the histogram.
     """
 
+    if isinstance(data, QuantileSketch):
+        hist, bins = data.histogram(nbins)
+        inx = hist > np.max(hist) * hist_height
+        lower = bins[0:-1][inx][0]
+        upper = bins[1:][inx][-1]  # needs to return the next bin
+        return 0.5 * (upper - lower) * th_factor, 0.5 * (lower + upper)
+    data = _samples_last(data, axis)
     if samplerate and win_size:
-        threshold = np.zeros(len(data))
-        centers = np.zeros(len(data))
         win_size_indices = int(win_size * samplerate)
-
-        for inx0 in range(0, len(data), win_size_indices):
-            inx1 = inx0 + win_size_indices
-            hist, bins = np.histogram(data[inx0:inx1], nbins, density=True)
-            inx = hist > np.max(hist) * hist_height
-            lower = bins[0:-1][inx][0]
-            upper = bins[1:][inx][-1]  # needs to return the next bin
-            center = 0.5 * (lower + upper)
-            std = 0.5 * (upper - lower)
-            threshold[inx0:inx1] = std * th_factor
-            centers[inx0:inx1] = center
-        return threshold, centers
+        def sum_diff(x):
+            lower, upper = _hist_width(x, nbins, hist_height)
+            return np.array([lower + upper, upper - lower])
+
+        bin_sums, bin_diffs = _window_values(data, win_size_indices, sum_diff)
+        center = 0.5 * bin_sums
+        std = 0.5 * bin_diffs
+        return (_window_threshold(std * th_factor, win_size_indices, data.shape[-1], compact, axis),
+                _window_threshold(center, win_size_indices, data.shape[-1], compact, axis))
+    elif data.ndim > 1:
+        lower, upper = _hist_width(data.reshape(-1, data.shape[-1]), nbins, hist_height)
+        center = 0.5 * (lower + upper).astype(np.float64)
+        std = 0.5 * (upper - lower).astype(np.float64)
+        return (std * th_factor).reshape(data.shape[:-1]), center.reshape(data.shape[:-1])
     else:
         hist, bins = np.histogram(data, nbins, density=True)
         inx = hist > np.max(hist) * hist_height
@@ -535,7 +2000,7 @@ def hist_threshold(data, samplerate=None, win_size=None, th_factor=5.,
         return std * th_factor, center
 
     
-def minmax_threshold(data, samplerate=None, win_size=None, th_factor=0.8):
+def minmax_threshold(data, samplerate=None, win_size=None, th_factor=0.8, compact=False, axis=0):
     """Esimate a threshold for detect_peaks() based on minimum and maximum values of the data.
 
     The threshold is computed as the difference between maximum and
@@ -543,7 +2008,8 @@ def minmax_threshold(data, samplerate=None, win_size=None, th_factor=0.8):
 
     If samplerate and win_size is given, then the threshold is computed for
     each non-overlapping window of duration win_size separately.
-    In this case the returned threshold is an array of the same size as data.
+    In this case the returned threshold is an array of the same size as data,
+    or a WindowedThreshold if compact is True.
     Without a samplerate and win_size a single threshold value determined from
     the whole data array is returned.
 
@@ -551,27 +2017,24 @@ def minmax_threshold(data, samplerate=None, win_size=None, th_factor=0.8):
     :param samplerate: (float or None). Sampling rate of the data in Hz.
     :param win_size: (float or None). Size of window in which a threshold value is computed.
     :param th_factor: (float). Factor by which the difference between minimum and maximum data value is multiplied to set the threshold.
+    :param compact: (boolean). Return the thresholds of the windows as a WindowedThreshold.
+    :param axis: (int). For 2-D data the axis of the samples, thresholds are computed for each channel.
 
-    :return: threshold: (float or 1-D array). The computed threshold.
+    :return: threshold: (float or array or WindowedThreshold). The computed threshold.
     """
+    data = _samples_last(data, axis)
     if samplerate and win_size:
-        threshold = np.zeros(len(data))
         win_size_indices = int(win_size * samplerate)
-
-        for inx0 in range(0, len(data), win_size_indices):
-            inx1 = inx0 + win_size_indices
-
-            window_min = np.min(data[inx0:inx1])
-            window_max = np.max(data[inx0:inx1])
-
-            threshold[inx0:inx1] = (window_max - window_min) * th_factor
-        return threshold
+        ranges = _window_values(data, win_size_indices,
+                                lambda x: np.max(x, axis=1) - np.min(x, axis=1))
+        return _window_threshold(ranges * th_factor, win_size_indices, data.shape[-1], compact, axis)
 
     else:
-        return (np.max(data) - np.min(data)) * th_factor
+        return (np.max(data, axis=-1) - np.min(data, axis=-1)) * th_factor
 
 
-def percentile_threshold(data, samplerate=None, win_size=None, th_factor=0.8, percentile=0.1):
+def percentile_threshold(data, samplerate=None, win_size=None, th_factor=0.8, percentile=0.1,
+                         compact=False, sketch_bins=None, axis=0):
     """Esimate a threshold for detect_peaks() based on an inter-percentile range of the data.
 
     The threshold is computed as the range between the percentile and
@@ -586,33 +2049,80 @@ def percentile_threshold(data, samplerate=None, win_size=None, th_factor=0.8, pe
 
     If samplerate and win_size is given, then the threshold is computed for
     each non-overlapping window of duration win_size separately.
-    In this case the returned threshold is an array of the same size as data.
+    In this case the returned threshold is an array of the same size as data,
+    or a WindowedThreshold if compact is True.
     Without a samplerate and win_size a single threshold value determined from
     the whole data array is returned.
 
-    :param data: (1-D array). The data to be analyzed.
+    With sketch_bins the percentiles are approximated by a QuantileSketch
+    instead of sorting the data. data can also be a QuantileSketch
+    that has been filled with the data before.
+
+    :param data: (1-D array or QuantileSketch). The data to be analyzed.
     :param samplerate: (float or None). Sampling rate of the data in Hz.
     :param win_size: (float or None). Size of window in which a threshold value is computed.
     :param percentile: (int). The interpercentile range is computed at percentile and 100.0-percentile.
     :param th_factor: (float). Factor by which the inter-percentile range of the data is multiplied to set the threshold.
+    :param compact: (boolean). Return the thresholds of the windows as a WindowedThreshold.
+    :param sketch_bins: (int or None). If not None, maximum number of bins of the QuantileSketch
+    used for approximating the percentiles.
+    :param axis: (int). For 2-D data the axis of the samples, thresholds are computed for each channel.
 
-    :return: threshold: (float or 1-D array). The computed threshold.
+    :return: threshold: (float or 1-D array or WindowedThreshold). The computed threshold.
     """
+    if isinstance(data, QuantileSketch):
+        return np.abs(np.diff(data.percentile([100.0 - percentile, percentile])))[0] * th_factor
+    if sketch_bins:
+        def window_range(x):
+            return np.abs(np.diff(_sketch_percentiles(x, sketch_bins, [100.0 - percentile, percentile]),
+                                  axis=1))[:, 0]
+    else:
+        def window_range(x):
+            return np.abs(np.diff(np.percentile(x, [100.0 - percentile, percentile], axis=1), axis=0))[0]
+    data = _samples_last(data, axis)
     if samplerate and win_size:
-        threshold = np.zeros(len(data))
         win_size_indices = int(win_size * samplerate)
-
-        for inx0 in range(0, len(data), win_size_indices):
-            inx1 = inx0 + win_size_indices
-            threshold[inx0:inx1] = np.squeeze(np.abs(np.diff(
-                np.percentile(data[inx0:inx1], [100.0 - percentile, percentile])))) * th_factor
-        return threshold
+        ranges = _window_values(data, win_size_indices, window_range)
+        return _window_threshold(ranges * th_factor, win_size_indices, data.shape[-1], compact, axis)
+    elif sketch_bins or data.ndim > 1:
+        ranges = window_range(data.reshape(-1, data.shape[-1])) * th_factor
+        return ranges.reshape(data.shape[:-1]) if data.ndim > 1 else ranges[0]
     else:
         return np.squeeze(np.abs(np.diff(
             np.percentile(data, [100.0 - percentile, percentile])))) * th_factor
 
 
-def snippets(data, indices, start=-10, stop=10):
+def _sliding_windows(data, width):
+    """Zero-copy 2-D view of all windows of width consecutive elements of data."""
+    data = np.asarray(data)
+    if width > len(data):
+        return np.zeros((0, width), dtype=data.dtype)
+    if sliding_window_view is not None:
+        return sliding_window_view(data, width)
+    n = max(0, len(data) - width + 1)
+    return np.lib.stride_tricks.as_strided(data, shape=(n, width),
+                                           strides=(data.strides[0], data.strides[0]),
+                                           writeable=False)
+
+
+def snippet_windows(data, indices, start=-10, stop=10):
+    """
+    Zero-copy access to the data around each position given in indices.
+
+    :param data: (1-D array) Data array from which snippets are extracted.
+    :param indices: (list of int) Indices around which snippets are cut out.
+    :param start: (int) Each snippet starts at index + start.
+    :param stop: (int) Each snippet ends at index + stop.
+    :return windows: (2-D array) Read-only view of all windows of stop-start data elements.
+    :return rows: (1-D array of int) For each valid index the row of its snippet in windows,
+    i.e. windows[rows[k]] is the k-th snippet, a view into data.
+    """
+    indices = np.asarray(indices, dtype=int)
+    idxs = indices[(indices>=-start) & (indices<len(data)-stop)]
+    return _sliding_windows(data, stop-start), idxs+start
+
+
+def snippets(data, indices, start=-10, stop=10, dtype=np.float64):
     """
     Cut out data arround each position given in indices.
 
@@ -620,13 +2130,50 @@ def snippets(data, indices, start=-10, stop=10):
     :param indices: (list of int) Indices around which snippets are cut out.
     :param start: (int) Each snippet starts at index + start.
     :param stop: (int) Each snippet ends at index + stop.
+    :param dtype: (numpy dtype or None) Type of the snippets, e.g. np.float32 to halve the memory.
+    If None, the type of the data.
     :return snippet_data: (2-D array) The snippets: first index number of snippet, second index time.
     """
-    idxs = indices[(indices>=-start) & (indices<len(data)-stop)]
-    snippet_data = np.empty((len(idxs), stop-start))
-    for k, idx in enumerate(idxs):
-        snippet_data[k] = data[idx+start:idx+stop]
-    return snippet_data
+    windows, rows = snippet_windows(data, indices, start, stop)
+    return np.asarray(windows[rows], dtype=dtype)
+
+
+def snippets_mean_std(data, indices, start=-10, stop=10, ddof=1, chunk_size=4096):
+    """
+    Mean and standard deviation of the data around each position given in indices.
+
+    Same as the mean and standard deviation over the first axis of snippets(),
+    but the snippets are processed in chunks of chunk_size and are therefore
+    never all materialized at once.
+
+    :param data: (1-D array) Data array from which snippets are extracted.
+    :param indices: (list of int) Indices around which snippets are cut out.
+    :param start: (int) Each snippet starts at index + start.
+    :param stop: (int) Each snippet ends at index + stop.
+    :param ddof: (int) Delta degrees of freedom of the standard deviation.
+    :param chunk_size: (int) Number of snippets processed at once.
+    :return mean: (1-D array) The mean of the snippets.
+    :return std: (1-D array) The standard deviation of the snippets.
+    """
+    windows, rows = snippet_windows(data, indices, start, stop)
+    n = 0
+    mean = np.zeros(stop-start)
+    m2 = np.zeros(stop-start)
+    for k in range(0, len(rows), chunk_size):
+        chunk = np.asarray(windows[rows[k:k+chunk_size]], dtype=np.float64)
+        nc = len(chunk)
+        chunk_mean = np.mean(chunk, axis=0)
+        chunk_m2 = np.sum((chunk - chunk_mean)**2, axis=0)
+        # combine with previous chunks (Chan et al.):
+        delta = chunk_mean - mean
+        mean = mean + delta*nc/(n+nc)
+        m2 = m2 + chunk_m2 + delta**2*n*nc/(n+nc)
+        n += nc
+    if n == 0:
+        mean[:] = np.nan
+    with np.errstate(divide='ignore', invalid='ignore'):
+        std = np.sqrt(m2/(n-ddof)) if n > ddof else np.zeros(stop-start) + np.nan
+    return mean, std
 
 
 def trim(peaks, troughs):
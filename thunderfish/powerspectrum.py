@@ -9,9 +9,21 @@ psd():                  Compute power spectrum with a given frequency resolution
 decibel():              Transforms power to decibel.
 plot_decibel_psd():     Plot power spectrum in decibel.
 multi_resolution_psd(): Performs the steps to calculate a powerspectrum.
+PSD:                    Power spectrum and its frequencies as returned by psd() and multi_resolution_psd().
 spectrogram():          Spectrogram of a given frequency resolution and overlap fraction.
+multichannel_spectrogram(): Spectrogram summed over the channels of multichannel data.
+running_psds():         Running averages of the power spectra of a spectrogram.
+
+SpectrogramEngine:      Spectrogram and psd computation with cached window and frame plans.
+spectrogram_engine():   Cached SpectrogramEngine for a given set of spectral parameters.
+StreamingSpectrogram:   Spectrogram of consecutive data blocks, e.g. from a DataLoader.
+
+add_precision_config(): add parameter for the floating point precision to configuration.
+precision_args():       retrieve the floating point type from configuration.
 """
 
+from collections import namedtuple
+from multiprocessing import cpu_count
 import numpy as np
 import scipy.signal as scps
 
@@ -20,6 +32,16 @@ try:
 except ImportError:
     pass
 
+try:
+    import scipy.fft as spfft
+except ImportError:
+    spfft = None
+
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    ThreadPoolExecutor = None
+
 
 def next_power_of_two(n):
     """The next integer power of two for an arbitray number.
@@ -48,9 +70,384 @@ def nfft_noverlap(freq_resolution, samplerate, overlap_frac, min_nfft=16):
     return nfft, noverlap
 
 
+class SpectrogramEngine(object):
+    """
+    Spectrogram and power spectrum density computation for fixed spectral parameters.
+
+    The window function, the frequency axis and the scaling of the
+    one-sided power spectrum density are computed only once on construction.
+    The data are cut into frames by zero-copy strided views, and the
+    spectra are computed by a real-input FFT (scipy.fft, if available,
+    optionally with multiple workers, numpy.fft otherwise).
+
+    The results equal the ones of matplotlib.mlab.specgram() and
+    matplotlib.mlab.psd() for real data with sides='default' and pad_to=None.
+
+    If max_freq is given, only the frequencies up to max_freq are kept
+    right after the FFT. The returned spectra and all further processing
+    then scale with the analysed frequency band and not with the sampling rate.
+
+    Multichannel data (time as first, channels as second dimension) are
+    transformed in a single batched FFT over frames and channels by
+    multichannel_spectrogram().
+
+    Member variables:
+      samplerate (float): the sampling rate of the data in Hertz.
+      nfft (int): the number of data points used for each FFT.
+      noverlap (int): the number of data points by which successive frames overlap.
+      step (int): the number of data points between successive frames.
+      window (1-D array): the window function.
+      freqs (1-D array): the frequencies of the power spectra.
+      dtype (numpy dtype): the floating point type of the computed power spectra.
+    """
+
+    def __init__(self, samplerate, nfft, noverlap=0, window=mlab.window_hanning,
+                 detrend=mlab.detrend_none, scale_by_freq=None, max_freq=None, max_frames=64,
+                 dtype=np.float64):
+        """
+        Parameters
+        ----------
+        samplerate: float
+            Sampling rate of the data in Hertz.
+        nfft: int
+            Number of data points used for each FFT.
+        noverlap: int
+            Number of data points by which successive frames overlap.
+        window: function or 1-D array
+            Window function or window of length nfft.
+        detrend: function
+            Detrend function applied to each frame (see matplotlib.mlab.detrend()).
+        scale_by_freq: boolean or None
+            If True or None, scale the power spectrum density by the sampling rate.
+        max_freq: float or None
+            If not None, only frequencies up to max_freq are returned.
+        max_frames: int
+            Maximum number of frames transformed at once.
+        dtype: numpy dtype
+            Floating point type used for windowing, FFTs (with scipy.fft), and the returned power.
+            np.float32 halves the needed memory.
+
+        Raises
+        ------
+        ValueError:
+            If noverlap is not smaller than nfft or the window length differs from nfft.
+        """
+        if noverlap >= nfft:
+            raise ValueError('noverlap must be smaller than nfft!')
+        self.samplerate = float(samplerate)
+        self.nfft = int(nfft)
+        self.noverlap = int(noverlap)
+        self.step = self.nfft - self.noverlap
+        if np.iterable(window):
+            self.window = np.asarray(window, dtype=float)
+        else:
+            self.window = window(np.ones(self.nfft))
+        if len(self.window) != self.nfft:
+            raise ValueError('the window length must match nfft!')
+        self.detrend = detrend
+        self.max_frames = max_frames
+        self.freqs = np.fft.rfftfreq(self.nfft, 1.0/self.samplerate)
+        # scaling of the one-sided power spectrum density
+        # (everything except the DC and for even nfft the nfft/2 component is doubled):
+        self.scale = np.ones(len(self.freqs))
+        if self.nfft % 2 == 0:
+            self.scale[1:-1] *= 2.0
+        else:
+            self.scale[1:] *= 2.0
+        if scale_by_freq is None or scale_by_freq:
+            self.scale /= self.samplerate * np.sum(self.window**2)
+        else:
+            self.scale /= np.sum(self.window)**2
+        # band limit:
+        self.nfreqs = len(self.freqs)
+        if max_freq is not None:
+            self.nfreqs = max(1, np.sum(self.freqs <= max_freq))
+            self.freqs = self.freqs[:self.nfreqs]
+            self.scale = self.scale[:self.nfreqs]
+        self.dtype = np.dtype(dtype)
+        self.window = self.window.astype(self.dtype)
+        self.scale = self.scale.astype(self.dtype)
+
+    def nframes(self, n):
+        """
+        The number of frames of a data array.
+
+        Parameters
+        ----------
+        n: int
+            Number of data points.
+
+        Returns
+        -------
+        nframes: int
+            Number of frames the data are cut into.
+        """
+        if n < self.nfft:
+            return 1
+        return (n - self.nfft) // self.step + 1
+
+    def frames(self, data):
+        """
+        Cut the data into overlapping frames.
+
+        Parameters
+        ----------
+        data: 1-D or 2-D array
+            The data, time as first and channels as optional second dimension.
+
+        Returns
+        -------
+        frames: 2-D or 3-D array
+            Read-only view into data (or into a zero-padded copy, if data are shorter than nfft)
+            with the frames as first, the data points of each frame as second,
+            and the channels as optional third dimension.
+        """
+        data = np.asarray(data)
+        if len(data) < self.nfft:
+            padded = np.zeros((self.nfft,) + data.shape[1:], dtype=data.dtype)
+            padded[:len(data)] = data
+            data = padded
+        return np.lib.stride_tricks.as_strided(data, shape=(self.nframes(len(data)), self.nfft) + data.shape[1:],
+                                               strides=(self.step*data.strides[0],) + data.strides,
+                                               writeable=False)
+
+    def times(self, n):
+        """
+        Times of the frames of a data array.
+
+        Parameters
+        ----------
+        n: int
+            Number of data points.
+
+        Returns
+        -------
+        time: 1-D array
+            The times of the centers of the frames in seconds.
+        """
+        return (0.5*self.nfft + self.step*np.arange(self.nframes(n)))/self.samplerate
+
+    def _power(self, frames, workers=1):
+        """
+        Power spectrum densities of frames.
+
+        Parameters
+        ----------
+        frames: 2-D or 3-D array
+            Frames (first dimension) of nfft data points (second dimension),
+            optionally of several channels (third dimension).
+        workers: int
+            Number of workers used by scipy.fft.
+
+        Returns
+        -------
+        power: 2-D or 3-D array
+            Power spectrum densities, frames as first, frequencies as second,
+            and channels as optional third dimension.
+        """
+        window = self.window
+        scale = self.scale
+        if frames.ndim > 2:
+            window = window[:, np.newaxis]
+            scale = scale[:, np.newaxis]
+        if self.detrend is not mlab.detrend_none:
+            frames = mlab.detrend(frames, self.detrend, axis=1)
+        windowed = np.multiply(frames, window, dtype=self.dtype)
+        if spfft is not None:
+            spec = spfft.rfft(windowed, axis=1, workers=workers, overwrite_x=True)
+        else:
+            spec = np.fft.rfft(windowed, axis=1)
+        spec = spec[:, :self.nfreqs]
+        power = spec.real**2
+        power += spec.imag**2
+        power *= scale
+        if power.dtype != self.dtype:
+            power = power.astype(self.dtype)
+        return power
+
+    def spectrogram(self, data, workers=1):
+        """
+        Spectrogram of the data.
+
+        Parameters
+        ----------
+        data: 1-D array
+            The data.
+        workers: int
+            Number of workers used by scipy.fft for computing the FFTs.
+
+        Returns
+        -------
+        spectrum: 2-D array
+            The power spectrum densities with frequencies as first and time as second dimension.
+        freqs: 1-D array
+            The frequencies of the spectrogram.
+        time: 1-D array
+            The times of the centers of the frames.
+        """
+        frames = self.frames(data)
+        spectrum = np.empty((len(frames), len(self.freqs)), dtype=self.dtype)
+        for k in range(0, len(frames), self.max_frames):
+            spectrum[k:k+self.max_frames] = self._power(frames[k:k+self.max_frames], workers)
+        return spectrum.T, self.freqs, self.times(len(data))
+
+    def psd(self, data, workers=1):
+        """
+        Power spectrum density of the data averaged over all frames.
+
+        Parameters
+        ----------
+        data: 1-D array
+            The data.
+        workers: int
+            Number of workers used by scipy.fft for computing the FFTs.
+
+        Returns
+        -------
+        power: 1-D array
+            The power spectrum density.
+        freqs: 1-D array
+            The frequencies of the power spectrum.
+        """
+        frames = self.frames(data)
+        power = np.zeros(len(self.freqs), dtype=self.dtype)
+        for k in range(0, len(frames), self.max_frames):
+            power += np.sum(self._power(frames[k:k+self.max_frames], workers), axis=0)
+        power /= len(frames)
+        return power, self.freqs
+
+    def multichannel_spectrogram(self, data, workers=1, threads=1, channel_power=False):
+        """
+        Spectrogram summed over all channels of multichannel data.
+
+        The frames of all channels are transformed in one batched FFT.
+        Groups of channels can be processed in parallel by a pool of threads.
+        The spectra of the channel groups are summed up in place.
+
+        Parameters
+        ----------
+        data: 2-D array
+            The data with time as first and channels as second dimension.
+        workers: int
+            Number of workers used by scipy.fft for computing the FFTs.
+        threads: int or None
+            Number of threads processing groups of channels in parallel.
+            If None use as many threads as there are CPUs.
+        channel_power: boolean
+            If True, return in addition the spectrogram of each channel.
+
+        Returns
+        -------
+        spectrum: 2-D array
+            The power spectrum densities summed over channels with frequencies
+            as first and time as second dimension.
+        freqs: 1-D array
+            The frequencies of the spectrogram.
+        time: 1-D array
+            The times of the centers of the frames.
+        channel_spectrum: 3-D array or None
+            If channel_power is True, the power spectrum densities of each channel
+            with channels as first, frequencies as second, and time as third dimension.
+        """
+        data = np.asarray(data)
+        if data.ndim == 1:
+            data = data[:, np.newaxis]
+        nchannels = data.shape[1]
+        nframes = self.nframes(len(data))
+        spectrum = np.zeros((nframes, len(self.freqs)), dtype=self.dtype)
+        channel_spectrum = None
+        if channel_power:
+            channel_spectrum = np.empty((nframes, len(self.freqs), nchannels), dtype=self.dtype)
+        # limit the size of the batches of frames and channels:
+        max_frames = max(1, self.max_frames // nchannels)
+
+        def channel_group_spectrum(channels):
+            # channels is a slice, data[:, channels] is a view:
+            frames = self.frames(data[:, channels])
+            group_spectrum = np.zeros((nframes, len(self.freqs)), dtype=self.dtype)
+            for k in range(0, nframes, max_frames):
+                power = self._power(frames[k:k+max_frames], workers)
+                if channel_spectrum is not None:
+                    channel_spectrum[k:k+max_frames, :, channels] = power
+                np.sum(power, axis=2, out=group_spectrum[k:k+max_frames])
+            return group_spectrum
+
+        if threads is None:
+            threads = cpu_count()
+        threads = max(1, min(threads, nchannels))
+        bounds = np.linspace(0, nchannels, threads + 1).astype(int)
+        groups = [slice(c0, c1) for c0, c1 in zip(bounds[:-1], bounds[1:])]
+        if threads > 1 and ThreadPoolExecutor is not None:
+            with ThreadPoolExecutor(max_workers=threads) as pool:
+                for group_spectrum in pool.map(channel_group_spectrum, groups):
+                    spectrum += group_spectrum
+        else:
+            for channels in groups:
+                spectrum += channel_group_spectrum(channels)
+        if channel_spectrum is not None:
+            channel_spectrum = channel_spectrum.transpose(2, 1, 0)
+        return spectrum.T, self.freqs, self.times(len(data)), channel_spectrum
+
+
+_spectrogram_engines = {}
+
+
+def spectrogram_engine(samplerate, nfft, noverlap=0, window=mlab.window_hanning,
+                       detrend=mlab.detrend_none, scale_by_freq=None, max_freq=None, dtype=np.float64):
+    """
+    SpectrogramEngine for the given spectral parameters.
+
+    Engines are cached, i.e. the same engine is returned for the same parameters.
+
+    See SpectrogramEngine for the parameter.
+
+    Returns
+    -------
+    engine: SpectrogramEngine
+        The engine for the given parameters.
+    """
+    if np.iterable(window):
+        window_key = np.asarray(window, dtype=float).tobytes()
+    else:
+        window_key = window
+    key = (float(samplerate), int(nfft), int(noverlap), window_key, detrend, scale_by_freq, max_freq,
+           np.dtype(dtype))
+    if key not in _spectrogram_engines:
+        _spectrogram_engines[key] = SpectrogramEngine(samplerate, nfft, noverlap, window,
+                                                     detrend, scale_by_freq, max_freq,
+                                                     dtype=dtype)
+    return _spectrogram_engines[key]
+
+
+def _use_engine(data, nfft, pad_to, sides):
+    """
+    Whether a SpectrogramEngine can be used instead of matplotlib.mlab.
+
+    Parameters
+    ----------
+    data: array
+        The data.
+    nfft: int
+        The number of data points used for each FFT.
+    pad_to, sides:
+        See matplotlib.mlab.psd().
+
+    Returns
+    -------
+    use: boolean
+        True if the data are real and pad_to and sides do not require matplotlib.mlab.
+    """
+    return ((pad_to is None or pad_to == nfft) and sides in ['default', 'onesided'] and
+            not np.iscomplexobj(data))
+
+
+PSD = namedtuple('PSD', ['power', 'freqs'])
+"""Power spectrum density (PSD.power or [0]) and its frequencies (PSD.freqs or [1])."""
+
+
 def psd(data, samplerate, fresolution, min_nfft=16, detrend=mlab.detrend_none,
         window=mlab.window_hanning, overlap_frac=0.5, pad_to=None,
-        sides='default', scale_by_freq=None):
+        sides='default', scale_by_freq=None, workers=1, max_freq=None, dtype=np.float64):
     """Power spectrum density of a given frequency resolution.
 
     From the requested frequency resolution and the samplerate nfft is computed.
@@ -59,15 +456,28 @@ def psd(data, samplerate, fresolution, min_nfft=16, detrend=mlab.detrend_none,
     :param samplerate:          (float) sampling rate of the data in Hertz.
     :param fresolution:         (float) frequency resolution of the psd in Hertz.
     :param overlap_frac:             (float) fraction of overlap for the fft windows.
+    :param workers:             (int) number of workers used for computing the FFTs.
+    :param max_freq:            (float or None) if not None only frequencies up to max_freq are returned.
+    :param dtype:               (numpy dtype) floating point type of the power, np.float32 halves the needed memory.
     See numpy.psd for the remaining parameter.
 
-    :return:                    (2-D array) power and frequency.
+    :return:                    (PSD) power ([0]) and frequency ([1]).
     """
 
     nfft, noverlap = nfft_noverlap(fresolution, samplerate, overlap_frac, min_nfft=min_nfft)
+    if _use_engine(data, nfft, pad_to, sides):
+        engine = spectrogram_engine(samplerate, nfft, noverlap, window, detrend, scale_by_freq,
+                                    max_freq, dtype)
+        power, freqs = engine.psd(data, workers)
+        return PSD(power, freqs)
     power, freqs = mlab.psd(data, NFFT=nfft, noverlap=noverlap, Fs=samplerate, detrend=detrend, window=window,
                             pad_to=pad_to, sides=sides, scale_by_freq=scale_by_freq)
-    return np.asarray([np.squeeze(power), freqs])   # squeeze is necessary when nfft is to large with respect to the data
+    if max_freq is not None:
+        power = power[freqs <= max_freq]
+        freqs = freqs[freqs <= max_freq]
+    if not np.iscomplexobj(power):
+        power = power.astype(dtype, copy=False)
+    return PSD(np.squeeze(power), freqs)   # squeeze is necessary when nfft is to large with respect to the data
 
 
 def decibel(power, ref_power=1.0, min_power=1e-20):
@@ -90,11 +500,14 @@ def decibel(power, ref_power=1.0, min_power=1e-20):
     decibel_psd: array
         the power values in decibel
     """
+    power = np.asarray(power)
     if ref_power is None:
         ref_power = np.max(power)
-    decibel_psd = power.copy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        decibel_psd = power / ref_power
+        np.log10(decibel_psd, out=decibel_psd)
+    decibel_psd *= 10.0
     decibel_psd[power < min_power] = np.nan
-    decibel_psd[power >= min_power] = 10.0 * np.log10(decibel_psd[power >= min_power]/ref_power)
     return decibel_psd
 
 
@@ -138,31 +551,47 @@ def plot_decibel_psd(ax, freqs, power, ref_power=1.0, min_power=1e-20, max_freq=
 def multi_resolution_psd(data, samplerate, fresolution=0.5,
                          detrend=mlab.detrend_none, window=mlab.window_hanning,
                          overlap=0.5, pad_to=None, sides='default',
-                         scale_by_freq=None, min_nfft=16):
+                         scale_by_freq=None, min_nfft=16, max_freq=None, threads=None,
+                         dtype=np.float64):
     """Compute powerspectrum with a given frequency resolution.
 
     Two other functions are called to first calculate the nfft value and second calculate the powerspectrum. The given
     frequencyresolution can be a float or a list/array of floats.
+    The power spectra of multiple frequency resolutions are computed concurrently in a pool of threads
+    (the FFTs release the GIL). The data are converted only once and the windows of the FFTs are cached.
 
     (for information on further arguments see numpy.psd documentation)
     :param data:                (1-D array) data array you want to calculate a psd of.
     :param samplerate:          (float) sampling rate of the data in Hertz.
     :param fresolution:         (float or 1-D array) frequency resolutions for one or multiple psds in Hertz.
     :param overlap:             (float) fraction of overlap for the fft windows.
-    :return multi_psd_data:     (3-D or 2-D array) if the psd is calculated for one frequency resolution
-                                a 2-D array with the single power spectrum is returned (psd_data[power, freq]).
+    :param max_freq:            (float or None) if not None only frequencies up to max_freq are returned.
+    :param threads:             (int or None) maximum number of threads used for computing multiple psds.
+                                If None use one thread per frequency resolution, if 1 compute them sequentially.
+    :param dtype:               (numpy dtype) floating point type of the power, np.float32 halves the needed memory.
+    :return multi_psd_data:     (PSD or list of PSD) if the psd is calculated for one frequency resolution
+                                a single PSD with power and frequencies is returned (psd_data[power, freq]).
                                 If the psd is calculated for multiple frequency resolutions
-                                a list of 2-D array is returned (psd_data[frequency_resolution][power, freq]).
+                                a list of PSD is returned (psd_data[frequency_resolution][power, freq]).
     """
     return_list = True
     if not hasattr(fresolution, '__len__'):
         return_list = False
         fresolution = [fresolution]
 
-    multi_psd_data = []
-    for fres in fresolution:
-        psd_data = psd(data, samplerate, fres, min_nfft, detrend, window, overlap, pad_to, sides, scale_by_freq)
-        multi_psd_data.append(psd_data)
+    data = np.asarray(data)
+    if not np.iscomplexobj(data):
+        data = np.asarray(data, dtype=dtype)
+
+    def compute_psd(fres):
+        return psd(data, samplerate, fres, min_nfft, detrend, window, overlap, pad_to, sides,
+                   scale_by_freq, max_freq=max_freq, dtype=dtype)
+
+    if len(fresolution) > 1 and threads != 1 and ThreadPoolExecutor is not None:
+        with ThreadPoolExecutor(max_workers=threads or len(fresolution)) as pool:
+            multi_psd_data = list(pool.map(compute_psd, fresolution))
+    else:
+        multi_psd_data = [compute_psd(fres) for fres in fresolution]
 
     if not return_list:
         multi_psd_data = multi_psd_data[0]
@@ -171,7 +600,8 @@ def multi_resolution_psd(data, samplerate, fresolution=0.5,
 
 
 def spectrogram(data, samplerate, fresolution=0.5, detrend=mlab.detrend_none, window=mlab.window_hanning,
-                overlap_frac=0.5, pad_to=None, sides='default', scale_by_freq=None, min_nfft=16):
+                overlap_frac=0.5, pad_to=None, sides='default', scale_by_freq=None, min_nfft=16,
+                workers=1, max_freq=None, dtype=np.float64):
     """
     Spectrogram of a given frequency resolution.
 
@@ -179,18 +609,282 @@ def spectrogram(data, samplerate, fresolution=0.5, detrend=mlab.detrend_none, wi
     :param samplerate: (float) samplerate of data in Hertz.
     :param fresolution: (float) frequency resolution for the spectrogram.
     :param overlap_frac: (float) overlap of the nffts (0 = no overlap; 1 = total overlap).
+    :param workers: (int) number of workers used for computing the FFTs.
+    :param max_freq: (float or None) if not None only frequencies up to max_freq are returned.
+    :param dtype: (numpy dtype) floating point type of the spectrum, np.float32 halves the needed memory.
     :return spectrum: (2d array) contains for every timestamp the power of the frequencies listed in the array "freqs".
     :return freqs: (array) frequencies of the spectrogram.
     :return time: (array) time of the nffts.
     """
 
     nfft, noverlap = nfft_noverlap(fresolution, samplerate, overlap_frac, min_nfft=min_nfft)
+    if _use_engine(data, nfft, pad_to, sides):
+        engine = spectrogram_engine(samplerate, nfft, noverlap, window, detrend, scale_by_freq,
+                                    max_freq, dtype)
+        return engine.spectrogram(data, workers)
 
     spectrum, freqs, time = mlab.specgram(data, NFFT=nfft, Fs=samplerate, detrend=detrend, window=window,
                                           noverlap=noverlap, pad_to=pad_to, sides=sides, scale_by_freq=scale_by_freq)
+    if max_freq is not None:
+        spectrum = spectrum[freqs <= max_freq]
+        freqs = freqs[freqs <= max_freq]
+    if not np.iscomplexobj(spectrum):
+        spectrum = spectrum.astype(dtype, copy=False)
     return spectrum, freqs, time
 
 
+def multichannel_spectrogram(data, samplerate, fresolution=0.5, detrend=mlab.detrend_none,
+                             window=mlab.window_hanning, overlap_frac=0.5, scale_by_freq=None,
+                             min_nfft=16, workers=1, threads=1, channel_power=False, max_freq=None,
+                             dtype=np.float64):
+    """
+    Spectrogram of multichannel data summed over all channels.
+
+    The frames of all channels are transformed in a batched FFT, see
+    SpectrogramEngine.multichannel_spectrogram().
+
+    :param data: (2-D array) data with time as first and channels as second dimension.
+    :param samplerate: (float) sampling rate of the data in Hertz.
+    :param fresolution: (float) frequency resolution for the spectrogram.
+    :param overlap_frac: (float) overlap of the nffts (0 = no overlap; 1 = total overlap).
+    :param workers: (int) number of workers used for computing the FFTs.
+    :param threads: (int or None) number of threads processing groups of channels in parallel
+                    (None: as many as there are CPUs).
+    :param channel_power: (boolean) if True return in addition the spectrogram of each channel.
+    :param max_freq: (float or None) if not None only frequencies up to max_freq are returned.
+    :param dtype: (numpy dtype) floating point type of the spectrum, np.float32 halves the needed memory.
+    :return spectrum: (2d array) power of the frequencies "freqs" summed over channels for every timestamp.
+    :return freqs: (array) frequencies of the spectrogram.
+    :return time: (array) time of the nffts.
+    :return channel_spectrum: (3d array or None) if channel_power, the spectrogram of each channel
+                              (channels, frequencies, time).
+    """
+    nfft, noverlap = nfft_noverlap(fresolution, samplerate, overlap_frac, min_nfft=min_nfft)
+    engine = spectrogram_engine(samplerate, nfft, noverlap, window, detrend, scale_by_freq, max_freq, dtype)
+    return engine.multichannel_spectrogram(data, workers, threads, channel_power)
+
+
+def running_psds(spectrum, nffts_per_psd, out=None):
+    """
+    Running averages of the power spectra of a spectrogram.
+
+    The averages are computed by adding up nffts_per_psd shifted views
+    of the spectrogram in place, i.e. the cost is proportional to
+    the size of the spectrogram and only a single array for all
+    averaged power spectra is allocated. The results are identical to
+    np.mean(spectrum[:, t:t+nffts_per_psd], axis=1) for each time t.
+
+    Parameters
+    ----------
+    spectrum: 2-D array
+        Spectrogram as returned by spectrogram() with frequencies as first and time as second dimension.
+    nffts_per_psd: int
+        Number of successive power spectra of the spectrogram averaged into a single power spectrum.
+    out: 2-D array or None
+        If not None, the averaged power spectra are added to this array in place.
+        Use this for summing up the power spectra of several channels.
+
+    Returns
+    -------
+    power: 2-D array
+        The averaged power spectra with time as first and frequency as second dimension.
+        This is out, if out was specified.
+    """
+    npsds = spectrum.shape[1] - nffts_per_psd + 1
+    if npsds < 1:
+        if out is None:
+            out = np.zeros((0, spectrum.shape[0]), dtype=spectrum.dtype)
+        return out
+    power = np.array(spectrum[:, :npsds].T)
+    for k in range(1, nffts_per_psd):
+        power += spectrum[:, k:k+npsds].T
+    power /= nffts_per_psd
+    if out is None:
+        return power
+    out += power
+    return out
+
+
+class StreamingSpectrogram(object):
+    """
+    Spectrogram of consecutive blocks of a long recording.
+
+    The data points following the last complete frame of a block are kept and
+    prepended to the next block. Each frame is therefore computed exactly once,
+    independently of the block boundaries, and the times of the frames are
+    exact times relative to the start of the recording.
+    The result is the same as the one of spectrogram() on the whole recording.
+    Blocks of multichannel data result in the spectrogram summed over
+    the channels, see multichannel_spectrogram().
+
+    Usage:
+
+        stream = StreamingSpectrogram(samplerate, fresolution=0.5, overlap_frac=0.9)
+        for spectrum, time in stream.blocks(data, int(60.0*samplerate)):
+            # spectrum has the frequencies stream.freqs as first and time as second dimension
+            ...
+
+    Member variables:
+      engine (SpectrogramEngine): the engine used for computing the spectra.
+      freqs (1-D array): the frequencies of the spectrogram.
+      offset (int): the index of the start of the next frame.
+      channel_spectrum (3-D array or None): if channel_power is True, the spectrograms
+        of each channel of the last multichannel block (channels, frequencies, time).
+    """
+
+    def __init__(self, samplerate, fresolution=0.5, overlap_frac=0.5,
+                 detrend=mlab.detrend_none, window=mlab.window_hanning,
+                 scale_by_freq=None, min_nfft=16, workers=1, max_freq=None,
+                 threads=1, channel_power=False, dtype=np.float64):
+        """
+        Parameters
+        ----------
+        samplerate: float
+            Sampling rate of the data in Hertz.
+        fresolution: float
+            Frequency resolution of the spectrogram in Hertz.
+        overlap_frac: float
+            Overlap of the nffts (0 = no overlap; 1 = total overlap).
+        workers: int
+            Number of workers used for computing the FFTs.
+        max_freq: float or None
+            If not None, only frequencies up to max_freq are returned.
+        threads: int or None
+            Number of threads processing groups of channels of multichannel data in parallel.
+            If None use as many threads as there are CPUs.
+        channel_power: boolean
+            If True, keep the spectrograms of each channel of multichannel data in channel_spectrum.
+        dtype: numpy dtype
+            Floating point type of the spectra, np.float32 halves the needed memory.
+        See spectrogram() for the remaining parameter.
+        """
+        nfft, noverlap = nfft_noverlap(fresolution, samplerate, overlap_frac, min_nfft=min_nfft)
+        self.engine = spectrogram_engine(samplerate, nfft, noverlap, window, detrend, scale_by_freq,
+                                         max_freq, dtype)
+        self.freqs = self.engine.freqs
+        self.workers = workers
+        self.threads = threads
+        self.channel_power = channel_power
+        self.channel_spectrum = None
+        self.reset()
+
+    def reset(self, offset=0):
+        """
+        Discard the kept data and start a new stream.
+
+        Parameters
+        ----------
+        offset: int
+            Index of the first data point of the next block.
+        """
+        self.tail = np.zeros(0)
+        self.offset = offset
+
+    def process(self, block):
+        """
+        Spectrogram of all frames completed by the next block of data.
+
+        Parameters
+        ----------
+        block: 1-D or 2-D array
+            The data following the previous block, time as first and channels as optional second dimension.
+
+        Returns
+        -------
+        spectrum: 2-D array
+            Power spectrum densities (summed over channels) with frequencies as first and time as second dimension.
+        time: 1-D array
+            Times of the centers of the frames in seconds.
+        """
+        nfft = self.engine.nfft
+        step = self.engine.step
+        data = np.asarray(block)
+        if len(self.tail) > 0:
+            data = np.concatenate((self.tail, data))
+        n = 0
+        if len(data) >= nfft:
+            n = self.engine.nframes(len(data))
+            if data.ndim > 1:
+                spectrum, _, _, self.channel_spectrum = \
+                    self.engine.multichannel_spectrogram(data[:(n-1)*step+nfft], self.workers,
+                                                         self.threads, self.channel_power)
+            else:
+                spectrum, _, _ = self.engine.spectrogram(data[:(n-1)*step+nfft], self.workers)
+        else:
+            spectrum = np.zeros((len(self.freqs), 0), dtype=self.engine.dtype)
+            if data.ndim > 1 and self.channel_power:
+                self.channel_spectrum = np.zeros((data.shape[1], len(self.freqs), 0), dtype=self.engine.dtype)
+        time = (self.offset + 0.5*nfft + step*np.arange(n))/self.engine.samplerate
+        self.tail = np.array(data[n*step:])
+        self.offset += n*step
+        return spectrum, time
+
+    def blocks(self, data, block_size, start=0, stop=-1, channel=None):
+        """
+        Generator for the spectrogram of consecutive data blocks.
+
+        Parameters
+        ----------
+        data: array or DataLoader
+            The data.
+        block_size: int
+            Number of data points read at once.
+        start: int
+            Index of the first data point to be analysed.
+        stop: int
+            Index after the last data point to be analysed. If negative analyse up to the end of the data.
+        channel: int or None
+            If not None the channel (second index) of the data to be analysed.
+            If None all channels of multichannel data are analysed.
+
+        Yields
+        ------
+        spectrum: 2-D array
+            Power spectrum densities (summed over channels) with frequencies as first and time as second dimension.
+        time: 1-D array
+            Times of the centers of the frames in seconds.
+        """
+        if stop < 0 or stop > len(data):
+            stop = len(data)
+        self.reset(start)
+        for inx0 in range(start, stop, block_size):
+            inx1 = min(inx0 + block_size, stop)
+            if channel is None:
+                block = data[inx0:inx1]
+            else:
+                block = data[inx0:inx1, channel]
+            yield self.process(block)
+
+
+def add_precision_config(cfg, single_precision=False):
+    """ Add parameter for the floating point precision of data and spectra
+    as a new section to a configuration.
+
+    Args:
+      cfg (ConfigFile): the configuration
+      single_precision (boolean): if True use 32 bit floats instead of 64 bit floats.
+    """
+    cfg.add_section('Precision:')
+    cfg.add('singlePrecision', single_precision, '',
+            'Load data and compute power spectra with 32 bit floats. This halves the needed memory.')
+
+
+def precision_args(cfg):
+    """ Translates a configuration to the
+    floating point type (dtype argument) of the data loading and power spectrum functions.
+    The return value can then be passed as key-word arguments to these functions.
+
+    Args:
+      cfg (ConfigFile): the configuration
+
+    Returns:
+      a (dict): dictionary with the dtype argument as supplied by cfg.
+    """
+    if cfg.value('singlePrecision'):
+        return {'dtype': np.float32}
+    return {'dtype': np.float64}
+
+
 if __name__ == '__main__':
     try:
         import matplotlib.pyplot as plt
@@ -0,0 +1,215 @@
+"""Persistent on-disk cache of stacks of power spectra.
+
+Computing the spectrograms of long recordings is expensive. Stacks of
+power spectra (time as first, frequency as second dimension) are
+therefore stored in memory-mapped files that are reused as long as the
+data file and the spectral parameters do not change.
+
+data_file_id(): identity of a data file based on its path, size and modification time.
+PSDCache: directory of cached power spectra with eviction by size.
+"""
+
+import os
+import hashlib
+import numpy as np
+
+
+def data_file_id(filepath):
+    """Identity of a data file or of a directory containing data files.
+
+    Args:
+      filepath (string or list of strings): path to a data file or a directory.
+
+    Returns:
+      file_id (string): absolute path, size and modification time of the file
+                        or of all files in the directory.
+    """
+    if type(filepath) is list:
+        return ';'.join(data_file_id(path) for path in filepath)
+    path = os.path.abspath(filepath)
+    if os.path.isdir(path):
+        paths = [os.path.join(path, name) for name in sorted(os.listdir(path))]
+    else:
+        paths = [path]
+    ids = []
+    for p in paths:
+        if os.path.isfile(p):
+            st = os.stat(p)
+            ids.append('%s:%d:%d' % (p, st.st_size, int(st.st_mtime)))
+    return ';'.join(ids)
+
+
+class PSDCache(object):
+    """
+    Directory of cached stacks of power spectra.
+
+    Each entry consists of a raw file with the power spectra, that is
+    mapped into memory on loading, and of a .npz file with the
+    frequencies, the times, and the data type of the power spectra.
+    The .npz file is written last, i.e. only complete entries are loaded.
+
+    If the total size of the cache exceeds max_size, the least recently used
+    entries are removed.
+
+    Usage:
+    ```
+    cache = PSDCache('psdcache', 2**30)
+    key = cache.key(data_file_id(filepath), nfft, noverlap, nffts_per_psd)
+    entry = cache.load(key)
+    if entry is None:
+        for power, times in compute_psds():
+            cache.append(key, power, times)
+        cache.finish(key, freqs)
+    else:
+        power, freqs, times = entry
+    ```
+
+    Member variables:
+      cache_dir (string): the directory containing the cache files.
+      max_size (int): maximum number of bytes of all cache files.
+    """
+
+    def __init__(self, cache_dir, max_size=2**32):
+        """
+        Args:
+          cache_dir (string): the directory containing the cache files.
+                              It is created on demand.
+          max_size (int): maximum number of bytes of all cache files.
+        """
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self._pending = {}
+
+    def key(self, *args):
+        """Cache key for the data file identity and the spectral parameters.
+
+        Args:
+          args: the data file identity and all parameters the power spectra depend on.
+
+        Returns:
+          key (string): hexadecimal hash of the arguments.
+        """
+        return hashlib.sha1(repr(args).encode('utf-8')).hexdigest()
+
+    def _files(self, key):
+        base = os.path.join(self.cache_dir, key)
+        return base + '.psds', base + '.npz'
+
+    def load(self, key):
+        """Load a cache entry.
+
+        Args:
+          key (string): the cache key.
+
+        Returns:
+          entry (tuple or None): None if no complete entry for key exists,
+            otherwise the memory-mapped power spectra (2-D array, time as first dimension),
+            their frequencies and times (1-D arrays).
+        """
+        psds_file, meta_file = self._files(key)
+        if not os.path.isfile(psds_file) or not os.path.isfile(meta_file):
+            return None
+        with np.load(meta_file) as meta:
+            freqs = meta['freqs']
+            times = meta['times']
+            dtype = np.dtype(str(meta['dtype']))
+        if len(times) == 0:
+            power = np.zeros((0, len(freqs)), dtype=dtype)
+        else:
+            power = np.memmap(psds_file, dtype=dtype, mode='r', shape=(len(times), len(freqs)))
+        # mark as recently used:
+        os.utime(meta_file, None)
+        return power, freqs, times
+
+    def append(self, key, power, times):
+        """Append power spectra to a new cache entry.
+
+        Args:
+          key (string): the cache key.
+          power (2-D array): power spectra with time as first and frequency as second dimension.
+          times (1-D array): the times of the power spectra.
+        """
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        psds_file, _ = self._files(key)
+        mode = 'ab' if key in self._pending else 'wb'
+        with open(psds_file + '.tmp', mode) as f:
+            f.write(np.ascontiguousarray(power).tobytes())
+        if key not in self._pending:
+            self._pending[key] = [[], power.dtype]
+        self._pending[key][0].append(np.asarray(times))
+
+    def finish(self, key, freqs):
+        """Complete a new cache entry and evict old entries if the cache is too large.
+
+        Args:
+          key (string): the cache key.
+          freqs (1-D array): the frequencies of the power spectra.
+        """
+        if key not in self._pending:
+            return
+        times, dtype = self._pending.pop(key)
+        psds_file, meta_file = self._files(key)
+        if os.path.exists(psds_file):
+            os.remove(psds_file)
+        os.rename(psds_file + '.tmp', psds_file)
+        times = np.concatenate(times) if len(times) > 0 else np.zeros(0)
+        np.savez(meta_file, freqs=freqs, times=times, dtype=np.dtype(dtype).str)
+        self.evict(keep=key)
+
+    def discard(self, key):
+        """Remove an incomplete cache entry.
+
+        Args:
+          key (string): the cache key.
+        """
+        self._pending.pop(key, None)
+        psds_file, _ = self._files(key)
+        if os.path.exists(psds_file + '.tmp'):
+            os.remove(psds_file + '.tmp')
+
+    def evict(self, keep=None):
+        """Remove least recently used entries until the cache is not larger than max_size.
+
+        Incomplete entries left by interrupted runs count towards the size of the cache
+        and are removed if they are older than the most recently used complete entry.
+
+        Args:
+          keep (string or None): the key of an entry that is not removed.
+        """
+        if not os.path.isdir(self.cache_dir):
+            return
+        entries = []
+        tmp_files = []
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.psds.tmp'):
+                tmp_file = os.path.join(self.cache_dir, name)
+                size = os.path.getsize(tmp_file)
+                total += size
+                tmp_files.append((os.path.getmtime(tmp_file), name[:-9], size))
+                continue
+            if not name.endswith('.npz'):
+                continue
+            key = name[:-4]
+            psds_file, meta_file = self._files(key)
+            size = os.path.getsize(meta_file)
+            if os.path.isfile(psds_file):
+                size += os.path.getsize(psds_file)
+            total += size
+            entries.append((os.path.getmtime(meta_file), key, size))
+        # remove incomplete entries of interrupted runs that are older than the newest entry:
+        newest = max(entries)[0] if len(entries) > 0 else None
+        for mtime, key, size in tmp_files:
+            if newest is not None and mtime < newest and key not in self._pending and key != keep:
+                os.remove(self._files(key)[0] + '.tmp')
+                total -= size
+        for _, key, size in sorted(entries):
+            if total <= self.max_size:
+                break
+            if key == keep:
+                continue
+            for path in self._files(key):
+                if os.path.exists(path):
+                    os.remove(path)
+            total -= size
@@ -17,10 +17,11 @@ from .version import __version__
 from .configfile import ConfigFile
 from .harmonicgroups import add_psd_peak_detection_config, add_harmonic_groups_config
 from .bestwindow import add_clip_config, add_best_window_config, clip_args, best_window_args
-from .dataloader import load_data
-from .bestwindow import clip_amplitudes, best_window_indices
+from .dataloader import load_data, open_data
+from .decimation import add_decimation_config, decimation_args, decimate, decimation_factor, Decimator
+from .bestwindow import clip_amplitudes, best_window_indices, ClipDetector, BestWindowDetector
 from .checkpulse import check_pulse_width, check_pulse_psd
-from .powerspectrum import plot_decibel_psd, multi_resolution_psd
+from .powerspectrum import plot_decibel_psd, multi_resolution_psd, add_precision_config, precision_args
 from .harmonicgroups import harmonic_groups, harmonic_groups_args, psd_peak_detection_args, fundamental_freqs_and_db, colors_markers, plot_harmonic_groups
 from .consistentfishes import consistent_fishes
 from .eodanalysis import eod_waveform_plot, eod_waveform
@@ -72,7 +73,7 @@ def output_plot(base_name, pulse_fish_width, pulse_fish_psd, EOD_count, median_I
         Standard deviation for the mean EOD plot.
     unit: string
         Unit of the trace and the mean EOD.
-    psd_data: array
+    psd_data: list of PSD
         Power spectrum of the analysed data for different frequency resolutions.
     output_folder: string
         Path indicating where output-files will be saved.
@@ -211,12 +212,92 @@ def output_plot(base_name, pulse_fish_width, pulse_fish_psd, EOD_count, median_I
         plt.close()
 
 
+def load_best_window(filename, channel, buffer_size, min_clip, max_clip, cfg, verbose=0):
+    """Read a recording block by block and load only its best window.
+
+    The same as loading the whole recording with load_data(), decimating it,
+    and selecting the best window with clip_amplitudes() and best_window_indices(),
+    but only buffer_size seconds of data and the best window are held in memory.
+    The data are read twice if the clip amplitudes need to be estimated.
+
+    Parameters
+    ----------
+    filename: string
+        Name of the file with the recording.
+    channel: int
+        The channel to be analysed.
+    buffer_size: float
+        Size of the data blocks in seconds.
+    min_clip: float
+        Minimum amplitude that is not clipped. If zero estimate from data.
+    max_clip: float
+        Maximum amplitude that is not clipped. If zero estimate from data.
+    cfg: ConfigFile
+        The configuration with the parameter for decimation, clipping and the best window.
+    verbose: int
+        If > 0 show detailed error/warning messages.
+
+    Returns
+    -------
+    data: 1-D array
+        The decimated data of the best window.
+    samplerate: float
+        The sampling rate of the decimated data in Hertz.
+    unit: string
+        The unit of the data.
+
+    Raises
+    ------
+    UserWarning:
+        No best window found.
+    """
+    dtype = precision_args(cfg)['dtype']
+    dargs = decimation_args(cfg)
+    with open_data(filename, channel, buffer_size, 0.0, verbose, dtype) as raw_data:
+        rate = raw_data.samplerate
+        unit = raw_data.unit
+        if len(raw_data) == 0:
+            return np.zeros(0, dtype=dtype), rate, unit
+        block_size = max(1, int(buffer_size * rate))
+        factor = decimation_factor(rate, dargs['analysis_rate'])
+        decimator = Decimator(rate, factor, dargs['taps_per_phase'], dtype) if factor > 1 else None
+        samplerate = rate / factor
+
+        def data_blocks(start=0, stop=len(raw_data)):
+            """Decimated blocks of the raw data between start and stop."""
+            if decimator is not None:
+                return decimator.blocks(raw_data, block_size, start, stop)
+            return (raw_data[k:min(k + block_size, stop)] for k in range(start, stop, block_size))
+
+        # clipping amplitudes:
+        if min_clip == 0.0 or max_clip == 0.0:
+            clip_detector = ClipDetector(**clip_args(cfg, samplerate))
+            for block in data_blocks():
+                min_clip, max_clip = clip_detector.process(block)
+        # best window:
+        detector = BestWindowDetector(samplerate, min_clip=min_clip, max_clip=max_clip,
+                                      **best_window_args(cfg))
+        for block in data_blocks():
+            detector.process(block)
+        idx0, idx1, clipped = detector.best_window()
+        # load the best window, the decimation filter needs decimator.delay samples before it:
+        if decimator is not None:
+            start = max(0, idx0 - decimator.delay)
+            stop = min(len(raw_data), (idx1 + decimator.delay) * factor + 1)
+            data = np.concatenate(list(data_blocks(start * factor, stop)))[idx0 - start:idx1 - start]
+        else:
+            data = raw_data[idx0:idx1]
+    return data, samplerate, unit
+
+
 def thunderfish(filename, channel=0, save_csvs=False, save_plot=False,
                 output_folder='.', cfgfile='', save_config='', verbose=0):
     # configuration options:
     cfg = ConfigFile()
     cfg.add_section('Power spectrum estimation:')
     cfg.add('frequencyResolution', 0.5, 'Hz', 'Frequency resolution of the power spectrum.')
+    add_decimation_config(cfg)
+    add_precision_config(cfg)
     add_psd_peak_detection_config(cfg)
     add_harmonic_groups_config(cfg)
     add_clip_config(cfg)
@@ -250,24 +331,43 @@ def thunderfish(filename, channel=0, save_csvs=False, save_plot=False,
         print('invalid channel %d' % channel)
         channel = 0
 
-    # load data:
-    raw_data, samplerate, unit = load_data(filename, channel)
-    if len(raw_data) == 0:
-        return
-
-    # calculate best_window:
+    # best window:
     min_clip = cfg.value('minClipAmplitude')
     max_clip = cfg.value('maxClipAmplitude')
-    if min_clip == 0.0 or max_clip == 0.0:
-        min_clip, max_clip = clip_amplitudes(raw_data, **clip_args(cfg, samplerate))
-    try:
-        idx0, idx1, clipped = best_window_indices(raw_data, samplerate,
-                                                  min_clip=min_clip, max_clip=max_clip,
-                                                  **best_window_args(cfg))
-    except UserWarning as e:
-        print(str(e))
-        return
-    data = raw_data[idx0:idx1]
+    buffer_size = cfg.value('bestWindowBufferSize')
+    if buffer_size > 0.0:
+        # read the data block by block and load only the best window:
+        try:
+            data, samplerate, unit = load_best_window(filename, channel, buffer_size,
+                                                      min_clip, max_clip, cfg, verbose)
+        except UserWarning as e:
+            print(str(e))
+            return
+        if len(data) == 0:
+            return
+        raw_data = data
+        idx0 = 0
+        idx1 = len(data)
+    else:
+        # load data:
+        raw_data, samplerate, unit = load_data(filename, channel, **precision_args(cfg))
+        if len(raw_data) == 0:
+            return
+
+        # decimate data, all further analysis uses the effective sampling rate:
+        raw_data, samplerate = decimate(raw_data, samplerate, dtype=raw_data.dtype, **decimation_args(cfg))
+
+        # calculate best_window:
+        if min_clip == 0.0 or max_clip == 0.0:
+            min_clip, max_clip = clip_amplitudes(raw_data, **clip_args(cfg, samplerate))
+        try:
+            idx0, idx1, clipped = best_window_indices(raw_data, samplerate,
+                                                      min_clip=min_clip, max_clip=max_clip,
+                                                      **best_window_args(cfg))
+        except UserWarning as e:
+            print(str(e))
+            return
+        data = raw_data[idx0:idx1]
 
     # pulse-type fish?
     # TODO: add configuration parameter for check_pulse()!
@@ -275,7 +375,8 @@ def thunderfish(filename, channel=0, save_csvs=False, save_plot=False,
 
     # calculate powerspectra with different frequency resolutions:
     minfres = cfg.value('frequencyResolution')
-    psd_data = multi_resolution_psd(data, samplerate, fresolution=[minfres, 2*minfres, 4*minfres])
+    psd_data = multi_resolution_psd(data, samplerate, fresolution=[minfres, 2*minfres, 4*minfres],
+                                    **precision_args(cfg))
 
     # find the fishes in the different powerspectra:
     fishlists = []
@@ -10,10 +10,13 @@ import numpy as np
 from .version import __version__
 from .configfile import ConfigFile
 from .dataloader import open_data
-from .powerspectrum import spectrogram, next_power_of_two
+from .powerspectrum import StreamingSpectrogram, running_psds, add_precision_config, precision_args
+from .decimation import decimation_factor, Decimator, add_decimation_config, decimation_args
+from .psdcache import PSDCache, data_file_id
 from .harmonicgroups import add_psd_peak_detection_config, add_harmonic_groups_config
 from .harmonicgroups import harmonic_groups_args, psd_peak_detection_args
 from .harmonicgroups import harmonic_groups, fundamental_freqs, plot_psd_harmonic_groups
+from .harmonicgroups import harmonic_groups_batch, ThresholdEstimator
 try:
     import matplotlib.pyplot as plt
 except ImportError:
@@ -21,9 +24,60 @@ except ImportError:
 # TODO: update to numpy doc style!
 
 
+def decimated_spectrogram_blocks(stream, decimator, data, block_size, start, stop, channel=None):
+    """
+    Generator for the spectrogram of consecutive data blocks that are decimated before.
+
+    :param stream: (StreamingSpectrogram) computes the spectrogram at the sampling rate of the decimated data.
+    :param decimator: (Decimator) decimates the data.
+    :param data: (array or DataLoader) the data.
+    :param block_size: (int) number of data points read at once.
+    :param start: (int) index of the first data point to be analysed.
+    :param stop: (int) index after the last data point to be analysed.
+    :param channel: (int or None) if not None the channel (second index) of the data to be analysed.
+    :return spectrum: (2d array) power spectrum densities with frequencies as first and time as second dimension.
+    :return time: (array) times of the centers of the frames in seconds.
+    """
+    stream.reset(start/float(decimator.factor))
+    for block in decimator.blocks(data, block_size, start, stop, channel):
+        yield stream.process(block)
+
+
+def running_psd_blocks(blocks, nffts_per_psd, nfreqs, dtype=np.float64, verbose=0):
+    """
+    Generator for the power spectra averaged over nffts_per_psd consecutive spectra of a spectrogram
+    that is computed in blocks.
+
+    :param blocks: (iterable) spectrogram (frequencies, time) and times of consecutive data snippets,
+                   e.g. from StreamingSpectrogram.blocks().
+    :param nffts_per_psd: (int) number of nffts used for calculating one psd.
+    :param nfreqs: (int) number of frequencies of the spectrogram.
+    :param dtype: (numpy dtype) floating point type of the spectrogram.
+    :param verbose: (int) with increasing value provides more output on console.
+    :return power: (2d array) power spectra (time, frequencies) of a data snippet.
+    :return psd_times: (array) times of the center of the first fft of each power spectrum.
+    """
+    spectrum_tail = np.zeros((0, nfreqs), dtype=dtype)
+    time_tail = np.array([])
+    for spectrum, time in blocks:
+        # spectra still missing for the psds of the previous snippet:
+        spectrum = np.concatenate((spectrum_tail, spectrum.T))
+        time = np.concatenate((time_tail, time))
+        if len(time) > 0 and verbose >= 3:
+            print('Minute %.2f' % (time[0]/60))
+
+        # psds:
+        power = running_psds(spectrum.T, nffts_per_psd)
+        spectrum_tail = spectrum[len(power):]
+        time_tail = time[len(power):]
+        yield power, time[:len(power)]
+
+
 def extract_fundamentals(data, samplerate, start_time=0.0, end_time=-1.0,
                          data_snippet_secs=60.0,
-                         nffts_per_psd=4, fresolution=0.5, overlap_frac=.9,
+                         nffts_per_psd=4, fresolution=0.5, overlap_frac=.9, max_spec_freq=0.0,
+                         analysis_rate=0.0, taps_per_phase=32, threads=None, dtype=np.float64,
+                         psd_cache=None, data_id=None, warm_start=False, threshold_decay=0.0,
                          plot_harmonic_groups=False, verbose=0, **kwargs):
     """
     For a long data array calculates spectograms of small data snippets, computes PSDs, extracts harmonic groups and
@@ -31,81 +85,115 @@ def extract_fundamentals(data, samplerate, start_time=0.0, end_time=-1.0,
 
     :param data: (array) raw data.
     :param samplerate: (int) samplerate of data.
-    :param start_time: (int) analyze data from this time on (in seconds).  XXX this should be a float!!!! Internally I would use indices.
-    :param end_time: (int) stop analysis at this time (in seconds). If -1 then analyse to the end of the data. XXX TODO this should be a float!!!! Internally I would use indices.
+    :param start_time: (float) analyze data from this time on (in seconds).
+    :param end_time: (float) stop analysis at this time (in seconds). If -1 then analyse to the end of the data.
     :param data_snippet_secs: (float) duration of data snipped processed at once in seconds. Necessary because of memory issues.
+                              The spectrogram is continued seamlessly across snippets.
     :param nffts_per_psd: (int) number of nffts used for calculating one psd.
     :param fresolution: (float) frequency resolution for the spectrogram.
     :param overlap_frac: (float) overlap of the nffts (0 = no overlap; 1 = total overlap).
+    :param max_spec_freq: (float) only frequencies up to this frequency are kept in the spectrogram.
+                          If not larger than zero, the full spectrum up to the Nyquist frequency is kept.
+                          Note that harmonic_groups() estimates its threshold from the upper part of the
+                          power spectrum, which then lies below max_spec_freq.
+    :param analysis_rate: (float) decimate the data to at least this sampling rate before computing the spectrograms.
+                          If not larger than zero the data are not decimated.
+    :param taps_per_phase: (int) number of filter coefficients per polyphase component of the decimation filter.
+    :param threads: (int or None) number of threads computing the spectrograms of groups of channels
+                    of multichannel data in parallel (None: as many as there are CPUs).
+    :param dtype: (numpy dtype) floating point type of the spectrograms and power spectra,
+                  np.float32 halves the needed memory.
+    :param psd_cache: (PSDCache or None) cache for the power spectra. If the power spectra of data_id
+                      have been computed with the same parameters before, they are read from the cache.
+                      Otherwise they are stored in the cache.
+    :param data_id: (string or None) identity of the data used for the cache key, e.g. from data_file_id().
+    :param warm_start: (boolean) use the fundamental frequencies detected in each power spectrum as a prior
+                       for the harmonic groups of the next one.
+    :param threshold_decay: (float) if larger than zero, the thresholds for peak detection are estimated
+                            from a running histogram of all power spectra that decays by this factor
+                            with each power spectrum (see ThresholdEstimator).
     :param verbose: (int) with increasing value provides more output on console.
-    :param kwargs: further arguments are passed on to harmonic_groups().
+    :param kwargs: further arguments are passed on to harmonic_groups_batch().
     :return all_fundamentals: (list) containing arrays with the fundamentals frequencies of fishes detected at a certain time.
-    :return all_times: (array) containing time stamps of frequency detection. (  len(all_times) == len(fishes[xy])  )
+    :return all_times: (array) containing time stamps of frequency detection, i.e. the time of the center
+                       of the first fft of each psd relative to the start of the data. (  len(all_times) == len(fishes[xy])  )
     """
     all_fundamentals = []
     all_times = np.array([])
+    estimator = None
+    if threshold_decay > 0.0:
+        estimator = ThresholdEstimator(kwargs.get('noise_fac', 6.0), kwargs.get('thresh_bins', 100),
+                                       peak_factor=kwargs.get('peak_fac', 0.5), decay=threshold_decay)
 
     if end_time < 0.0:
         end_time = len(data)/samplerate
-
-    nfft = next_power_of_two(samplerate / fresolution)
-    if len(data.shape) > 1:
-        channels = range(data.shape[1])
+    start_inx = int(start_time*samplerate)
+    end_inx = min(int(end_time*samplerate), len(data))
+    block_size = int(data_snippet_secs*samplerate)
+
+    # spectrograms of consecutive data snippets summed over all channels:
+    max_freq = max_spec_freq if max_spec_freq > 0.0 else None
+    factor = decimation_factor(samplerate, analysis_rate)
+    stream = StreamingSpectrogram(samplerate/float(factor), fresolution=fresolution,
+                                  overlap_frac=overlap_frac, max_freq=max_freq, threads=threads,
+                                  dtype=dtype)
+    freqs = stream.freqs
+    if factor > 1:
+        if verbose >= 2:
+            print('> decimate data by a factor of %d to %.0f Hz' % (factor, samplerate/float(factor)))
+        decimator = Decimator(samplerate, factor, taps_per_phase, dtype)
+        blocks = decimated_spectrogram_blocks(stream, decimator, data, block_size, start_inx, end_inx)
     else:
-        channels = range(1)
-
-    while start_time < int((len(data)- data_snippet_secs*samplerate) / samplerate) or int(start_time) == 0:
-        if verbose >= 3:
-            print('Minute %.2f' % (start_time/60))
-
-        for channel in channels:
-            # print(channel)
-            if len(channels) > 1:
-                tmp_data = data[int(start_time*samplerate) : int((start_time+data_snippet_secs)*samplerate), channel]
-            else:
-                tmp_data = data[int(start_time*samplerate) : int((start_time+data_snippet_secs)*samplerate)]
-
-            # spectrogram
-            spectrum, freqs, time = spectrogram(tmp_data, samplerate, fresolution=fresolution, overlap_frac=overlap_frac)  # nfft window = 2 sec
-
-            # psd and fish fundamentals frequency detection
-            tmp_power = [np.array([]) for i in range(len(time)-(nffts_per_psd-1))]
-            for t in range(len(time)-(nffts_per_psd-1)):
-                # power = np.mean(spectrum[:, t:t+nffts_per_psd], axis=1)
-                tmp_power[t] = np.mean(spectrum[:, t:t+nffts_per_psd], axis=1)
-            if channel == 0:
-                power = tmp_power
-            else:
-                for t in range(len(power)):
-                    power[t] += tmp_power[t]
-
-        all_times = np.concatenate((all_times, time[:-(nffts_per_psd-1)] + start_time))
-
-        for p in range(len(power)):
-            fishlist, _, mains, all_freqs, good_freqs, _, _, _ = harmonic_groups(freqs, power[p], **kwargs)
-            fundamentals = fundamental_freqs(fishlist)
-            all_fundamentals.append(fundamentals)
-            if plot_harmonic_groups:
+        blocks = stream.blocks(data, block_size, start_inx, end_inx)
+
+    # power spectra of consecutive data snippets, possibly from the cache:
+    cache_key = None
+    cached = None
+    if psd_cache is not None and data_id is not None:
+        cache_key = psd_cache.key(data_id, samplerate, start_inx, end_inx, stream.engine.nfft,
+                                  stream.engine.noverlap, nffts_per_psd, tuple(data.shape[1:]),
+                                  max_freq, factor, taps_per_phase if factor > 1 else 0,
+                                  np.dtype(dtype).str)
+        cached = psd_cache.load(cache_key)
+    if cached is not None:
+        if verbose >= 1:
+            print('> load power spectra from cache %s' % psd_cache.cache_dir)
+        power, freqs, psd_times = cached
+        psd_blocks = [(power, psd_times)]
+    else:
+        psd_blocks = running_psd_blocks(blocks, nffts_per_psd, len(freqs), dtype, verbose)
+        if cache_key is not None:
+            psd_cache.discard(cache_key)
+
+    for power, psd_times in psd_blocks:
+        if cached is None and cache_key is not None:
+            psd_cache.append(cache_key, power, psd_times)
+        all_times = np.concatenate((all_times, psd_times))
+
+        # fish fundamentals frequency detection:
+        if plot_harmonic_groups:
+            for p in range(len(power)):
+                fishlist, _, mains, all_freqs, good_freqs, _, _, _ = \
+                    harmonic_groups(freqs, power[p], estimator=estimator, **kwargs)
+                all_fundamentals.append(fundamental_freqs(fishlist))
                 fig = plt.figure()
                 ax = fig.add_subplot(1, 1, 1)
                 plot_psd_harmonic_groups(ax, freqs, power[p], fishlist, mains,
                                          all_freqs, good_freqs, max_freq=3000.0)
-                ax.set_title('time = %gmin' % ((start_time+0.0)/60.0))  # XXX TODO plus what???
+                ax.set_title('time = %gmin' % (psd_times[p]/60.0))
                 plt.show()
+        else:
+            prior_freqs = all_fundamentals[-1] if len(all_fundamentals) > 0 else None
+            groups = harmonic_groups_batch(freqs, power, warm_start=warm_start,
+                                           prior_freqs=prior_freqs, estimator=estimator, **kwargs)
+            for p in range(len(power)):
+                all_fundamentals.append(groups.fundamentals[groups.group_offsets[p]:groups.group_offsets[p+1]])
 
-        if (len(all_times) % ((len(time) - (nffts_per_psd-1)) * 30)) > -1 and (
-                    len(all_times) % ((len(time) - (nffts_per_psd-1)) * 30)) < 1:
-            if verbose >= 3:
-                print('Minute %.0f' % (start_time/60))
-
-        start_time += time[-nffts_per_psd] - (0.5 -(1-overlap_frac)) * nfft / samplerate
-
+    if cached is None and cache_key is not None:
+        psd_cache.finish(cache_key, freqs)
 
-        if end_time > 0:
-            if start_time >= end_time:
-                if verbose >= 3:
-                    print('End time reached!')
-                break
+    if verbose >= 3:
+        print('End time reached!')
 
     return all_fundamentals, all_times
 
@@ -610,6 +698,7 @@ def plot_fishes(fishes, all_times, all_rises, base_name, save_plot, output_folde
 
 
 def add_tracker_config(cfg, data_snipped_secs = 60., nffts_per_psd = 4, fresolution = 0.5, overlap_frac = .9,
+                       max_spec_freq = 0.0, psd_cache_size = 0.0, warm_start = False, threshold_decay = 0.0,
                        freq_tolerance = 0.5, rise_f_th = 0.5, prim_time_tolerance = 5., max_time_tolerance = 10., f_th=5.):
     """ Add parameter needed for fish_tracker() as
     a new section to a configuration.
@@ -626,6 +715,14 @@ def add_tracker_config(cfg, data_snipped_secs = 60., nffts_per_psd = 4, fresolut
         frequency resoltution of the spectrogram.
     overlap_frac: float
         overlap fraction of nffts for powerspectrum analysis.
+    max_spec_freq: float
+        only frequencies up to this frequency are kept in the spectrogram (0: up to the Nyquist frequency).
+    psd_cache_size: float
+        maximum size of the cache of power spectra in gigabytes (0: no cache).
+    warm_start: bool
+        use the fundamental frequencies of the previous power spectrum as a prior for harmonic group detection.
+    threshold_decay: float
+        decay factor of the running histogram for estimating peak detection thresholds (0: estimate for each power spectrum).
     freq_tolerance: float
         frequency tollerance for combining fishes.
     rise_f_th: float
@@ -642,6 +739,10 @@ def add_tracker_config(cfg, data_snipped_secs = 60., nffts_per_psd = 4, fresolut
     cfg.add('NfftPerPsd', nffts_per_psd, '', 'Number of nffts used for powerspectrum analysis.')
     cfg.add('FreqResolution', fresolution, 'Hz', 'Frequency resolution of the spectrogram')
     cfg.add('OverlapFrac', overlap_frac, '', 'Overlap fraction of the nffts during Powerspectrum analysis')
+    cfg.add('MaxSpectrumFreq', max_spec_freq, 'Hz', 'Only frequencies up to this frequency are kept in the spectrogram. If 0 keep all frequencies up to the Nyquist frequency.')
+    cfg.add('PSDCacheSize', psd_cache_size, 'GB', 'Maximum size of the cache of power spectra in the output folder. If 0 do not cache power spectra.')
+    cfg.add('WarmStart', warm_start, '', 'Search harmonic groups first for the fundamental frequencies of the previous power spectrum.')
+    cfg.add('ThresholdDecay', threshold_decay, '', 'Estimate thresholds for peak detection from a running histogram of the power spectra decaying by this factor. If 0 estimate thresholds for each power spectrum separately.')
     cfg.add('FreqTolerance', freq_tolerance, 'Hz', 'Frequency tolernace in the first fish sorting step.')
     cfg.add('RiseFreqTh', rise_f_th, 'Hz', 'Frequency threshold for the primary rise detection.')
     cfg.add('PrimTimeTolerance', prim_time_tolerance, 'min', 'Time tolerance in the first fish sorting step.')
@@ -668,6 +769,10 @@ def tracker_args(cfg):
                     'nffts_per_psd': 'NfftPerPsd',
                     'fresolution': 'FreqResolution',
                     'overlap_frac': 'OverlapFrac',
+                    'max_spec_freq': 'MaxSpectrumFreq',
+                    'psd_cache_size': 'PSDCacheSize',
+                    'warm_start': 'WarmStart',
+                    'threshold_decay': 'ThresholdDecay',
                     'freq_tolerance': 'FreqTolerance',
                     'rise_f_th': 'RiseFreqTh',
                     'prim_time_tolerance': 'PrimTimeTolerance',
@@ -677,8 +782,11 @@ def tracker_args(cfg):
 
 def fish_tracker(data_file, start_time=0.0, end_time=-1.0, gridfile=False, save_plot=False,
                  save_original_fishes=False, data_snippet_secs = 60., nffts_per_psd = 4, fresolution = 0.5,
-                 overlap_frac =.9, freq_tolerance = 0.5, rise_f_th= .5, max_time_tolerance = 10.,
-                 f_th= 5., output_folder = '.', plot_harmonic_groups=False, verbose=0, **kwargs):
+                 overlap_frac =.9, max_spec_freq = 0.0, psd_cache_size = 0.0, warm_start = False,
+                 threshold_decay = 0.0, analysis_rate = 0.0, taps_per_phase = 32,
+                 freq_tolerance = 0.5, rise_f_th= .5, max_time_tolerance = 10.,
+                 f_th= 5., output_folder = '.', plot_harmonic_groups=False, verbose=0,
+                 dtype=np.float64, **kwargs):
 
     """
     Performs the steps to analyse long-term recordings of wave-type weakly electric fish including frequency analysis,
@@ -692,19 +800,33 @@ def fish_tracker(data_file, start_time=0.0, end_time=-1.0, gridfile=False, save_
     :param data_file: (string) filepath of the analysed data file.
     :param data_snippet_secs: (float) duration of data snipped processed at once in seconds. Necessary because of memory issues.
     :param nffts_per_psd: (int) amount of nffts used to calculate one psd.
+    :param max_spec_freq: (float) only frequencies up to this frequency are kept in the spectrogram
+                          (0: up to the Nyquist frequency).
+    :param analysis_rate: (float) decimate the data to at least this sampling rate before the analysis (0: no decimation).
+    :param taps_per_phase: (int) number of filter coefficients per polyphase component of the decimation filter.
+    :param dtype: (numpy dtype) floating point type of the data and the spectra, np.float32 halves the needed memory.
+    :param psd_cache_size: (float) maximum size in gigabytes of the cache of power spectra in output_folder.
+                           If the data file is analysed again with the same spectral parameters,
+                           the power spectra are read from the cache. 0 disables the cache.
+    :param warm_start: (boolean) use the fundamental frequencies of the previous power spectrum
+                       as a prior for the detection of harmonic groups.
+    :param threshold_decay: (float) decay factor of the running histogram of the power spectra
+                            used for estimating the thresholds for peak detection.
+                            If zero, the thresholds are estimated for each power spectrum separately.
     :param start_time: (int) analyze data from this time on (in seconds).  XXX this should be a float!!!!
     :param end_time: (int) stop analysis at this time (in seconds).  XXX this should be a float!!!!
     :param plot_data_func: (function) if plot_data_func = plot_fishes creates a plot of the sorted fishes.
     :param save_original_fishes: (boolean) if True saves the sorted fishes after the first level of fish sorting.
     :param kwargs: further arguments are passed on to harmonic_groups().
     """
+    channel = -1 if gridfile else 0
     if gridfile:
-        data = open_data(data_file, -1, 60.0, 10.0)
+        data = open_data(data_file, channel, 60.0, 10.0, dtype=dtype)
         print('\n--- GRID FILE ANALYSIS ---')
         print('ALL traces are analysed')
         print('--------------------------')
     else:
-        data = open_data(data_file, 0, 60.0, 10.0)
+        data = open_data(data_file, channel, 60.0, 10.0, dtype=dtype)
         print('\n--- ONE TRACE ANALYSIS ---')
         print('ONLY 1 trace is analysed')
         print('--------------------------')
@@ -712,6 +834,12 @@ def fish_tracker(data_file, start_time=0.0, end_time=-1.0, gridfile=False, save_
     # with open_data(data_file, 0, 60.0, 10.0) as data:
     samplerate = data.samplerate
     base_name = os.path.splitext(os.path.basename(data_file))[0]
+
+    psd_cache = None
+    data_id = None
+    if psd_cache_size > 0.0:
+        psd_cache = PSDCache(os.path.join(output_folder, 'psdcache'), int(psd_cache_size*2**30))
+        data_id = '%s channel %d' % (data_file_id(data_file), channel)
     
     if verbose >= 1:
         print('\nextract fundamentals...')
@@ -722,6 +850,13 @@ def fish_tracker(data_file, start_time=0.0, end_time=-1.0, gridfile=False, save_
                                                        data_snippet_secs, nffts_per_psd,
                                                        fresolution=fresolution,
                                                        overlap_frac=overlap_frac,
+                                                       max_spec_freq=max_spec_freq,
+                                                       analysis_rate=analysis_rate,
+                                                       taps_per_phase=taps_per_phase,
+                                                       dtype=dtype,
+                                                       psd_cache=psd_cache, data_id=data_id,
+                                                       warm_start=warm_start,
+                                                       threshold_decay=threshold_decay,
                                                        plot_harmonic_groups=plot_harmonic_groups,
                                                        verbose=verbose, **kwargs)
 
@@ -812,6 +947,8 @@ def main():
     add_psd_peak_detection_config(cfg)
     add_harmonic_groups_config(cfg)
     add_tracker_config(cfg)
+    add_decimation_config(cfg)
+    add_precision_config(cfg)
     
     # load configuration from working directory and data directories:
     cfg.load_files(cfgfile, datafile, 3, verbose)
@@ -892,6 +1029,8 @@ def main():
         t_kwargs = psd_peak_detection_args(cfg)
         t_kwargs.update(harmonic_groups_args(cfg))
         t_kwargs.update(tracker_args(cfg))
+        t_kwargs.update(decimation_args(cfg))
+        t_kwargs.update(precision_args(cfg))
         fish_tracker(datafile, args.start_time*60.0, args.end_time*60.0,
                      args.grid, args.save_plot, args.save_fish, output_folder=args.output_folder,
                      plot_harmonic_groups=args.plot_harmonic_groups, verbose=verbose, **t_kwargs)